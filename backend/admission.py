@@ -0,0 +1,212 @@
+import collections
+import math
+import os
+import threading
+import time
+
+#-----------------------------------
+# Admission control for expensive routes
+#-----------------------------------
+
+# Every route belongs to a cost class. A class admits at most `limit`
+# requests at a time in this process. Up to `queue` more wait in FIFO order
+# for at most `wait` seconds. Anything beyond that, or still waiting at the
+# deadline, gets an immediate 503 with Retry-After instead of tying up a
+# worker thread and a database connection. Limits are per worker process, so
+# the host-wide ceiling is the limit times WEB_CONCURRENCY.
+#
+# Every admitted request, and every request waiting in a class queue, holds
+# one of the worker's gthread threads (see serve.py). The default limits and
+# queues are therefore carved out of the request threads: heavy and medium
+# together never hold more than those threads minus a reserve, so light
+# routes always find a free thread. Medium gets most of that share, because
+# pages fetch several charts and tables at once (the OHLCV batch route sends
+# five at a time). Price streams get threads of their own on top of
+# REQUEST_THREADS and never count against these limits.
+
+def class_setting(name, key, default):
+    return float(os.environ.get(f"ADMISSION_{name.upper()}_{key}", default))
+
+# Worker threads per process for ordinary requests (serve.py adds one per
+# allowed price stream on top)
+REQUEST_THREADS = int(os.environ.get("REQUEST_THREADS", "12"))
+# Threads heavy and medium requests can never take
+LIGHT_RESERVE = int(os.environ.get("ADMISSION_LIGHT_RESERVE", "1"))
+
+# Seconds a queued request may wait for a slot
+CLASS_WAITS = {'heavy': 5.0, 'medium': 3.0, 'light': 1.0}
+
+def split_slots(slots, queue_share):
+    # (limit, queue) for a class that may hold `slots` threads in total
+    queue = int(slots * queue_share)
+    return slots - queue, queue
+
+def default_classes(threads=REQUEST_THREADS, reserved=LIGHT_RESERVE):
+    # name: (concurrent limit, queue length, max wait seconds)
+    shared = max(4, threads - reserved)
+    heavy = max(2, shared // 4)
+    return {
+        'heavy': split_slots(heavy, 1 / 2) + (CLASS_WAITS['heavy'],),
+        'medium': split_slots(shared - heavy, 1 / 3) + (CLASS_WAITS['medium'],),
+        'light': (threads, 0, CLASS_WAITS['light']),
+    }
+
+# Requests covering more than this many days count as heavy
+WIDE_RANGE_DAYS = int(os.environ.get("ADMISSION_WIDE_RANGE_DAYS", "45"))
+
+ROUTE_CLASSES = {
+    'cse_predictor': 'heavy',
+    'run_screens': 'heavy',
+    'debug_db': 'heavy',
+    'data_quality': 'heavy',
+    'initialize_database': 'heavy',
+    'fundamental_metrics': 'medium',
+    'get_leaderboard': 'medium',
+    'get_correlation': 'medium',
+    'technical_analysis': 'medium',
+    'ohlcv_route': 'medium',
+}
+
+# Never queued: health checks, metrics and long-lived streams
+EXEMPT_ROUTES = {'ready', 'metrics', 'stream_prices', 'static'}
+
+WAIT_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+
+class AdmissionRejected(Exception):
+    def __init__(self, cost_class, reason, retry_after):
+        super().__init__(f"{cost_class} requests are at capacity ({reason})")
+        self.cost_class = cost_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+class CostClass:
+    def __init__(self, name, limit, queue, wait):
+        self.name = name
+        self.limit = int(limit)
+        self.queue = int(queue)
+        self.wait = wait
+        self.lock = threading.Lock()
+        self.active = 0
+        self.waiters = collections.deque()
+        self.counters = {
+            'admitted': 0, 'queued': 0, 'rejected_full': 0, 'rejected_timeout': 0,
+            'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0,
+        }
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS) + 1)
+        self.service_seconds = 0.0
+        self.completed = 0
+
+    def retry_after(self):
+        # Roughly how long the current backlog needs to drain, in whole seconds
+        average = self.service_seconds / self.completed if self.completed else 1.0
+        backlog = (len(self.waiters) + 1) / max(self.limit, 1)
+        return max(1, int(math.ceil(average * backlog)))
+
+    def record_wait(self, waited):
+        self.counters['wait_seconds_total'] += waited
+        self.counters['wait_seconds_max'] = max(self.counters['wait_seconds_max'], waited)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if waited <= bound:
+                self.wait_histogram[i] += 1
+                break
+        else:
+            self.wait_histogram[-1] += 1
+
+    def acquire(self):
+        # Returns the seconds spent queued; raises AdmissionRejected
+        with self.lock:
+            if self.active < self.limit and not self.waiters:
+                self.active += 1
+                self.counters['admitted'] += 1
+                self.record_wait(0.0)
+                return 0.0
+            if len(self.waiters) >= self.queue:
+                self.counters['rejected_full'] += 1
+                raise AdmissionRejected(self.name, 'queue full' if self.queue else 'no free slot', self.retry_after())
+            ticket = threading.Event()
+            self.waiters.append(ticket)
+            self.counters['queued'] += 1
+        started = time.monotonic()
+        admitted = ticket.wait(self.wait)
+        waited = time.monotonic() - started
+        with self.lock:
+            if not admitted and not ticket.is_set():
+                self.waiters.remove(ticket)
+                self.counters['rejected_timeout'] += 1
+                raise AdmissionRejected(self.name, 'queue timeout', self.retry_after())
+            # The slot was handed over by release(), active already counts it
+            self.counters['admitted'] += 1
+            self.record_wait(waited)
+        return waited
+
+    def release(self, service_seconds=None):
+        with self.lock:
+            if service_seconds is not None:
+                self.service_seconds += service_seconds
+                self.completed += 1
+            if self.waiters:
+                # Hand the slot straight to the oldest waiter
+                self.waiters.popleft().set()
+            else:
+                self.active -= 1
+
+    def snapshot(self):
+        with self.lock:
+            admitted = self.counters['admitted']
+            return {
+                'limit': self.limit,
+                'queue_limit': self.queue,
+                'max_wait_seconds': self.wait,
+                'active': self.active,
+                'queue_depth': len(self.waiters),
+                **self.counters,
+                'wait_seconds_avg': self.counters['wait_seconds_total'] / admitted if admitted else 0.0,
+                'wait_histogram': dict(zip([str(b) for b in WAIT_BUCKETS] + ['+Inf'], self.wait_histogram)),
+                'service_seconds_avg': self.service_seconds / self.completed if self.completed else None,
+            }
+
+class AdmissionController:
+    def __init__(self, classes=None):
+        classes = classes or {
+            name: (
+                class_setting(name, 'LIMIT', limit),
+                class_setting(name, 'QUEUE', queue),
+                class_setting(name, 'WAIT', wait),
+            )
+            for name, (limit, queue, wait) in default_classes().items()
+        }
+        self.classes = {name: CostClass(name, *settings) for name, settings in classes.items()}
+
+    def classify(self, endpoint, args, now=None):
+        if endpoint is None or endpoint in EXEMPT_ROUTES:
+            return None
+        cost = ROUTE_CLASSES.get(endpoint, 'light')
+        if endpoint == 'technical_analysis':
+            cost = self.range_class(args, now)
+        return cost
+
+    def range_class(self, args, now=None):
+        # Deltas and single days are cheap; long ranges read many partitions
+        if args.get('since') is not None:
+            return 'light'
+        date = args.get('date')
+        if not date:
+            return 'medium'
+        if args.get('exact_date', 'false').lower() == 'true':
+            return 'light'
+        try:
+            first = time.mktime(time.strptime(date[:10], '%Y-%m-%d'))
+        except ValueError:
+            return 'medium'
+        days = ((now or time.time()) - first) / 86400
+        return 'heavy' if days > WIDE_RANGE_DAYS else 'medium'
+
+    def admit(self, cost):
+        # Returns the seconds spent queued; raises AdmissionRejected
+        return self.classes[cost].acquire()
+
+    def release(self, cost, service_seconds=None):
+        self.classes[cost].release(service_seconds)
+
+    def stats(self):
+        return {name: cost.snapshot() for name, cost in self.classes.items()}
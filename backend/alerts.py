@@ -0,0 +1,371 @@
+import datetime
+import hmac
+import os
+import threading
+import time
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from init_db import init_connection, ensure_alert_tables
+from panel_store import ingest_watermark
+
+#-----------------------------------
+# Alert evaluation
+#-----------------------------------
+
+# Subscriptions live in alert_subscriptions. For evaluation they are
+# compiled into a ThresholdBook: one sorted threshold array (plus aligned
+# subscription ids) per (symbol, field, direction). A move of a symbol's
+# value from `prev` to `cur` triggers exactly the thresholds between them,
+# found with two binary searches, so a batch costs O(changed symbols x log
+# subscriptions) no matter how many subscriptions exist. Tier-pick
+# subscriptions are a set lookup per (symbol, tier).
+#
+# Triggered alerts are written to alert_outbox, at most once per subscription
+# and day; a sender polls undelivered rows and acknowledges them. Two sources
+# feed the engine: each market-data ingest (closing values, RSI, volume
+# spikes and tier picks, via the bulk_ingest hook) and live TradingView
+# prices published by the prefetcher.
+
+ABOVE, BELOW, MEMBER = 'above', 'below', 'member'
+
+# kind: (observed field, direction)
+KINDS = {
+    'price_above': ('price', ABOVE),
+    'price_below': ('price', BELOW),
+    'rsi_above': ('rsi', ABOVE),
+    'rsi_below': ('rsi', BELOW),
+    'volume_spike': ('volume_ratio', ABOVE),
+    'tier_pick': ('tier', MEMBER),
+}
+
+MESSAGES = {
+    'price_above': "{symbol} {verb} {value:.2f}, above your {threshold:g} alert",
+    'price_below': "{symbol} {verb} {value:.2f}, below your {threshold:g} alert",
+    'rsi_above': "{symbol} RSI rose to {value:.1f}, above {threshold:g}",
+    'rsi_below': "{symbol} RSI fell to {value:.1f}, below {threshold:g}",
+    'volume_spike': "{symbol} traded {value:.1f}x its 20-day average volume",
+    'tier_pick': "{symbol} is a new Tier {threshold:g} pick",
+}
+
+ALERT_FLUSH_SECONDS = float(os.environ.get("ALERT_FLUSH_SECONDS", "30"))
+# Shared secret of the notification sender; the outbox routes stay closed without it
+ALERT_SENDER_TOKEN = os.environ.get("ALERT_SENDER_TOKEN")
+
+class AlertError(ValueError):
+    pass
+
+def sender_authorized(authorization):
+    # authorization: the request's Authorization header, "Bearer <token>"
+    if not ALERT_SENDER_TOKEN or not authorization:
+        return False
+    scheme, _, token = authorization.partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), ALERT_SENDER_TOKEN.encode())
+
+def phone_registered(cur, phone):
+    # Only numbers that signed up through the notifications page
+    # (frontend-next's /api/notifications/subscribe) can hold alerts
+    cur.execute("SELECT to_regclass('notification_ids') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        return False
+    cur.execute("SELECT 1 FROM notification_ids WHERE phone_number = %s;", (phone,))
+    return cur.fetchone() is not None
+
+def validate_subscription(kind, threshold):
+    if kind not in KINDS:
+        raise AlertError(f"Unknown alert kind '{kind}'; expected one of {', '.join(KINDS)}")
+    try:
+        threshold = float(threshold)
+    except (TypeError, ValueError):
+        raise AlertError("threshold must be a number")
+    if not np.isfinite(threshold):
+        raise AlertError("threshold must be finite")
+    if kind == 'tier_pick' and threshold not in (1, 2):
+        raise AlertError("tier_pick threshold must be the tier, 1 or 2")
+    if kind == 'volume_spike' and threshold <= 0:
+        raise AlertError("volume_spike threshold is a multiple of average volume and must be positive")
+    return threshold
+
+class ThresholdBook:
+    def __init__(self, rows):
+        # rows: (id, phone_number, symbol, kind, threshold) for active subscriptions
+        self.subscriptions = {}
+        grouped = {}
+        self.members = {}
+        for sub_id, phone, symbol, kind, threshold in rows:
+            threshold = float(threshold)
+            self.subscriptions[sub_id] = (phone, symbol, kind, threshold)
+            field, direction = KINDS[kind]
+            if direction == MEMBER:
+                self.members.setdefault((symbol, int(threshold)), []).append(sub_id)
+            else:
+                grouped.setdefault((symbol, field, direction), []).append((threshold, sub_id))
+        self.thresholds = {}
+        for key, entries in grouped.items():
+            entries.sort()
+            self.thresholds[key] = (
+                np.array([t for t, _ in entries], dtype=np.float64),
+                np.array([i for _, i in entries], dtype=np.int64),
+            )
+        self.symbols = {key[0] for key in self.thresholds} | {key[0] for key in self.members}
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+    def symbols_for(self, field):
+        return {key[0] for key in self.thresholds if key[1] == field}
+
+    def crossings(self, symbol, field, prev, cur):
+        # Subscription ids whose threshold lies between prev and cur
+        if prev is None or cur is None or not np.isfinite(prev) or not np.isfinite(cur):
+            return []
+        triggered = []
+        if cur > prev and (symbol, field, ABOVE) in self.thresholds:
+            values, ids = self.thresholds[(symbol, field, ABOVE)]
+            # prev < threshold <= cur
+            lo, hi = np.searchsorted(values, [prev, cur], side='right')
+            triggered.extend(ids[lo:hi].tolist())
+        if cur < prev and (symbol, field, BELOW) in self.thresholds:
+            values, ids = self.thresholds[(symbol, field, BELOW)]
+            # cur <= threshold < prev
+            lo, hi = np.searchsorted(values, [cur, prev], side='left')
+            triggered.extend(ids[lo:hi].tolist())
+        return triggered
+
+    def entered(self, symbol, tiers_before, tiers_now):
+        triggered = []
+        for tier in tiers_now - tiers_before:
+            triggered.extend(self.members.get((symbol, tier), []))
+        return triggered
+
+_book_lock = threading.Lock()
+_book = {'version': None, 'book': None}
+
+def load_book(conn):
+    # Compiled subscriptions, rebuilt only when a subscription changed
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('alert_subscriptions') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return ThresholdBook([])
+        cur.execute("SELECT COUNT(*), MAX(updated_at) FROM alert_subscriptions;")
+        version = cur.fetchone()
+        with _book_lock:
+            if _book['book'] is not None and _book['version'] == version:
+                return _book['book']
+        cur.execute("""
+            SELECT id, phone_number, symbol, kind, threshold
+            FROM alert_subscriptions WHERE active;
+        """)
+        book = ThresholdBook(cur.fetchall())
+    with _book_lock:
+        _book['version'] = version
+        _book['book'] = book
+    return book
+
+def write_outbox(conn, book, triggered, source):
+    # triggered: [(subscription id, event date, prev, cur)]; returns rows added
+    rows = []
+    for sub_id, event_date, prev, value in triggered:
+        phone, symbol, kind, threshold = book.subscriptions[sub_id]
+        message = MESSAGES[kind].format(
+            symbol=symbol, value=value if value is not None else 0, threshold=threshold,
+            verb='closed at' if source == 'ingest' else 'is trading at'
+        )
+        rows.append((sub_id, phone, symbol, kind, threshold, prev, value, event_date, source, message))
+    if not rows:
+        return 0
+    with conn.cursor() as cur:
+        added = execute_values(cur, """
+            INSERT INTO alert_outbox (subscription_id, phone_number, symbol, kind, threshold,
+                                      previous_value, observed_value, event_date, source, message)
+            VALUES %s
+            ON CONFLICT (subscription_id, event_date) DO NOTHING
+            RETURNING id;
+        """, rows, fetch=True)
+    return len(added)
+
+#-----------------------------------
+# Ingest evaluation
+#-----------------------------------
+
+def changed_symbols(conn, through_seq):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT symbol FROM stock_analysis_all_results
+            WHERE ingest_seq > %s;
+        """, (through_seq,))
+        return {row[0] for row in cur.fetchall()}
+
+def latest_two_rows(conn, symbols):
+    # {symbol: [(date, price, rsi, volume_ratio)]} newest first, up to two trading days
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT s.symbol, r.date, r.closing_price::float8, r.rsi::float8,
+                   CASE WHEN r.vol_avg_20d > 0 THEN (r.volume / r.vol_avg_20d)::float8 END
+            FROM unnest(%s::text[]) AS s(symbol)
+            CROSS JOIN LATERAL (
+                SELECT date, closing_price, rsi, volume, vol_avg_20d
+                FROM stock_analysis_all_results t
+                WHERE t.symbol = s.symbol AND t.date IS NOT NULL
+                ORDER BY t.date DESC
+                LIMIT 2
+            ) r;
+        """, (sorted(symbols),))
+        rows = {}
+        for symbol, d, price, rsi, ratio in cur.fetchall():
+            rows.setdefault(symbol, []).append((d, price, rsi, ratio))
+    return rows
+
+def tier_memberships(conn):
+    # (latest picks date, {symbol: tiers then}, {symbol: tiers the day before})
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('predictor_picks') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return None, {}, {}
+        cur.execute("SELECT DISTINCT date FROM predictor_picks ORDER BY date DESC LIMIT 2;")
+        dates = [row[0] for row in cur.fetchall()]
+        if not dates:
+            return None, {}, {}
+        cur.execute("""
+            SELECT date, tier, symbol FROM predictor_picks
+            WHERE tier > 0 AND date = ANY(%s);
+        """, (dates,))
+        now, before = {}, {}
+        for d, tier, symbol in cur.fetchall():
+            (now if d == dates[0] else before).setdefault(symbol, set()).add(tier)
+    return dates[0], now, before
+
+def evaluate_ingest(conn, full=False):
+    # Evaluates the symbols whose rows changed since the last run
+    ensure_alert_tables(conn)
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute("SELECT through_seq FROM alert_state WHERE id = 1;")
+        row = cur.fetchone()
+    through = None if full or row is None else row[0]
+    current = ingest_watermark(conn)
+    book = load_book(conn)
+
+    triggered = []
+    if len(book) and (through is None or current is None or current > through):
+        symbols = book.symbols
+        if through is not None and current is not None:
+            symbols = symbols & changed_symbols(conn, through)
+        fields = [('price', 1), ('rsi', 2), ('volume_ratio', 3)]
+        for symbol, rows in latest_two_rows(conn, symbols).items():
+            if len(rows) < 2:
+                continue
+            latest, previous = rows
+            for field, column in fields:
+                for sub_id in book.crossings(symbol, field, previous[column], latest[column]):
+                    triggered.append((sub_id, latest[0], previous[column], latest[column]))
+        picks_date, now, before = tier_memberships(conn)
+        if picks_date is not None:
+            for symbol in symbols:
+                for sub_id in book.entered(symbol, before.get(symbol, set()), now.get(symbol, set())):
+                    triggered.append((sub_id, picks_date, None, None))
+
+    added = write_outbox(conn, book, triggered, 'ingest')
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO alert_state (id, through_seq, evaluated_at)
+            VALUES (1, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (id) DO UPDATE SET
+                through_seq = EXCLUDED.through_seq,
+                evaluated_at = EXCLUDED.evaluated_at;
+        """, (current,))
+    conn.commit()
+    print(
+        f"Evaluated {len(book)} alert subscriptions in {time.perf_counter() - started:.2f}s: "
+        f"{len(triggered)} triggered, {added} new in the outbox"
+    )
+    return added
+
+#-----------------------------------
+# Live price evaluation
+#-----------------------------------
+
+class LivePriceAlerts:
+    # Collects prices as the prefetcher publishes them and evaluates them in
+    # batches every ALERT_FLUSH_SECONDS. A price's crossing is measured from
+    # the last price seen for the symbol, or from `reference` (the last close)
+    # for the first one.
+    def __init__(self, reference, interval=ALERT_FLUSH_SECONDS):
+        self.reference = reference
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.last = {}
+        self.pid = None
+        self.counters = {'prices': 0, 'flushes': 0, 'evaluated': 0, 'triggered': 0, 'errors': 0}
+
+    def record(self, kind, symbol, value):
+        if kind != 'price' or value is None:
+            return
+        with self.lock:
+            self.pending[symbol] = float(value)
+            self.counters['prices'] += 1
+
+    def flush(self, conn):
+        with self.lock:
+            prices, self.pending = self.pending, {}
+        if not prices:
+            return 0
+        book = load_book(conn)
+        watched = book.symbols_for('price')
+        today = datetime.date.today()
+        triggered = []
+        for symbol, price in prices.items():
+            prev = self.last.get(symbol)
+            self.last[symbol] = price
+            if symbol not in watched:
+                continue
+            if prev is None:
+                prev = self.reference(symbol)
+            for sub_id in book.crossings(symbol, 'price', prev, price):
+                triggered.append((sub_id, today, prev, price))
+            self.counters['evaluated'] += 1
+        added = write_outbox(conn, book, triggered, 'live')
+        conn.commit()
+        self.counters['flushes'] += 1
+        self.counters['triggered'] += added
+        return added
+
+    def loop(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.pending:
+                continue
+            try:
+                conn = init_connection()
+                try:
+                    self.flush(conn)
+                finally:
+                    conn.close()
+            except Exception as e:
+                self.counters['errors'] += 1
+                print(f"Live alert evaluation failed: {e}")
+
+    def start(self):
+        # Threads do not survive fork, so each process starts its own
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        threading.Thread(target=self.loop, name="alert-flush", daemon=True).start()
+
+    def stats(self):
+        with self.lock:
+            pending = len(self.pending)
+        return dict(self.counters, pending=pending)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Evaluate alert subscriptions against the latest market data")
+    parser.add_argument("--full", action="store_true", help="evaluate every subscribed symbol, not only changed ones")
+    args = parser.parse_args()
+    conn = init_connection()
+    try:
+        evaluate_ingest(conn, full=args.full)
+    finally:
+        conn.close()
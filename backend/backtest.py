@@ -0,0 +1,291 @@
+import copy
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import panel_store
+import screener
+
+#-----------------------------------
+# Parameter sweeps over screening rules
+#-----------------------------------
+
+# A rule template is a screen spec (see screener.py) in which some values
+# are {"param": name} placeholders. Every combination of the parameter grid
+# binds the template into a concrete screen, which is evaluated on every
+# (symbol, day) of the price panel at once. For each combination the sweep
+# reports the number of signals and their forward returns: the mean, the
+# median, the hit rate (share above zero) and the excess over that day's
+# market average.
+#
+# Combinations are spread over a process pool. Every worker maps the same
+# read-only panel files and keeps the masks of the leaf conditions it has
+# already evaluated, so a grid of thousands of variants re-runs each distinct
+# threshold test once per worker and otherwise only combines boolean masks.
+
+# The thresholds /cse-predictor uses today
+DEFAULT_PARAMS = {
+    'min_turnover': 999999,
+    'min_volume': 9999,
+    'min_relative_strength': 1,
+    'divergence': 'Bullish Divergence',
+    'tier1_momentum': ['Emerging Bullish Momentum', 'Increase in weekly Volume Activity Detected'],
+    'tier2_momentum': ['Emerging Bullish Momentum', 'High Bullish Momentum'],
+}
+
+LIQUIDITY_TEMPLATE = {"all": [
+    {"field": "turnover", "op": ">", "value": {"param": "min_turnover"}},
+    {"field": "volume", "op": ">", "value": {"param": "min_volume"}},
+]}
+
+TEMPLATES = {
+    'tier1': {"all": [LIQUIDITY_TEMPLATE, {"all": [
+        {"field": "rsi_divergence", "op": "==", "value": {"param": "divergence"}},
+        {"field": "volume_analysis", "op": "in", "value": {"param": "tier1_momentum"}},
+    ]}]},
+    'tier2': {"all": [LIQUIDITY_TEMPLATE, {"any": [
+        {"all": [
+            {"field": "volume_analysis", "op": "in", "value": {"param": "tier2_momentum"}},
+            {"field": "relative_strength", "op": ">=", "value": {"param": "min_relative_strength"}},
+        ]},
+        {"field": "rsi_divergence", "op": "==", "value": {"param": "divergence"}},
+    ]}]},
+}
+
+DEFAULT_HORIZONS = [1, 5, 20]
+
+def is_placeholder(value):
+    return isinstance(value, dict) and set(value) == {'param'}
+
+def template_params(node, found=None):
+    found = set() if found is None else found
+    if 'all' in node or 'any' in node:
+        for child in node.get('all', node.get('any')):
+            template_params(child, found)
+    elif is_placeholder(node.get('value')):
+        found.add(node['value']['param'])
+    return found
+
+def bind(node, params):
+    # Concrete screen spec with every placeholder replaced
+    if 'all' in node or 'any' in node:
+        key = 'all' if 'all' in node else 'any'
+        return {key: [bind(child, params) for child in node[key]]}
+    node = dict(node)
+    if is_placeholder(node.get('value')):
+        name = node['value']['param']
+        if name not in params:
+            raise screener.ScreenError(f"No value for rule parameter '{name}'")
+        node['value'] = copy.deepcopy(params[name])
+    return node
+
+def leaf_keys(node, keys=None):
+    keys = [] if keys is None else keys
+    if 'all' in node or 'any' in node:
+        for child in node.get('all', node.get('any')):
+            leaf_keys(child, keys)
+    else:
+        keys.append(screener.node_key(node))
+    return keys
+
+def expand_grid(template, grid):
+    # [(params, bound spec)] for every combination, validated up front
+    unknown = set(grid) - template_params(template)
+    if unknown:
+        raise screener.ScreenError(f"Grid parameters not used by the rule: {', '.join(sorted(unknown))}")
+    names = sorted(grid)
+    combos = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = dict(DEFAULT_PARAMS, **dict(zip(names, values)))
+        spec = bind(template, params)
+        screener.validate_spec(spec)
+        combos.append(({name: params[name] for name in names}, spec))
+    return combos
+
+#-----------------------------------
+# Panel frame and forward returns
+#-----------------------------------
+
+def panel_frame(panel, fields):
+    # One row per (symbol, day) in the panel's column-major order, so the
+    # numeric columns are views of the mapped files rather than copies
+    columns = {}
+    for name in fields:
+        if name in panel.fields:
+            columns[name] = panel.field(name).ravel(order='F')
+        elif name in panel.categories:
+            codes, labels = panel.categories[name]
+            columns[name] = pd.Categorical.from_codes(np.asarray(codes).ravel(order='F'), categories=labels)
+    return pd.DataFrame(columns, copy=False)
+
+def forward_returns(panel, horizon):
+    # Return from each day's close to the close `horizon` trading days later,
+    # carrying the last traded close over days without a trade
+    close = np.asarray(panel.field('closing_price'))
+    carried = pd.DataFrame(close.T).ffill().to_numpy().T
+    forward = np.full(close.shape, np.nan)
+    if horizon < close.shape[1]:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            forward[:, :-horizon] = carried[:, horizon:] / close[:, :-horizon] - 1
+    forward[~np.isfinite(forward)] = np.nan
+    return forward
+
+def day_range(panel, start=None, end=None):
+    first = 0 if start is None else int(np.searchsorted(panel.dates, np.datetime64(start, 'D'), side='left'))
+    last = len(panel.dates) if end is None else int(np.searchsorted(panel.dates, np.datetime64(end, 'D'), side='right'))
+    return first, last
+
+#-----------------------------------
+# Workers
+#-----------------------------------
+
+_worker = {}
+
+def init_worker(panel_dir, fields, horizons, start, end):
+    panel = panel_store.load_panel(panel_dir)
+    n_symbols, n_days = panel.shape
+    first, last = day_range(panel, start, end)
+    in_range = np.zeros(panel.shape, dtype=bool, order='F')
+    in_range[:, first:last] = True
+    forward, excess = {}, {}
+    for h in horizons:
+        values = forward_returns(panel, h)
+        counts = (~np.isnan(values)).sum(axis=0)
+        market = np.where(counts > 0, np.nansum(values, axis=0) / np.maximum(counts, 1), np.nan)
+        forward[h] = values.ravel(order='F')
+        excess[h] = (values - market).ravel(order='F')
+    _worker.clear()
+    _worker.update({
+        'frame': panel_frame(panel, fields),
+        'in_range': in_range.ravel(order='F'),
+        'day_of': np.repeat(np.arange(n_days), n_symbols),
+        'n_days': n_days,
+        'forward': forward,
+        'excess': excess,
+        'leaves': {},
+    })
+
+def evaluate(spec):
+    # Signal mask for one bound spec, reusing leaf masks across combinations
+    frame = _worker['frame']
+    leaves = _worker['leaves']
+    keys = leaf_keys(spec)
+    memo = {key: leaves[key] for key in keys if key in leaves}
+    mask = screener.to_mask(frame, spec, memo)
+    for key in keys:
+        leaves.setdefault(key, memo[key])
+    return mask & _worker['in_range']
+
+def summarize(mask):
+    hits = np.flatnonzero(mask)
+    days = np.bincount(_worker['day_of'][hits], minlength=_worker['n_days'])
+    row = {
+        'signals': int(len(hits)),
+        'signal_days': int(np.count_nonzero(days)),
+        'signals_per_day': float(len(hits) / max(np.count_nonzero(days), 1)),
+    }
+    for h, forward in _worker['forward'].items():
+        values = forward[hits]
+        traded = ~np.isnan(values)
+        values = values[traded]
+        excess = _worker['excess'][h][hits][traded]
+        row[f'mean_{h}d'] = float(values.mean()) if len(values) else np.nan
+        row[f'median_{h}d'] = float(np.median(values)) if len(values) else np.nan
+        row[f'hit_rate_{h}d'] = float((values > 0).mean()) if len(values) else np.nan
+        row[f'excess_{h}d'] = float(np.nanmean(excess)) if len(excess) else np.nan
+    return row
+
+def run_chunk(chunk):
+    return [dict(params, **summarize(evaluate(spec))) for params, spec in chunk]
+
+#-----------------------------------
+# Sweep driver
+#-----------------------------------
+
+def sweep(template, grid, panel_dir=panel_store.PANEL_DIR, horizons=DEFAULT_HORIZONS,
+          start=None, end=None, workers=None, chunk_size=None):
+    combos = expand_grid(template, grid)
+    fields = sorted({json.loads(key)['field'] for _, spec in combos for key in leaf_keys(spec)})
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        # Several chunks per worker balance the load; neighbouring combinations
+        # share most leaves, so chunks stay contiguous
+        chunk_size = max(1, min(256, len(combos) // (workers * 4) or 1))
+    chunks = [combos[i:i + chunk_size] for i in range(0, len(combos), chunk_size)]
+    init_args = (panel_dir, fields, horizons, start, end)
+    rows = []
+    if workers == 1:
+        init_worker(*init_args)
+        for chunk in chunks:
+            rows.extend(run_chunk(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=init_args) as pool:
+            for result in pool.map(run_chunk, chunks):
+                rows.extend(result)
+    return pd.DataFrame(rows)
+
+def parse_grid(items):
+    # name=JSON list of values, e.g. min_turnover=[500000,999999]
+    grid = {}
+    for item in items:
+        name, _, values = item.partition('=')
+        try:
+            values = json.loads(values)
+        except json.JSONDecodeError:
+            raise screener.ScreenError(f"Grid values for '{name}' must be a JSON list")
+        if not isinstance(values, list) or not values:
+            raise screener.ScreenError(f"Grid values for '{name}' must be a non-empty JSON list")
+        grid[name.strip()] = values
+    return grid
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Backtest a grid of screening-rule parameters over the price panel")
+    parser.add_argument("rule", help="tier1, tier2 or a JSON file with a screen spec using {\"param\": name} placeholders")
+    parser.add_argument("--grid", action="append", default=[], metavar="NAME=JSON_LIST",
+                        help="values to sweep for one parameter, e.g. min_turnover=[500000,999999,2000000]")
+    parser.add_argument("--grid-file", help="JSON file mapping parameter names to lists of values")
+    parser.add_argument("--horizons", default=','.join(map(str, DEFAULT_HORIZONS)),
+                        help="forward-return horizons in trading days")
+    parser.add_argument("--start", help="first signal date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last signal date (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--sort", help="column to rank by (default: excess at the longest horizon)")
+    parser.add_argument("--min-signals", type=int, default=30, help="hide combinations with fewer signals")
+    parser.add_argument("--top", type=int, default=20, help="rows to print")
+    parser.add_argument("--output", help="write every combination to this CSV file")
+    parser.add_argument("--refresh", action="store_true", help="rebuild the panel from the database first")
+    args = parser.parse_args()
+
+    if args.rule in TEMPLATES:
+        template = TEMPLATES[args.rule]
+    else:
+        with open(args.rule) as f:
+            template = json.load(f)
+    grid = {}
+    if args.grid_file:
+        with open(args.grid_file) as f:
+            grid.update(json.load(f))
+    grid.update(parse_grid(args.grid))
+    horizons = [int(h) for h in args.horizons.split(',') if h.strip()]
+
+    if args.refresh or panel_store.load_panel() is None:
+        panel_store.refresh_panel(force=args.refresh)
+
+    started = time.perf_counter()
+    results = sweep(template, grid, horizons=horizons, start=args.start, end=args.end, workers=args.workers)
+    elapsed = time.perf_counter() - started
+    print(f"Evaluated {len(results)} combinations in {elapsed:.2f}s ({len(results) / max(elapsed, 1e-9):.0f}/s)")
+
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"Wrote {args.output}")
+    sort_by = args.sort or f"excess_{max(horizons)}d"
+    shown = results[results['signals'] >= args.min_signals].sort_values(sort_by, ascending=False)
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.max_colwidth', 60):
+        print(shown.head(args.top).to_string(index=False))
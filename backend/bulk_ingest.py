@@ -0,0 +1,336 @@
+import csv
+import io
+import sys
+import time
+
+import psycopg2
+
+from init_db import init_connection, INGEST_KEYS, ensure_ingest_keys, dedupe_ingest_keys
+from partitions import TABLE as PARTITIONED_TABLE, is_partitioned, ensure_months
+
+#-----------------------------------
+# COPY-based bulk ingest
+#-----------------------------------
+
+# Input (a CSV file or a DataFrame) is streamed through COPY FROM STDIN into a
+# temporary staging table shaped like the target, then merged into the target
+# with a single INSERT ... ON CONFLICT DO UPDATE. Rows whose values did not
+# change are left alone, so their ingest_seq (see init_db) does not move.
+# Duplicate keys within one input keep the last occurrence.
+
+# Upsert keys per table, backed by the unique indexes from init_db
+INGEST_TABLES = INGEST_KEYS
+
+# Never taken from input: surrogate ids, trigger-maintained and audit columns
+MANAGED_COLUMNS = {'id', 'ingest_seq', 'last_updated'}
+
+COPY_CHUNK_ROWS = 100000
+
+class IngestError(ValueError):
+    pass
+
+class ChunkedReader:
+    # File-like view over an iterator of strings, so COPY can stream a
+    # DataFrame without rendering the whole CSV in memory
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self.buffer = self.buffer, ''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+def frame_chunks(df, columns, chunk_rows=COPY_CHUNK_ROWS):
+    for start in range(0, len(df), chunk_rows):
+        yield df[columns].iloc[start:start + chunk_rows].to_csv(
+            index=False, header=False, na_rep='', date_format='%Y-%m-%d'
+        )
+
+def record_chunks(records, chunk_rows=COPY_CHUNK_ROWS):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for i, record in enumerate(records, 1):
+        writer.writerow(['' if v is None else v for v in record])
+        if i % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def copy_into(cur, table, columns, source):
+    # source: a file-like object yielding CSV text without a header
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '')",
+        source
+    )
+    return cur.rowcount
+
+def copy_records(cur, table, columns, records):
+    return copy_into(cur, table, columns, ChunkedReader(record_chunks(records)))
+
+def copy_frame(cur, table, columns, df):
+    return copy_into(cur, table, columns, ChunkedReader(frame_chunks(df, columns)))
+
+def table_columns(cur, table):
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = %s
+        ORDER BY ordinal_position;
+    """, (table,))
+    return [row[0] for row in cur.fetchall()]
+
+def resolve_columns(table, available, provided):
+    keys = INGEST_TABLES[table]
+    unknown = [c for c in provided if c not in available]
+    if unknown:
+        raise IngestError(f"Unknown columns for {table}: {', '.join(unknown)}")
+    missing = [k for k in keys if k not in provided]
+    if missing:
+        raise IngestError(f"Input for {table} is missing key columns: {', '.join(missing)}")
+    return [c for c in provided if c not in MANAGED_COLUMNS]
+
+def count_new_keys(cur, table, keys):
+    cur.execute(f"""
+        SELECT COUNT(*) FROM (SELECT DISTINCT {', '.join(keys)} FROM ingest_staging) s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {table} t WHERE {' AND '.join(f't.{k} = s.{k}' for k in keys)}
+        );
+    """)
+    return cur.fetchone()[0]
+
+def rewritten_indicator_symbols(cur, columns):
+    # Symbols whose staged rows add or change a bar on or before the last
+    # date their incremental indicator state has consumed; that state can
+    # only be rebuilt from the symbol's full history (see refresh_indicators)
+    cur.execute("SELECT to_regclass('indicator_state') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        return []
+    changed = ['t.symbol IS NULL'] + [
+        f"t.{c} IS DISTINCT FROM s.{c}" for c in ('closing_price', 'volume') if c in columns
+    ]
+    cur.execute(f"""
+        SELECT DISTINCT s.symbol
+        FROM ingest_staging s
+        JOIN indicator_state i ON i.symbol = s.symbol
+        LEFT JOIN {PARTITIONED_TABLE} t ON t.symbol = s.symbol AND t.date = s.date
+        WHERE s.date <= i.last_date AND ({' OR '.join(changed)})
+        ORDER BY s.symbol;
+    """)
+    return [row[0] for row in cur.fetchall()]
+
+def merge_staging(cur, table, columns, available, partitioned=False):
+    keys = INGEST_TABLES[table]
+    values = [c for c in columns if c not in keys]
+    select_list = ', '.join(columns)
+    if values:
+        assignments = [f"{c} = EXCLUDED.{c}" for c in values]
+        if 'last_updated' in available:
+            assignments.append("last_updated = CURRENT_TIMESTAMP")
+        changed = ' OR '.join(f"t.{c} IS DISTINCT FROM EXCLUDED.{c}" for c in values)
+        conflict = f"DO UPDATE SET {', '.join(assignments)} WHERE {changed}"
+    else:
+        conflict = "DO NOTHING"
+    if partitioned:
+        # xmax cannot be read through a partitioned table, so new keys are
+        # counted up front and every other returned row was an update
+        inserted = count_new_keys(cur, table, keys)
+        cur.execute(f"""
+            INSERT INTO {table} AS t ({select_list})
+            SELECT DISTINCT ON ({', '.join(keys)}) {select_list}
+            FROM ingest_staging
+            ORDER BY {', '.join(keys)}, staging_row DESC
+            ON CONFLICT ({', '.join(keys)}) {conflict};
+        """)
+        return inserted, cur.rowcount - inserted
+    cur.execute(f"""
+        WITH upserted AS (
+            INSERT INTO {table} AS t ({select_list})
+            SELECT DISTINCT ON ({', '.join(keys)}) {select_list}
+            FROM ingest_staging
+            ORDER BY {', '.join(keys)}, staging_row DESC
+            ON CONFLICT ({', '.join(keys)}) {conflict}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted)
+        FROM upserted;
+    """)
+    return cur.fetchone()
+
+def ingest(conn, table, source, columns=None, hooks=True):
+    # source: a DataFrame, or a file object with CSV text and a header row
+    if table not in INGEST_TABLES:
+        raise IngestError(f"Unsupported ingest table: {table}")
+    started = time.perf_counter()
+    try:
+        ensure_ingest_keys(conn, table)
+    except psycopg2.IntegrityError:
+        conn.rollback()
+        raise IngestError(f"{table} has duplicate {', '.join(INGEST_TABLES[table])} rows; rerun with --dedupe")
+    with conn.cursor() as cur:
+        available = table_columns(cur, table)
+        if hasattr(source, 'columns'):
+            provided = list(source.columns) if columns is None else columns
+        else:
+            provided = next(csv.reader([source.readline()]))
+            provided = [c.strip() for c in provided]
+        selected = resolve_columns(table, available, provided)
+
+        cur.execute(f"""
+            CREATE TEMP TABLE ingest_staging ON COMMIT DROP AS
+            SELECT {', '.join(selected)} FROM {table} WITH NO DATA;
+        """)
+        cur.execute("ALTER TABLE ingest_staging ADD COLUMN staging_row BIGSERIAL;")
+        if hasattr(source, 'columns'):
+            staged = copy_frame(cur, 'ingest_staging', selected, source)
+        elif selected == provided:
+            staged = copy_into(cur, 'ingest_staging', selected, source)
+        else:
+            # Managed columns in the file are dropped row by row
+            positions = [provided.index(c) for c in selected]
+            rows = (
+                [row[p] for p in positions]
+                for row in csv.reader(source)
+            )
+            staged = copy_records(cur, 'ingest_staging', selected, rows)
+        copied = time.perf_counter()
+        rewritten = rewritten_indicator_symbols(cur, selected) if table == PARTITIONED_TABLE else []
+        partitioned = table == PARTITIONED_TABLE and is_partitioned(cur)
+        if partitioned:
+            # Months the input reaches get their partitions in this transaction
+            cur.execute("""
+                SELECT DISTINCT date_trunc('month', date)::date FROM ingest_staging
+                WHERE date IS NOT NULL;
+            """)
+            ensure_months(cur, [row[0] for row in cur.fetchall()])
+        inserted, updated = merge_staging(cur, table, selected, available, partitioned)
+    conn.commit()
+    finished = time.perf_counter()
+
+    summary = {
+        'table': table,
+        'staged': staged,
+        'inserted': inserted,
+        'updated': updated,
+        'unchanged': staged - inserted - updated,
+        'rewritten_symbols': rewritten,
+        'copy_seconds': round(copied - started, 3),
+        'merge_seconds': round(finished - copied, 3),
+        'seconds': round(finished - started, 3),
+        'rows_per_second': int(staged / max(finished - started, 1e-9)),
+    }
+    print(
+        f"Ingested {staged} rows into {table} in {summary['seconds']:.2f}s "
+        f"({summary['rows_per_second']} rows/s): {inserted} inserted, {updated} updated, "
+        f"{summary['unchanged']} unchanged"
+    )
+    if hooks:
+        run_hooks(conn, summary)
+    return summary
+
+#-----------------------------------
+# Post-ingest hooks
+#-----------------------------------
+
+# Derived data that must follow an ingest registers here; hooks receive the
+# open connection and the ingest summary. A failing hook is reported and
+# does not undo the ingest.
+
+POST_INGEST_HOOKS = {table: [] for table in INGEST_TABLES}
+
+def register_hook(table, hook):
+    POST_INGEST_HOOKS[table].append(hook)
+    return hook
+
+def run_hooks(conn, summary):
+    if summary['inserted'] == 0 and summary['updated'] == 0:
+        return
+    for hook in POST_INGEST_HOOKS[summary['table']]:
+        started = time.perf_counter()
+        try:
+            hook(conn, summary)
+            print(f"Post-ingest hook {hook.__name__} finished in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            conn.rollback()
+            print(f"Post-ingest hook {hook.__name__} failed: {e}")
+
+def refresh_indicators(conn, summary):
+    import indicators
+    if summary.get('full_rebuild'):
+        indicators.rebuild_all()
+        return
+    # Corrections and backfills behind a symbol's stored state invalidate its
+    # running averages; those symbols are recomputed from their full history
+    if summary.get('rewritten_symbols'):
+        indicators.rebuild_symbols(summary['rewritten_symbols'])
+    indicators.update_daily()
+
+def refresh_table_stats(conn, summary):
+    import table_stats
+    table_stats.refresh_symbol_stats(conn)
+
+def refresh_predictor_picks(conn, summary):
+    import predictor_picks
+    predictor_picks.refresh_picks(conn)
+
+def evaluate_alerts(conn, summary):
+    import alerts
+    alerts.evaluate_ingest(conn)
+
+def refresh_dividend_aggregates(conn, summary):
+    import dividends
+    dividends.refresh_aggregates(conn)
+
+def refresh_pick_fundamentals(conn, summary):
+    import predictor_picks
+    predictor_picks.refresh_pick_fundamentals(conn)
+
+# Order matters: statistics and picks use the indicator columns written first,
+# and alerts read both the indicators and the refreshed picks
+register_hook('stock_analysis_all_results', refresh_indicators)
+register_hook('stock_analysis_all_results', refresh_table_stats)
+register_hook('stock_analysis_all_results', refresh_predictor_picks)
+register_hook('stock_analysis_all_results', evaluate_alerts)
+# Dividend yields are quoted on the latest close
+register_hook('stock_analysis_all_results', refresh_dividend_aggregates)
+register_hook('financial_metrics', refresh_pick_fundamentals)
+register_hook('dividend_history', refresh_dividend_aggregates)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Bulk load CSV data with COPY and upsert it into a table")
+    parser.add_argument("table", choices=sorted(INGEST_TABLES))
+    parser.add_argument("path", help="CSV file with a header row, or - for stdin")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="delete existing duplicate keys (keeping the newest row) before ingesting")
+    parser.add_argument("--no-hooks", action="store_true", help="skip post-ingest hooks")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="recompute indicators for all history instead of only new bars")
+    args = parser.parse_args()
+
+    conn = init_connection()
+    try:
+        if args.dedupe:
+            removed = dedupe_ingest_keys(conn, args.table)
+            print(f"Removed {removed} duplicate rows from {args.table}")
+        source = sys.stdin if args.path == '-' else open(args.path, newline='')
+        try:
+            summary = ingest(conn, args.table, source, hooks=False)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        if not args.no_hooks:
+            summary['full_rebuild'] = args.full_rebuild
+            run_hooks(conn, summary)
+    except IngestError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
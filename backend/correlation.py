@@ -0,0 +1,168 @@
+import numpy as np
+
+from leaderboard import select_top
+
+#-----------------------------------
+# Return correlations and betas
+#-----------------------------------
+
+# Daily returns over a trailing window are taken from the panel's close
+# prices as a (days x symbols) block. Counters do not trade every day, so
+# every statistic uses only the days both series have a return. Those
+# pairwise-complete sums all come from matrix products of the zero-filled
+# returns and their presence mask, so the whole N x N matrix costs a few
+# BLAS calls instead of N^2 Python-level pairs.
+
+DEFAULT_WINDOW = 60
+MIN_WINDOW = 10
+MAX_WINDOW = 250
+DEFAULT_PAIRS = 20
+MAX_PAIRS = 200
+# The full matrix is only sent on request, and only for sets up to this size
+MAX_MATRIX_SYMBOLS = 500
+
+class CorrelationError(ValueError):
+    pass
+
+def validate_params(window, pairs):
+    if not MIN_WINDOW <= window <= MAX_WINDOW:
+        raise CorrelationError(f"window must be between {MIN_WINDOW} and {MAX_WINDOW}")
+    if not 1 <= pairs <= MAX_PAIRS:
+        raise CorrelationError(f"pairs must be between 1 and {MAX_PAIRS}")
+
+def min_overlap(window):
+    # Days two series must share before their correlation is reported
+    return max(MIN_WINDOW, window // 2)
+
+def window_returns(panel, rows, window, j):
+    # (days x symbols) simple returns for the `window` days ending at day j;
+    # NaN where the symbol did not trade on the day or the day before
+    start = max(0, j - window)
+    prices = panel.field('closing_price')[rows, start:j + 1].T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = prices[1:] / prices[:-1] - 1
+    returns[~np.isfinite(returns)] = np.nan
+    return returns
+
+def pairwise_moments(x, y):
+    # Pairwise-complete sums for every column pair of x (days x n) and y
+    # (days x m): overlap counts, sums of x, sums of y, sums of squares and
+    # cross products, each (n x m)
+    mx, my = ~np.isnan(x), ~np.isnan(y)
+    x0, y0 = np.where(mx, x, 0.0), np.where(my, y, 0.0)
+    mxf, myf = mx.astype(np.float64), my.astype(np.float64)
+    n = mxf.T @ myf
+    sx = x0.T @ myf
+    sy = mxf.T @ y0
+    sxx = (x0 * x0).T @ myf
+    syy = mxf.T @ (y0 * y0)
+    sxy = x0.T @ y0
+    return n, sx, sy, sxx, syy, sxy
+
+def correlation_matrix(returns, overlap):
+    # (correlations, overlap counts); NaN where fewer than `overlap` shared days
+    n, sx, sy, sxx, syy, sxy = pairwise_moments(returns, returns)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * sxy - sx * sy
+        var = (n * sxx - sx * sx) * (n * syy - sy * sy)
+        corr = cov / np.sqrt(var)
+    corr[(n < overlap) | ~np.isfinite(corr)] = np.nan
+    np.clip(corr, -1.0, 1.0, out=corr)
+    np.fill_diagonal(corr, 1.0)
+    return corr, n
+
+def benchmark_returns(panel, window, j, benchmark=None):
+    # (returns, name): a listed benchmark symbol's returns, otherwise the
+    # equal-weighted average return of every symbol that traded that day
+    if benchmark is not None:
+        i = panel.symbol_ids.get(benchmark)
+        if i is None:
+            raise CorrelationError(f"Unknown benchmark '{benchmark}'")
+        return window_returns(panel, [i], window, j)[:, 0], benchmark
+    market = window_returns(panel, slice(None), window, j)
+    counts = (~np.isnan(market)).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = np.where(counts > 0, np.nansum(market, axis=1) / np.maximum(counts, 1), np.nan)
+    return average, 'equal_weight'
+
+def betas(returns, bench, overlap):
+    # (beta, correlation, shared days) of each column against the benchmark
+    n, sx, sb, sxx, sbb, sxb = pairwise_moments(returns, bench[:, None])
+    n, sx, sb, sxx, sbb, sxb = (a[:, 0] for a in (n, sx, sb, sxx, sbb, sxb))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * sxb - sx * sb
+        var_b = n * sbb - sb * sb
+        beta = cov / var_b
+        corr = cov / np.sqrt((n * sxx - sx * sx) * var_b)
+    bad = (n < overlap) | ~np.isfinite(beta)
+    beta[bad] = np.nan
+    corr[bad | ~np.isfinite(corr)] = np.nan
+    return beta, corr, n
+
+def as_float(value):
+    return float(value) if np.isfinite(value) else None
+
+def top_pairs(symbols, corr, counts, k, largest=True):
+    upper_i, upper_j = np.triu_indices(len(symbols), k=1)
+    values = corr[upper_i, upper_j]
+    picked = select_top(values, k, largest)
+    return [
+        {
+            'symbols': [symbols[upper_i[p]], symbols[upper_j[p]]],
+            'correlation': float(values[p]),
+            'overlap': int(counts[upper_i[p], upper_j[p]]),
+        }
+        for p in picked
+    ]
+
+def build_correlation(panel, symbols=None, date=None, window=DEFAULT_WINDOW, pairs=DEFAULT_PAIRS,
+                      benchmark=None, matrix=False):
+    validate_params(window, pairs)
+    j = panel.day_index(date) if panel is not None else None
+    if j is None:
+        return {'date': None, 'window': window, 'symbols': [], 'pairs': {}}
+
+    if symbols is None:
+        rows = np.arange(len(panel.symbols))
+    else:
+        rows = np.array(sorted(panel.symbol_ids[s] for s in set(symbols)), dtype=np.int64)
+    returns = window_returns(panel, rows, window, j)
+    overlap = min_overlap(window)
+    # Symbols that barely traded in the window cannot pair with anything
+    keep = (~np.isnan(returns)).sum(axis=0) >= overlap
+    rows, returns = rows[keep], returns[:, keep]
+    names = [panel.symbols[i] for i in rows]
+    if matrix and len(names) > MAX_MATRIX_SYMBOLS:
+        raise CorrelationError(
+            f"The full matrix is limited to {MAX_MATRIX_SYMBOLS} symbols; pass symbols= or omit matrix"
+        )
+
+    corr, counts = correlation_matrix(returns, overlap)
+    bench, bench_name = benchmark_returns(panel, window, j, benchmark)
+    beta, bench_corr, bench_days = betas(returns, bench, overlap)
+
+    result = {
+        'date': str(panel.dates[j]),
+        'window_start': str(panel.dates[max(0, j - window)]),
+        'window': window,
+        'min_overlap': overlap,
+        'benchmark': bench_name,
+        'symbols': names,
+        'excluded': len(keep) - int(keep.sum()),
+        'pairs': {
+            'most_correlated': top_pairs(names, corr, counts, pairs, largest=True),
+            'least_correlated': top_pairs(names, corr, counts, pairs, largest=False),
+        },
+        'betas': [
+            {
+                'symbol': name,
+                'beta': as_float(beta[k]),
+                'correlation': as_float(bench_corr[k]),
+                'overlap': int(bench_days[k]),
+            }
+            for k, name in enumerate(names)
+        ],
+    }
+    if matrix:
+        result['matrix'] = [[as_float(v) for v in row] for row in corr]
+    return result
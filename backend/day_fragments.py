@@ -0,0 +1,143 @@
+import struct
+import zlib
+
+import shared_cache
+import typed_fetch
+
+#-----------------------------------
+# Pre-serialised per-day JSON fragments
+#-----------------------------------
+
+# /technical-analysis ranges overlap heavily (the last 30 days, shifted by a
+# day), so each trading day's rows are encoded once into a JSON fragment
+# ("{...},{...}") plus a raw-deflate copy of it, both kept in shared_cache.
+# A fragment's key carries the day's version (row count and highest
+# ingest_seq), so re-ingested days get new fragments and old ones age out.
+# A range response is the cached fragments joined with commas; only missing
+# days and the latest (still-changing) day are read from the database and
+# encoded. Each deflate copy ends on a sync flush, so the gzip body is just
+# the fragments' deflate copies concatenated between a header and trailer.
+
+FRAGMENT_ROUTE = '/technical-analysis#day'
+COMPRESS_LEVEL = 6
+
+# Numeric columns reported as 0 when missing
+ZERO_FILL_COLUMNS = ['closing_price', 'change_pct', 'volume', 'turnover', 'rsi', 'relative_strength']
+
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+def format_rows(df):
+    # API records for stock_analysis_all_results rows
+    df = df.drop(columns=['ingest_seq'], errors='ignore')
+    df = df.fillna({col: 0 for col in ZERO_FILL_COLUMNS if col in df.columns})
+    if 'date' in df.columns:
+        df = df.dropna(subset=['date'])
+        df['date'] = df['date'].dt.strftime('%Y-%m-%d')
+    return typed_fetch.frame_records(df)
+
+def window_clause(first_day=None, exact=False):
+    # WHERE clause for the days a /technical-analysis request covers
+    if first_day is None:
+        return "date >= CURRENT_DATE - 30", ()
+    if exact:
+        return "date = %s::date", (first_day,)
+    return "date >= %s::date", (first_day,)
+
+def day_versions(conn, first_day=None, exact=False, sequenced=True):
+    # [(date, version)] newest first, for the days a range query covers.
+    # Without the ingest_seq column (sequenced=False) versions are None and
+    # nothing is cached.
+    where, params = window_clause(first_day, exact)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT date, COUNT(*), {'MAX(ingest_seq)' if sequenced else 'NULL'}
+            FROM stock_analysis_all_results
+            WHERE {where}
+            GROUP BY date
+            ORDER BY date DESC;
+        """, params)
+        return [(str(d), f"{n}:{seq}" if sequenced else None) for d, n, seq in cur.fetchall()]
+
+def latest_day(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT MAX(date) FROM stock_analysis_all_results;")
+        day = cur.fetchone()[0]
+    return str(day) if day is not None else None
+
+def fragment_keys(day, version):
+    raw = shared_cache.make_key(FRAGMENT_ROUTE, {'date': day}, version)
+    return raw, shared_cache.make_key(FRAGMENT_ROUTE, {'date': day, 'encoding': 'deflate'}, version)
+
+def deflate(data, final=False):
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+def encode_day(records, dumps):
+    return b','.join(dumps(record).encode('utf-8') for record in records)
+
+def load_days(conn, days):
+    # {date: [records]} for the given days, rows ordered by symbol
+    if not days:
+        return {}
+    df = typed_fetch.fetch_frame(conn, """
+        SELECT * FROM stock_analysis_all_results
+        WHERE date = ANY(%s::date[])
+        ORDER BY date DESC, symbol ASC;
+    """, (days,))
+    grouped = {day: [] for day in days}
+    for record in format_rows(df):
+        grouped[record['date']].append(record)
+    return grouped
+
+def day_fragments(conn, versions, dumps, compressed=False):
+    # ([(raw, deflated or None)] in `versions` order, number of cached days)
+    # The market's latest day is still being written, so it is never cached
+    live_day = latest_day(conn) if versions else None
+    fragments = {}
+    for day, version in versions:
+        if day == live_day or version is None:
+            continue
+        raw_key, deflate_key = fragment_keys(day, version)
+        raw = shared_cache.get(raw_key)
+        packed = shared_cache.get(deflate_key) if compressed and raw is not None else None
+        if raw is not None and (packed is not None or not compressed):
+            fragments[day] = (raw, packed)
+
+    missing = [day for day, _ in versions if day not in fragments]
+    loaded = load_days(conn, missing)
+    for day, version in versions:
+        if day not in loaded:
+            continue
+        raw = encode_day(loaded[day], dumps)
+        cacheable = day != live_day and version is not None
+        packed = deflate(raw) if compressed or cacheable else None
+        if cacheable:
+            raw_key, deflate_key = fragment_keys(day, version)
+            shared_cache.put(raw_key, raw)
+            shared_cache.put(deflate_key, packed)
+        fragments[day] = (raw, packed)
+    cached = len(versions) - len(missing)
+    return [fragments[day] for day, _ in versions], cached
+
+def assemble(fragments, head, tail):
+    # head + fragments joined with commas + tail
+    return head + b','.join(raw for raw, _ in fragments if raw) + tail
+
+def assemble_gzip(fragments, head, tail):
+    parts = [(head, deflate(head))]
+    for raw, packed in fragments:
+        if not raw:
+            continue
+        if len(parts) > 1:
+            parts.append((b',', deflate(b',')))
+        parts.append((raw, packed))
+    crc, size = 0, 0
+    for raw, _ in parts:
+        crc = zlib.crc32(raw, crc)
+        size += len(raw)
+    crc = zlib.crc32(tail, crc)
+    size += len(tail)
+    return b''.join(
+        [GZIP_HEADER] + [packed for _, packed in parts] + [deflate(tail, final=True)]
+        + [struct.pack('<II', crc, size & 0xffffffff)]
+    )
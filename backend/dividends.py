@@ -0,0 +1,198 @@
+import time
+
+from init_db import init_connection, ensure_dividend_tables
+
+#-----------------------------------
+# Per-company dividend aggregates
+#-----------------------------------
+
+# dividend_history holds one row per announced dividend. The dividend routes
+# serve one precomputed row per company from dividend_aggregates instead of
+# the full history:
+#   - trailing 12-month DPS and the number of payouts in that window
+#   - growth against the previous 12 months and a 3-year CAGR
+#   - payouts per year over the company's whole history
+#   - the two most common payout months
+#   - the yield on the latest close
+# The table is small (one row per company), so a refresh rebuilds it with
+# one aggregate query. It runs after dividend ingests, and after market-data
+# ingests so that yields follow the latest closes. The trailing windows are
+# anchored on CURRENT_DATE at refresh time (stored as as_of), so readers
+# also rebuild it on the first read of a new day (see refresh_if_outdated);
+# otherwise TTM and growth would drift on days without ingests.
+
+# Listed symbols a company code can refer to, in order of preference
+SYMBOL_SUFFIXES = ['', '.N0000']
+
+SUMMARY_COLUMNS = [
+    'company_code', 'symbol', 'dividend_count', 'first_date', 'last_date', 'last_dps',
+    'ttm_dps', 'ttm_payouts', 'prior_ttm_dps', 'dps_growth_pct', 'dps_cagr_3y_pct',
+    'payouts_per_year', 'payout_months', 'latest_close', 'close_date',
+    'dividend_yield_pct', 'yield_basis', 'as_of',
+]
+
+# Columns /dividends/summary can sort by (largest first)
+SORT_COLUMNS = {'dividend_yield_pct', 'ttm_dps', 'dps_growth_pct', 'dps_cagr_3y_pct', 'payouts_per_year', 'last_date'}
+
+MAX_LIMIT = 500
+
+def latest_close_join():
+    # One LATERAL lookup per candidate symbol; each is a backward scan of the
+    # (symbol, date) index
+    joins, symbols, closes, dates = [], [], [], []
+    for k, suffix in enumerate(SYMBOL_SUFFIXES):
+        joins.append(f"""
+            LEFT JOIN LATERAL (
+                SELECT t.symbol, t.date, t.closing_price::float8 AS close
+                FROM stock_analysis_all_results t
+                WHERE t.symbol = c.company_code || '{suffix}' AND t.closing_price > 0
+                ORDER BY t.date DESC
+                LIMIT 1
+            ) p{k} ON TRUE""")
+        symbols.append(f"p{k}.symbol")
+        closes.append(f"p{k}.close")
+        dates.append(f"p{k}.date")
+    return ''.join(joins), f"COALESCE({', '.join(symbols)})", f"COALESCE({', '.join(closes)})", f"COALESCE({', '.join(dates)})"
+
+def refresh_aggregates(conn):
+    ensure_dividend_tables(conn)
+    started = time.perf_counter()
+    joins, symbol, close, close_date = latest_close_join()
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('dividend_history') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return 0
+        # Concurrent refreshes take turns instead of colliding on the primary key
+        cur.execute("LOCK TABLE dividend_aggregates IN EXCLUSIVE MODE;")
+        cur.execute("DELETE FROM dividend_aggregates;")
+        cur.execute(f"""
+            WITH d AS (
+                SELECT company_code, announcement_date AS day, rate_of_dividend::float8 AS rate
+                FROM dividend_history
+                WHERE company_code IS NOT NULL AND announcement_date IS NOT NULL
+                  AND rate_of_dividend IS NOT NULL
+            ),
+            c AS (
+                SELECT company_code,
+                       COUNT(*) AS dividend_count,
+                       MIN(day) AS first_date,
+                       MAX(day) AS last_date,
+                       (ARRAY_AGG(rate ORDER BY day DESC, rate DESC))[1] AS last_dps,
+                       COALESCE(SUM(rate) FILTER (WHERE day > CURRENT_DATE - INTERVAL '1 year'), 0) AS ttm_dps,
+                       COUNT(*) FILTER (WHERE day > CURRENT_DATE - INTERVAL '1 year') AS ttm_payouts,
+                       COALESCE(SUM(rate) FILTER (WHERE day > CURRENT_DATE - INTERVAL '2 years'
+                                                    AND day <= CURRENT_DATE - INTERVAL '1 year'), 0) AS prior_ttm_dps,
+                       COALESCE(SUM(rate) FILTER (WHERE day > CURRENT_DATE - INTERVAL '4 years'
+                                                    AND day <= CURRENT_DATE - INTERVAL '3 years'), 0) AS dps_3y_ago
+                FROM d
+                GROUP BY company_code
+            ),
+            m AS (
+                SELECT company_code, (ARRAY_AGG(month ORDER BY payouts DESC, month))[1:2] AS payout_months
+                FROM (
+                    SELECT company_code, EXTRACT(MONTH FROM day)::smallint AS month, COUNT(*) AS payouts
+                    FROM d
+                    GROUP BY 1, 2
+                ) counted
+                GROUP BY company_code
+            ),
+            priced AS (
+                SELECT c.*, m.payout_months,
+                       {symbol} AS symbol, {close} AS latest_close, {close_date} AS close_date,
+                       CASE WHEN c.ttm_dps > 0 THEN c.ttm_dps ELSE c.last_dps END AS yield_dps,
+                       CASE WHEN c.ttm_dps > 0 THEN 'ttm' ELSE 'last' END AS yield_basis
+                FROM c
+                JOIN m USING (company_code)
+                {joins}
+            )
+            INSERT INTO dividend_aggregates (
+                company_code, symbol, dividend_count, first_date, last_date, last_dps,
+                ttm_dps, ttm_payouts, prior_ttm_dps, dps_growth_pct, dps_cagr_3y_pct,
+                payouts_per_year, payout_months, latest_close, close_date,
+                dividend_yield_pct, yield_basis, as_of, refreshed_at
+            )
+            SELECT company_code, symbol, dividend_count, first_date, last_date, last_dps,
+                   ttm_dps, ttm_payouts, prior_ttm_dps,
+                   CASE WHEN prior_ttm_dps > 0 THEN (ttm_dps / prior_ttm_dps - 1) * 100 END,
+                   CASE WHEN dps_3y_ago > 0 AND ttm_dps > 0
+                        THEN (power(ttm_dps / dps_3y_ago, 1.0 / 3) - 1) * 100 END,
+                   CASE WHEN dividend_count >= 2 AND last_date > first_date
+                        THEN dividend_count / ((last_date - first_date) / 365.0) END,
+                   payout_months, latest_close, close_date,
+                   CASE WHEN latest_close > 0 AND yield_dps > 0 THEN yield_dps / latest_close * 100 END,
+                   yield_basis, CURRENT_DATE, CURRENT_TIMESTAMP
+            FROM priced;
+        """)
+        refreshed = cur.rowcount
+    conn.commit()
+    print(f"Refreshed dividend aggregates for {refreshed} companies in {time.perf_counter() - started:.2f}s")
+    return refreshed
+
+def ensure_aggregates(conn):
+    # Builds the aggregates once when dividends exist but were never aggregated
+    ensure_dividend_tables(conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM dividend_aggregates);")
+        if cur.fetchone()[0]:
+            return 0
+    return refresh_aggregates(conn)
+
+def refresh_if_outdated(conn):
+    # Rebuilds aggregates computed on an earlier day
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('dividend_aggregates') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return 0
+        cur.execute("SELECT MAX(as_of) < CURRENT_DATE FROM dividend_aggregates;")
+        outdated = cur.fetchone()[0]
+    conn.commit()
+    return refresh_aggregates(conn) if outdated else 0
+
+def summary_record(columns, row):
+    record = dict(zip(columns, row))
+    for key, value in record.items():
+        if hasattr(value, 'isoformat'):
+            record[key] = value.isoformat()
+        elif key == 'payout_months' and value is not None:
+            record[key] = [int(month) for month in value]
+        elif value is not None and not isinstance(value, (str, int, list)):
+            record[key] = float(value)
+    return record
+
+def fetch_summaries(conn, company_codes=None, sort=None, limit=None):
+    select = ', '.join(SUMMARY_COLUMNS)
+    where, params = "", []
+    if company_codes is not None:
+        where = "WHERE company_code = ANY(%s)"
+        params.append(list(company_codes))
+    order = f"{sort} DESC NULLS LAST, company_code" if sort else "company_code"
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT {select} FROM dividend_aggregates {where} ORDER BY {order}"
+            + (" LIMIT %s;" if limit else ";"),
+            params + ([limit] if limit else [])
+        )
+        return [summary_record(SUMMARY_COLUMNS, row) for row in cur.fetchall()]
+
+def fetch_companies(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT company_code FROM dividend_aggregates ORDER BY company_code;")
+        return [row[0] for row in cur.fetchall()]
+
+def fetch_history(conn, company_code):
+    # One company's dividends, newest first
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT announcement_date, rate_of_dividend::float8
+            FROM dividend_history
+            WHERE company_code = %s AND announcement_date IS NOT NULL
+            ORDER BY announcement_date DESC;
+        """, (company_code,))
+        return [{'date': d.isoformat(), 'rate_of_dividend': rate} for d, rate in cur.fetchall()]
+
+if __name__ == "__main__":
+    conn = init_connection()
+    try:
+        refresh_aggregates(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,560 @@
+import time
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from init_db import init_connection, ensure_indicator_columns, ensure_indicator_state_table
+from bulk_ingest import copy_frame
+
+#-----------------------------------
+# Indicator parameters
+#-----------------------------------
+
+RSI_PERIOD = 14
+DIVERGENCE_LOOKBACK = 20
+VOLUME_SHORT_WINDOW = 5
+VOLUME_LONG_WINDOW = 20
+
+# Volume regime thresholds, expressed as the 5-day / 20-day average volume ratio
+HIGH_MOMENTUM_RATIO = 2.0
+EMERGING_MOMENTUM_RATIO = 1.5
+WEEKLY_ACTIVITY_RATIO = 1.2
+
+BULLISH_DIVERGENCE = "Bullish Divergence"
+BEARISH_DIVERGENCE = "Bearish Divergence"
+HIGH_BULLISH_MOMENTUM = "High Bullish Momentum"
+EMERGING_BULLISH_MOMENTUM = "Emerging Bullish Momentum"
+WEEKLY_VOLUME_ACTIVITY = "Increase in weekly Volume Activity Detected"
+
+# Columns written back to stock_analysis_all_results
+INDICATOR_COLUMNS = [
+    'change_pct', 'rsi', 'relative_strength', 'rsi_divergence',
+    'vol_avg_5d', 'vol_avg_20d', 'volume_analysis'
+]
+
+#-----------------------------------
+# Dense bar panel
+#-----------------------------------
+
+# The engine works on a (symbols x bars) layout: each symbol's bars are packed
+# to the left in date order and padded with NaN, so every rolling window below
+# runs over that symbol's own trading history for the whole universe at once.
+
+def build_bar_panel(df):
+    df = df.sort_values(['symbol', 'date'], kind='mergesort').reset_index(drop=True)
+    codes, symbols = pd.factorize(df['symbol'], sort=True)
+    positions = df.groupby(codes).cumcount().to_numpy()
+    n_symbols = len(symbols)
+    n_bars = int(positions.max()) + 1 if len(df) else 0
+
+    close = np.full((n_symbols, n_bars), np.nan)
+    volume = np.full((n_symbols, n_bars), np.nan)
+    close[codes, positions] = df['closing_price'].to_numpy(dtype='float64')
+    volume[codes, positions] = df['volume'].to_numpy(dtype='float64')
+
+    return {
+        'symbols': np.asarray(symbols),
+        'dates': df['date'].to_numpy(),
+        'codes': codes,
+        'positions': positions,
+        'close': close,
+        'volume': volume,
+    }
+
+#-----------------------------------
+# Vectorized kernels
+#-----------------------------------
+
+# Window sums are accumulated oldest-to-newest one column at a time. The daily
+# incremental update performs the same additions in the same order, which keeps
+# both paths bit-for-bit identical.
+
+def rolling_mean(values, window):
+    n_symbols, n_bars = values.shape
+    out = np.full((n_symbols, n_bars), np.nan)
+    if n_bars < window:
+        return out
+    span = n_bars - window + 1
+    total = values[:, 0:span].copy()
+    for k in range(1, window):
+        total = total + values[:, k:k + span]
+    out[:, window - 1:] = total / window
+    return out
+
+def split_changes(close):
+    delta = np.diff(close, axis=1)
+    gains = np.where(delta > 0, delta, 0.0)
+    losses = np.where(delta < 0, -delta, 0.0)
+    gains[np.isnan(delta)] = np.nan
+    losses[np.isnan(delta)] = np.nan
+    return delta, gains, losses
+
+def rsi_from_averages(avg_gain, avg_loss):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = np.where(avg_loss > 0, avg_gain / avg_loss, np.nan)
+        rsi = np.where(avg_loss > 0, 100.0 - 100.0 / (1.0 + rs), np.where(avg_gain > 0, 100.0, 50.0))
+    rsi[np.isnan(avg_gain) | np.isnan(avg_loss)] = np.nan
+    return rsi, rs
+
+def wilder_rsi(close, period=RSI_PERIOD):
+    n_symbols, n_bars = close.shape
+    avg_gain = np.full((n_symbols, n_bars), np.nan)
+    avg_loss = np.full((n_symbols, n_bars), np.nan)
+    if n_bars <= period:
+        rsi, rs = rsi_from_averages(avg_gain, avg_loss)
+        return rsi, rs, avg_gain, avg_loss
+
+    _, gains, losses = split_changes(close)
+
+    # Seed with the simple average of the first `period` changes
+    gain_sum = gains[:, 0].copy()
+    loss_sum = losses[:, 0].copy()
+    for k in range(1, period):
+        gain_sum = gain_sum + gains[:, k]
+        loss_sum = loss_sum + losses[:, k]
+    avg_gain[:, period] = gain_sum / period
+    avg_loss[:, period] = loss_sum / period
+
+    # Wilder smoothing, vectorized across the whole universe
+    for i in range(period + 1, n_bars):
+        avg_gain[:, i] = (avg_gain[:, i - 1] * (period - 1) + gains[:, i - 1]) / period
+        avg_loss[:, i] = (avg_loss[:, i - 1] * (period - 1) + losses[:, i - 1]) / period
+
+    rsi, rs = rsi_from_averages(avg_gain, avg_loss)
+    return rsi, rs, avg_gain, avg_loss
+
+def divergence_codes(close_now, rsi_now, prior_close, prior_rsi):
+    # prior_* hold the previous `lookback` bars along the last axis.
+    # 1 = bullish (lower low in price, higher RSI), -1 = bearish, 0 = none
+    low_idx = np.argmin(np.where(np.isnan(prior_close), np.inf, prior_close), axis=-1)
+    high_idx = np.argmax(np.where(np.isnan(prior_close), -np.inf, prior_close), axis=-1)
+    low_close = np.take_along_axis(prior_close, low_idx[..., None], axis=-1)[..., 0]
+    high_close = np.take_along_axis(prior_close, high_idx[..., None], axis=-1)[..., 0]
+    low_rsi = np.take_along_axis(prior_rsi, low_idx[..., None], axis=-1)[..., 0]
+    high_rsi = np.take_along_axis(prior_rsi, high_idx[..., None], axis=-1)[..., 0]
+
+    bullish = (close_now < low_close) & (rsi_now > low_rsi)
+    bearish = (close_now > high_close) & (rsi_now < high_rsi)
+    return np.where(bullish, 1, np.where(bearish, -1, 0)).astype(np.int8)
+
+def rsi_divergence(close, rsi, lookback=DIVERGENCE_LOOKBACK):
+    n_symbols, n_bars = close.shape
+    codes = np.zeros((n_symbols, n_bars), dtype=np.int8)
+    if n_bars <= lookback:
+        return codes
+    windows_close = np.lib.stride_tricks.sliding_window_view(close[:, :-1], lookback, axis=1)
+    windows_rsi = np.lib.stride_tricks.sliding_window_view(rsi[:, :-1], lookback, axis=1)
+    with np.errstate(invalid='ignore'):
+        codes[:, lookback:] = divergence_codes(close[:, lookback:], rsi[:, lookback:], windows_close, windows_rsi)
+    return codes
+
+def volume_regime_codes(vol_short, vol_long, change_pct):
+    # 3 = high momentum, 2 = emerging momentum, 1 = weekly activity, 0 = none
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(vol_long > 0, vol_short / vol_long, np.nan)
+        rising = change_pct > 0
+        return np.select(
+            [
+                (ratio >= HIGH_MOMENTUM_RATIO) & rising,
+                (ratio >= EMERGING_MOMENTUM_RATIO) & rising,
+                ratio >= WEEKLY_ACTIVITY_RATIO,
+            ],
+            [3, 2, 1],
+            default=0
+        ).astype(np.int8)
+
+def percent_change(close_now, close_prev):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(close_prev > 0, (close_now - close_prev) / close_prev * 100.0, np.nan)
+
+DIVERGENCE_LABELS = np.array([None, BULLISH_DIVERGENCE, BEARISH_DIVERGENCE], dtype=object)
+VOLUME_LABELS = np.array(
+    [None, WEEKLY_VOLUME_ACTIVITY, EMERGING_BULLISH_MOMENTUM, HIGH_BULLISH_MOMENTUM],
+    dtype=object
+)
+
+def compute_indicators(df, return_state=False):
+    panel = build_bar_panel(df)
+    close = panel['close']
+    volume = panel['volume']
+
+    change_pct = np.full_like(close, np.nan)
+    if close.shape[1] > 1:
+        change_pct[:, 1:] = percent_change(close[:, 1:], close[:, :-1])
+
+    rsi, rs, avg_gain, avg_loss = wilder_rsi(close)
+    divergence = rsi_divergence(close, rsi)
+    vol_short = rolling_mean(volume, VOLUME_SHORT_WINDOW)
+    vol_long = rolling_mean(volume, VOLUME_LONG_WINDOW)
+    regime = volume_regime_codes(vol_short, vol_long, change_pct)
+
+    # Unpack the bar panel back into long format rows
+    idx = (panel['codes'], panel['positions'])
+    results = pd.DataFrame({
+        'symbol': panel['symbols'][panel['codes']],
+        'date': panel['dates'],
+        'change_pct': change_pct[idx],
+        'rsi': rsi[idx],
+        'relative_strength': rs[idx],
+        'rsi_divergence': DIVERGENCE_LABELS[divergence[idx]],
+        'vol_avg_5d': vol_short[idx],
+        'vol_avg_20d': vol_long[idx],
+        'volume_analysis': VOLUME_LABELS[regime[idx]],
+    })
+    if return_state:
+        return results, final_state(panel, rsi, avg_gain, avg_loss)
+    return results
+
+#-----------------------------------
+# Incremental state
+#-----------------------------------
+
+# Everything needed to advance a symbol by one bar without re-reading its
+# history: bar count, last close, the Wilder seed sums and smoothed averages,
+# and the trailing close/RSI/volume windows used by divergence and volume
+# regime detection. advance_state() applies exactly the same arithmetic as the
+# batch kernels, so a daily update reproduces a full recompute bit-for-bit.
+
+STATE_WINDOW = max(DIVERGENCE_LOOKBACK, VOLUME_LONG_WINDOW, VOLUME_SHORT_WINDOW)
+SCALAR_STATE_FIELDS = ['bar_count', 'last_close', 'gain_sum', 'loss_sum', 'avg_gain', 'avg_loss']
+WINDOW_STATE_FIELDS = ['recent_closes', 'recent_rsi', 'recent_volumes']
+
+def empty_state(symbols):
+    n = len(symbols)
+    state = {
+        'symbols': np.asarray(symbols, dtype=object),
+        'last_date': np.full(n, np.datetime64('NaT'), dtype='datetime64[ns]'),
+        'bar_count': np.zeros(n, dtype=np.int64),
+        'last_close': np.full(n, np.nan),
+        'gain_sum': np.zeros(n),
+        'loss_sum': np.zeros(n),
+        'avg_gain': np.full(n, np.nan),
+        'avg_loss': np.full(n, np.nan),
+    }
+    for field in WINDOW_STATE_FIELDS:
+        state[field] = np.full((n, STATE_WINDOW), np.nan)
+    return state
+
+def tail_window(values, bar_counts, width):
+    # Last `width` bars of each symbol, oldest first, NaN padded on the left
+    rows = np.arange(values.shape[0])[:, None]
+    idx = bar_counts[:, None] - width + np.arange(width)[None, :]
+    gathered = values[rows, np.clip(idx, 0, None)] if values.shape[1] else np.full(idx.shape, np.nan)
+    return np.where(idx >= 0, gathered, np.nan)
+
+def final_state(panel, rsi, avg_gain, avg_loss, period=RSI_PERIOD):
+    close = panel['close']
+    volume = panel['volume']
+    n_symbols = close.shape[0]
+    bar_counts = np.bincount(panel['codes'], minlength=n_symbols).astype(np.int64)
+    rows = np.arange(n_symbols)
+    last = np.clip(bar_counts - 1, 0, None)
+
+    state = empty_state(panel['symbols'])
+    state['last_date'] = (
+        pd.Series(panel['dates']).groupby(panel['codes']).max()
+        .reindex(rows).to_numpy(dtype='datetime64[ns]')
+    )
+    state['bar_count'] = bar_counts
+    if close.shape[1] == 0:
+        return state
+    state['last_close'] = close[rows, last]
+    state['avg_gain'] = avg_gain[rows, last]
+    state['avg_loss'] = avg_loss[rows, last]
+
+    # Seed sums only matter while a symbol is still inside its first `period` changes
+    _, gains, losses = split_changes(close)
+    for k in range(min(period, gains.shape[1])):
+        inside = k < bar_counts - 1
+        state['gain_sum'] = np.where(inside, state['gain_sum'] + gains[:, k], state['gain_sum'])
+        state['loss_sum'] = np.where(inside, state['loss_sum'] + losses[:, k], state['loss_sum'])
+
+    state['recent_closes'] = tail_window(close, bar_counts, STATE_WINDOW)
+    state['recent_rsi'] = tail_window(rsi, bar_counts, STATE_WINDOW)
+    state['recent_volumes'] = tail_window(volume, bar_counts, STATE_WINDOW)
+    return state
+
+def window_mean(window, width):
+    total = window[:, -width].copy()
+    for k in range(width - 1, 0, -1):
+        total = total + window[:, -k]
+    return total / width
+
+def advance_state(state, sel, date, close, volume, period=RSI_PERIOD):
+    # Advance the symbols at indices `sel` by one bar; returns that bar's indicators
+    n = state['bar_count'][sel]
+    prev_close = state['last_close'][sel]
+
+    change_pct = percent_change(close, prev_close)
+    delta = close - prev_close
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    gain[np.isnan(delta)] = np.nan
+    loss[np.isnan(delta)] = np.nan
+
+    warming = (n >= 1) & (n <= period)
+    gain_sum = np.where(warming, state['gain_sum'][sel] + gain, state['gain_sum'][sel])
+    loss_sum = np.where(warming, state['loss_sum'][sel] + loss, state['loss_sum'][sel])
+
+    avg_gain = state['avg_gain'][sel]
+    avg_loss = state['avg_loss'][sel]
+    avg_gain = np.where(n == period, gain_sum / period,
+                        np.where(n > period, (avg_gain * (period - 1) + gain) / period, avg_gain))
+    avg_loss = np.where(n == period, loss_sum / period,
+                        np.where(n > period, (avg_loss * (period - 1) + loss) / period, avg_loss))
+    rsi, rs = rsi_from_averages(avg_gain, avg_loss)
+
+    prior_closes = state['recent_closes'][sel][:, -DIVERGENCE_LOOKBACK:]
+    prior_rsi = state['recent_rsi'][sel][:, -DIVERGENCE_LOOKBACK:]
+    with np.errstate(invalid='ignore'):
+        divergence = divergence_codes(close, rsi, prior_closes, prior_rsi)
+    divergence[n < DIVERGENCE_LOOKBACK] = 0
+
+    recent_volumes = np.concatenate([state['recent_volumes'][sel][:, 1:], volume[:, None]], axis=1)
+    vol_short = window_mean(recent_volumes, VOLUME_SHORT_WINDOW)
+    vol_long = window_mean(recent_volumes, VOLUME_LONG_WINDOW)
+    regime = volume_regime_codes(vol_short, vol_long, change_pct)
+
+    state['bar_count'][sel] = n + 1
+    state['last_date'][sel] = np.datetime64(date, 'ns')
+    state['last_close'][sel] = close
+    state['gain_sum'][sel] = gain_sum
+    state['loss_sum'][sel] = loss_sum
+    state['avg_gain'][sel] = avg_gain
+    state['avg_loss'][sel] = avg_loss
+    state['recent_closes'][sel] = np.concatenate([state['recent_closes'][sel][:, 1:], close[:, None]], axis=1)
+    state['recent_rsi'][sel] = np.concatenate([state['recent_rsi'][sel][:, 1:], rsi[:, None]], axis=1)
+    state['recent_volumes'][sel] = recent_volumes
+
+    return pd.DataFrame({
+        'symbol': state['symbols'][sel],
+        'date': pd.Timestamp(date),
+        'change_pct': change_pct,
+        'rsi': rsi,
+        'relative_strength': rs,
+        'rsi_divergence': DIVERGENCE_LABELS[divergence],
+        'vol_avg_5d': vol_short,
+        'vol_avg_20d': vol_long,
+        'volume_analysis': VOLUME_LABELS[regime],
+    })
+
+def advance_bars(state, bars):
+    # Apply pending bars in date order, adding state rows for new listings
+    known = set(state['symbols'])
+    new_symbols = sorted(set(bars['symbol']) - known)
+    if new_symbols:
+        extra = empty_state(new_symbols)
+        state = {key: np.concatenate([state[key], extra[key]]) for key in state}
+    index = pd.Index(state['symbols'])
+
+    frames = []
+    for date, day in bars.sort_values(['date', 'symbol']).groupby('date', sort=True):
+        sel = index.get_indexer(day['symbol'])
+        frames.append(advance_state(
+            state, sel, date,
+            day['closing_price'].to_numpy(dtype='float64'),
+            day['volume'].to_numpy(dtype='float64')
+        ))
+    results = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['symbol', 'date'] + INDICATOR_COLUMNS)
+    return results, state
+
+#-----------------------------------
+# Database I/O
+#-----------------------------------
+
+def load_ohlcv(conn, since=None, symbols=None):
+    query = """
+        SELECT symbol, date, closing_price::float8, volume::float8
+        FROM stock_analysis_all_results
+    """
+    where, params = [], []
+    if since is not None:
+        where.append("date >= %s")
+        params.append(since)
+    if symbols is not None:
+        where.append("symbol = ANY(%s)")
+        params.append(list(symbols))
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+    df = pd.DataFrame(rows, columns=['symbol', 'date', 'closing_price', 'volume'])
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+def write_indicators(conn, results):
+    # Infinite ratios (no losses in the window) are stored as NULL
+    numeric = results[INDICATOR_COLUMNS].select_dtypes(include='number').columns
+    results = results.assign(**{c: results[c].replace([np.inf, -np.inf], np.nan) for c in numeric})
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE indicator_updates (
+                symbol VARCHAR(20),
+                date DATE,
+                change_pct DOUBLE PRECISION,
+                rsi DOUBLE PRECISION,
+                relative_strength DOUBLE PRECISION,
+                rsi_divergence TEXT,
+                vol_avg_5d DOUBLE PRECISION,
+                vol_avg_20d DOUBLE PRECISION,
+                volume_analysis TEXT
+            ) ON COMMIT DROP;
+        """)
+        copy_frame(cur, 'indicator_updates', ['symbol', 'date'] + INDICATOR_COLUMNS, results)
+        assignments = ", ".join(f"{col} = u.{col}" for col in INDICATOR_COLUMNS)
+        cur.execute(f"""
+            UPDATE stock_analysis_all_results t
+            SET {assignments}
+            FROM indicator_updates u
+            WHERE t.symbol = u.symbol AND t.date = u.date;
+        """)
+        updated = cur.rowcount
+    conn.commit()
+    return updated
+
+def load_state(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT symbol, last_date, bar_count, last_close, gain_sum, loss_sum,
+                   avg_gain, avg_loss, recent_closes, recent_rsi, recent_volumes
+            FROM indicator_state
+            ORDER BY symbol;
+        """)
+        rows = cur.fetchall()
+    state = empty_state([row[0] for row in rows])
+    if not rows:
+        return state
+    state['last_date'] = pd.to_datetime([row[1] for row in rows]).to_numpy(dtype='datetime64[ns]')
+    for i, field in enumerate(SCALAR_STATE_FIELDS, start=2):
+        state[field] = np.array([row[i] for row in rows], dtype=state[field].dtype)
+    for i, field in enumerate(WINDOW_STATE_FIELDS, start=8):
+        state[field] = np.array([row[i] for row in rows], dtype='float64').reshape(len(rows), STATE_WINDOW)
+    return state
+
+def save_state(conn, state, only=None):
+    sel = np.arange(len(state['symbols'])) if only is None else only
+    records = []
+    for i in sel:
+        records.append((
+            state['symbols'][i],
+            pd.Timestamp(state['last_date'][i]).date() if not np.isnat(state['last_date'][i]) else None,
+            int(state['bar_count'][i]),
+            float(state['last_close'][i]),
+            float(state['gain_sum'][i]),
+            float(state['loss_sum'][i]),
+            float(state['avg_gain'][i]),
+            float(state['avg_loss'][i]),
+            state['recent_closes'][i].tolist(),
+            state['recent_rsi'][i].tolist(),
+            state['recent_volumes'][i].tolist(),
+        ))
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO indicator_state (
+                symbol, last_date, bar_count, last_close, gain_sum, loss_sum,
+                avg_gain, avg_loss, recent_closes, recent_rsi, recent_volumes
+            ) VALUES %s
+            ON CONFLICT (symbol) DO UPDATE SET
+                last_date = EXCLUDED.last_date,
+                bar_count = EXCLUDED.bar_count,
+                last_close = EXCLUDED.last_close,
+                gain_sum = EXCLUDED.gain_sum,
+                loss_sum = EXCLUDED.loss_sum,
+                avg_gain = EXCLUDED.avg_gain,
+                avg_loss = EXCLUDED.avg_loss,
+                recent_closes = EXCLUDED.recent_closes,
+                recent_rsi = EXCLUDED.recent_rsi,
+                recent_volumes = EXCLUDED.recent_volumes,
+                updated_at = CURRENT_TIMESTAMP;
+        """, records, page_size=1000)
+    conn.commit()
+
+def load_pending_bars(conn):
+    # Bars newer than each symbol's persisted state (all bars for new listings)
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT r.symbol, r.date, r.closing_price::float8, r.volume::float8
+            FROM stock_analysis_all_results r
+            LEFT JOIN indicator_state s ON s.symbol = r.symbol
+            WHERE s.last_date IS NULL OR r.date > s.last_date;
+        """)
+        rows = cur.fetchall()
+    df = pd.DataFrame(rows, columns=['symbol', 'date', 'closing_price', 'volume'])
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+def rebuild_all():
+    conn = init_connection()
+    try:
+        ensure_indicator_columns(conn)
+        ensure_indicator_state_table(conn)
+        started = time.perf_counter()
+        df = load_ohlcv(conn)
+        loaded = time.perf_counter()
+        results, state = compute_indicators(df, return_state=True)
+        computed = time.perf_counter()
+        updated = write_indicators(conn, results)
+        save_state(conn, state)
+        finished = time.perf_counter()
+    finally:
+        conn.close()
+    print(f"Loaded {len(df)} rows for {df['symbol'].nunique()} symbols in {loaded - started:.2f}s")
+    print(f"Computed indicators in {computed - loaded:.2f}s")
+    print(f"Updated {updated} rows in {finished - computed:.2f}s")
+    return updated
+
+def rebuild_symbols(symbols):
+    # Full recompute of a few symbols, e.g. after a correction to a past bar
+    conn = init_connection()
+    try:
+        ensure_indicator_columns(conn)
+        ensure_indicator_state_table(conn)
+        started = time.perf_counter()
+        df = load_ohlcv(conn, symbols=symbols)
+        if len(df) == 0:
+            return 0
+        results, state = compute_indicators(df, return_state=True)
+        updated = write_indicators(conn, results)
+        save_state(conn, state)
+        finished = time.perf_counter()
+    finally:
+        conn.close()
+    print(f"Rebuilt indicators for {len(state['symbols'])} symbols, updated {updated} rows in {finished - started:.2f}s")
+    return updated
+
+def update_daily():
+    conn = init_connection()
+    try:
+        ensure_indicator_columns(conn)
+        ensure_indicator_state_table(conn)
+        started = time.perf_counter()
+        state = load_state(conn)
+        if len(state['symbols']) == 0:
+            conn.close()
+            conn = None
+            print("No persisted indicator state found, running a full rebuild")
+            return rebuild_all()
+        bars = load_pending_bars(conn)
+        results, state = advance_bars(state, bars)
+        updated = write_indicators(conn, results) if len(results) else 0
+        touched = np.flatnonzero(pd.Index(state['symbols']).isin(bars['symbol'].unique()))
+        if len(touched):
+            save_state(conn, state, only=touched)
+        finished = time.perf_counter()
+    finally:
+        if conn is not None:
+            conn.close()
+    print(f"Advanced {len(touched)} symbols by {bars['date'].nunique()} day(s), updated {updated} rows in {finished - started:.2f}s")
+    return updated
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Compute technical indicators for stock_analysis_all_results")
+    parser.add_argument('--daily', action='store_true', help="advance persisted indicator state by the pending bars only")
+    args = parser.parse_args()
+    if args.daily:
+        update_daily()
+    else:
+        rebuild_all()
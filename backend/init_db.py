@@ -19,6 +19,31 @@ def init_connection():
         port=url.port or "5432"
     )
 
+SAMPLE_FINANCIAL_METRICS = [
+    ('AAF.N0000', 2.50, 15.75, 0.75, 1250000, 15.8, 8.2),
+    ('BALA.N0000', 1.85, 12.30, 0.50, 925000, 12.4, 6.5),
+    ('CIC.X0000', 3.20, 18.60, 1.00, 1580000, 17.2, 9.1),
+    ('ELPL.N0000', 1.65, 10.80, 0.40, 820000, 11.5, 5.8),
+    ('GRAN.N0000', 4.10, 22.50, 1.20, 2050000, 18.3, 9.8),
+    ('HBS.N0000', 2.30, 14.20, 0.65, 1150000, 14.2, 7.5),
+    ('LIOC.N0000', 5.40, 28.70, 1.50, 2700000, 19.5, 10.2),
+    ('LVEF.N0000', 1.95, 12.80, 0.55, 975000, 13.1, 6.9),
+    ('PARQ.N0000', 2.80, 16.40, 0.80, 1400000, 16.5, 8.8),
+    ('SDF.N0000', 2.15, 13.60, 0.60, 1075000, 13.8, 7.2),
+    ('SHOT.N0000', 3.50, 19.80, 1.10, 1750000, 17.8, 9.4),
+    ('UML.N0000', 2.05, 13.20, 0.58, 1025000, 13.5, 7.0),
+    ('AMF.N0000', 2.70, 16.10, 0.78, 1350000, 16.2, 8.6),
+]
+
+def seed_financial_metrics(conn):
+    from bulk_ingest import copy_records
+    with conn.cursor() as cur:
+        copy_records(
+            cur, 'financial_metrics',
+            ['code', 'eps_ttm', 'bvps', 'dps', 'cum_np', 'roe', 'roa_ttm'],
+            SAMPLE_FINANCIAL_METRICS
+        )
+
 def init_database():
     try:
         conn = init_connection()
@@ -53,23 +78,7 @@ def init_database():
                 """)
                 
                 # Insert some sample data for testing
-                cur.execute("""
-                    INSERT INTO financial_metrics (code, eps_ttm, bvps, dps, cum_np, roe, roa_ttm)
-                    VALUES
-                        ('AAF.N0000', 2.50, 15.75, 0.75, 1250000, 15.8, 8.2),
-                        ('BALA.N0000', 1.85, 12.30, 0.50, 925000, 12.4, 6.5),
-                        ('CIC.X0000', 3.20, 18.60, 1.00, 1580000, 17.2, 9.1),
-                        ('ELPL.N0000', 1.65, 10.80, 0.40, 820000, 11.5, 5.8),
-                        ('GRAN.N0000', 4.10, 22.50, 1.20, 2050000, 18.3, 9.8),
-                        ('HBS.N0000', 2.30, 14.20, 0.65, 1150000, 14.2, 7.5),
-                        ('LIOC.N0000', 5.40, 28.70, 1.50, 2700000, 19.5, 10.2),
-                        ('LVEF.N0000', 1.95, 12.80, 0.55, 975000, 13.1, 6.9),
-                        ('PARQ.N0000', 2.80, 16.40, 0.80, 1400000, 16.5, 8.8),
-                        ('SDF.N0000', 2.15, 13.60, 0.60, 1075000, 13.8, 7.2),
-                        ('SHOT.N0000', 3.50, 19.80, 1.10, 1750000, 17.8, 9.4),
-                        ('UML.N0000', 2.05, 13.20, 0.58, 1025000, 13.5, 7.0),
-                        ('AMF.N0000', 2.70, 16.10, 0.78, 1350000, 16.2, 8.6);
-                """)
+                seed_financial_metrics(conn)
                 
                 conn.commit()
                 print("Financial metrics table created and sample data inserted successfully.")
@@ -85,6 +94,7 @@ def init_database():
             columns = [row[0] for row in cur.fetchall()]
             print(f"Existing columns: {columns}")
             
+        ensure_ingest_sequence(conn)
         conn.close()
         print("Database initialization completed.")
         
@@ -93,5 +103,281 @@ def init_database():
         import traceback
         traceback.print_exc()
 
+def ensure_indicator_columns(conn):
+    # Columns produced by the batch indicator engine (indicators.py)
+    with conn.cursor() as cur:
+        cur.execute("""
+            ALTER TABLE stock_analysis_all_results
+                ADD COLUMN IF NOT EXISTS change_pct NUMERIC,
+                ADD COLUMN IF NOT EXISTS rsi NUMERIC,
+                ADD COLUMN IF NOT EXISTS relative_strength NUMERIC,
+                ADD COLUMN IF NOT EXISTS rsi_divergence TEXT,
+                ADD COLUMN IF NOT EXISTS vol_avg_5d NUMERIC,
+                ADD COLUMN IF NOT EXISTS vol_avg_20d NUMERIC,
+                ADD COLUMN IF NOT EXISTS volume_analysis TEXT;
+        """)
+    conn.commit()
+
+def ensure_indicator_state_table(conn):
+    # Per-symbol rolling state used by the daily incremental indicator update
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS indicator_state (
+                symbol VARCHAR(20) PRIMARY KEY,
+                last_date DATE,
+                bar_count INTEGER NOT NULL DEFAULT 0,
+                last_close DOUBLE PRECISION,
+                gain_sum DOUBLE PRECISION,
+                loss_sum DOUBLE PRECISION,
+                avg_gain DOUBLE PRECISION,
+                avg_loss DOUBLE PRECISION,
+                recent_closes DOUBLE PRECISION[],
+                recent_rsi DOUBLE PRECISION[],
+                recent_volumes DOUBLE PRECISION[],
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+    conn.commit()
+
+# Advisory lock key held by every transaction that writes stock_analysis_all_results
+INGEST_LOCK_KEY = 7304117
+# Advisory lock key held by every transaction that creates or migrates schema,
+# so processes starting together do not race each other's DDL
+SCHEMA_LOCK_KEY = 7304118
+
+def lock_schema(cur):
+    # Held until the transaction ends; re-entrant within a session
+    cur.execute("SELECT pg_advisory_xact_lock(%s);", (SCHEMA_LOCK_KEY,))
+
+def ensure_ingest_sequence(conn):
+    # Monotonic change counter for stock_analysis_all_results: every insert or
+    # update stamps the row with the next sequence value, so clients can ask
+    # for rows changed since the last value they saw. Sequence values are
+    # handed out before commit, so writers are serialised on an advisory lock
+    # held until commit: a transaction only draws values after every earlier
+    # writer has committed, and MAX(ingest_seq) over committed rows never has
+    # an uncommitted lower value behind it.
+    with conn.cursor() as cur:
+        lock_schema(cur)
+        cur.execute("CREATE SEQUENCE IF NOT EXISTS stock_analysis_ingest_seq;")
+        cur.execute("""
+            ALTER TABLE stock_analysis_all_results
+                ADD COLUMN IF NOT EXISTS ingest_seq BIGINT;
+        """)
+        cur.execute("""
+            UPDATE stock_analysis_all_results
+            SET ingest_seq = nextval('stock_analysis_ingest_seq')
+            WHERE ingest_seq IS NULL;
+        """)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION stamp_ingest_seq() RETURNS trigger AS $$
+            BEGIN
+                NEW.ingest_seq := nextval('stock_analysis_ingest_seq');
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cur.execute("""
+            SELECT 1 FROM pg_trigger
+            WHERE tgname = 'stock_analysis_ingest_seq_trg'
+              AND tgrelid = 'stock_analysis_all_results'::regclass;
+        """)
+        if cur.fetchone() is None:
+            cur.execute("""
+                CREATE TRIGGER stock_analysis_ingest_seq_trg
+                    BEFORE INSERT OR UPDATE ON stock_analysis_all_results
+                    FOR EACH ROW EXECUTE FUNCTION stamp_ingest_seq();
+            """)
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION lock_ingest_seq() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_advisory_xact_lock({INGEST_LOCK_KEY});
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cur.execute("""
+            SELECT 1 FROM pg_trigger
+            WHERE tgname = 'stock_analysis_ingest_lock_trg'
+              AND tgrelid = 'stock_analysis_all_results'::regclass;
+        """)
+        if cur.fetchone() is None:
+            cur.execute("""
+                CREATE TRIGGER stock_analysis_ingest_lock_trg
+                    BEFORE INSERT OR UPDATE ON stock_analysis_all_results
+                    FOR EACH STATEMENT EXECUTE FUNCTION lock_ingest_seq();
+            """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_stock_analysis_ingest_seq
+                ON stock_analysis_all_results (ingest_seq);
+        """)
+    conn.commit()
+
+def ensure_table_stats_tables(conn):
+    # Per-symbol data statistics maintained by table_stats.py
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS symbol_stats (
+                symbol VARCHAR(20) PRIMARY KEY,
+                row_count INTEGER NOT NULL,
+                first_date DATE,
+                last_date DATE,
+                null_counts JSONB NOT NULL,
+                zero_counts JSONB NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS table_stats_state (
+                table_name TEXT PRIMARY KEY,
+                through_seq BIGINT,
+                refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+    conn.commit()
+
+def ensure_predictor_picks_tables(conn):
+    # Per-day /cse-predictor picks maintained by predictor_picks.py
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS predictor_picks (
+                date DATE NOT NULL,
+                tier SMALLINT NOT NULL,
+                rank INTEGER NOT NULL,
+                symbol VARCHAR(20),
+                pick JSONB NOT NULL,
+                PRIMARY KEY (date, tier, rank)
+            );
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_predictor_picks_symbol
+                ON predictor_picks (symbol);
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS predictor_picks_state (
+                id INTEGER PRIMARY KEY,
+                through_seq BIGINT,
+                refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+    conn.commit()
+
+def ensure_dividend_tables(conn):
+    # Per-company dividend aggregates maintained by dividends.py
+    with conn.cursor() as cur:
+        lock_schema(cur)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS dividend_aggregates (
+                company_code VARCHAR(20) PRIMARY KEY,
+                symbol VARCHAR(20),
+                dividend_count INTEGER NOT NULL,
+                first_date DATE,
+                last_date DATE,
+                last_dps NUMERIC,
+                ttm_dps NUMERIC,
+                ttm_payouts INTEGER,
+                prior_ttm_dps NUMERIC,
+                dps_growth_pct NUMERIC,
+                dps_cagr_3y_pct NUMERIC,
+                payouts_per_year NUMERIC,
+                payout_months SMALLINT[],
+                latest_close NUMERIC,
+                close_date DATE,
+                dividend_yield_pct NUMERIC,
+                yield_basis VARCHAR(4),
+                as_of DATE NOT NULL,
+                refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+    conn.commit()
+
+def ensure_alert_tables(conn):
+    # Alert subscriptions, evaluation state and the outbox written by alerts.py
+    with conn.cursor() as cur:
+        lock_schema(cur)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS alert_subscriptions (
+                id SERIAL PRIMARY KEY,
+                phone_number VARCHAR(20) NOT NULL,
+                symbol VARCHAR(20) NOT NULL,
+                kind VARCHAR(20) NOT NULL,
+                threshold NUMERIC NOT NULL,
+                active BOOLEAN NOT NULL DEFAULT TRUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_alert_subscriptions_phone
+                ON alert_subscriptions (phone_number);
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS alert_state (
+                id INTEGER PRIMARY KEY,
+                through_seq BIGINT,
+                evaluated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        # One alert per subscription and trading day, however often it is evaluated
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS alert_outbox (
+                id BIGSERIAL PRIMARY KEY,
+                subscription_id INTEGER NOT NULL,
+                phone_number VARCHAR(20) NOT NULL,
+                symbol VARCHAR(20) NOT NULL,
+                kind VARCHAR(20) NOT NULL,
+                threshold NUMERIC,
+                previous_value NUMERIC,
+                observed_value NUMERIC,
+                event_date DATE NOT NULL,
+                source VARCHAR(10) NOT NULL,
+                message TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                delivered_at TIMESTAMP,
+                UNIQUE (subscription_id, event_date)
+            );
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_alert_outbox_undelivered
+                ON alert_outbox (created_at) WHERE delivered_at IS NULL;
+        """)
+    conn.commit()
+
+# Natural keys used by bulk_ingest.py for upserts. A dividend can be
+# announced more than once on the same day, so the rate is part of its key.
+INGEST_KEYS = {
+    'stock_analysis_all_results': ['symbol', 'date'],
+    'financial_metrics': ['code'],
+    'dividend_history': ['company_code', 'announcement_date', 'rate_of_dividend'],
+}
+
+def ensure_ingest_keys(conn, table=None):
+    # Fails with an IntegrityError while duplicate keys exist (see dedupe_ingest_keys)
+    tables = [table] if table else list(INGEST_KEYS)
+    with conn.cursor() as cur:
+        for name in tables:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (name,))
+            if not cur.fetchone()[0]:
+                continue
+            cur.execute(f"""
+                CREATE UNIQUE INDEX IF NOT EXISTS ux_{name}_ingest_key
+                    ON {name} ({', '.join(INGEST_KEYS[name])});
+            """)
+    conn.commit()
+
+def dedupe_ingest_keys(conn, table):
+    # Keeps the most recently inserted row (highest id) for every key
+    keys = INGEST_KEYS[table]
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            DELETE FROM {table} t
+            USING {table} newer
+            WHERE {' AND '.join(f't.{k} = newer.{k}' for k in keys)}
+              AND t.id < newer.id;
+        """)
+        removed = cur.rowcount
+    conn.commit()
+    return removed
+
 if __name__ == "__main__":
     init_database() 
\ No newline at end of file
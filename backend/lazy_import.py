@@ -0,0 +1,28 @@
+import importlib
+import threading
+
+# Stand-in for a module that is only imported on first attribute access.
+# Used to keep pandas, numpy, tvDatafeed and our analytics modules off the
+# startup path so the server can bind and answer cheap routes immediately.
+
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self.load(), attr)
@@ -0,0 +1,144 @@
+import numpy as np
+
+from panel_store import NUMERIC_FIELDS
+
+#-----------------------------------
+# Cross-sectional leaderboards
+#-----------------------------------
+
+# Top / bottom K symbols by a numeric panel field for one trading day, or
+# aggregated over a trailing window of days. Values come from the panel's
+# contiguous day slices; np.argpartition selects the K candidates in linear
+# time and only those K are sorted, instead of sorting the whole market.
+
+DEFAULT_K = 10
+MAX_K = 100
+MAX_WINDOW = 250
+
+# How a multi-day window collapses to one value per symbol. Prices and
+# change_pct become the return over the window, flows are summed and the
+# remaining (oscillator-like) fields are averaged.
+WINDOW_AGGREGATES = {
+    'closing_price': 'return',
+    'change_pct': 'return',
+    'volume': 'sum',
+    'turnover': 'sum',
+}
+
+# Boards returned when no field is requested: (name, field, largest first)
+DEFAULT_BOARDS = [
+    ('top_gainers', 'change_pct', True),
+    ('top_losers', 'change_pct', False),
+    ('turnover_leaders', 'turnover', True),
+    ('relative_strength_leaders', 'relative_strength', True),
+]
+
+# Context columns attached to every entry
+CONTEXT_FIELDS = ['closing_price', 'change_pct', 'turnover']
+
+class LeaderboardError(ValueError):
+    pass
+
+def window_values(panel, field, window, j):
+    if window == 1:
+        return panel.field(field)[:, j]
+    start = max(0, j - window + 1)
+    how = WINDOW_AGGREGATES.get(field, 'mean')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if how == 'return':
+            prices = panel.field('closing_price')[:, start:j + 1]
+            # First and last traded close inside the window
+            traded = ~np.isnan(prices)
+            first = np.argmax(traded, axis=1)
+            last = prices.shape[1] - 1 - np.argmax(traded[:, ::-1], axis=1)
+            rows = np.arange(prices.shape[0])
+            values = (prices[rows, last] / prices[rows, first] - 1) * 100
+            values[~traded.any(axis=1) | (first == last)] = np.nan
+            return values
+        block = panel.field(field)[:, start:j + 1]
+        counts = (~np.isnan(block)).sum(axis=1)
+        totals = np.nansum(block, axis=1)
+        if how == 'sum':
+            return np.where(counts > 0, totals, np.nan)
+        return np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+
+def select_top(values, k, largest=True):
+    # Indices of the K largest (or smallest) finite values, best first; ties
+    # keep the panel's symbol order
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+    candidates = np.flatnonzero(np.isfinite(values))
+    keyed = -values[candidates] if largest else values[candidates]
+    if len(candidates) > k:
+        part = np.argpartition(keyed, k - 1)[:k]
+        # Everything tied with the K-th value stays eligible, so the cut is stable
+        cutoff = keyed[part].max()
+        part = np.flatnonzero(keyed <= cutoff)
+        candidates, keyed = candidates[part], keyed[part]
+    order = np.lexsort((candidates, keyed))[:k]
+    return candidates[order]
+
+def entries(panel, j, field, values, picked):
+    context = {name: panel.field(name)[picked, j] for name in CONTEXT_FIELDS}
+    board = []
+    for rank, i in enumerate(picked, 1):
+        entry = {'rank': rank, 'symbol': panel.symbols[i], 'value': float(values[i])}
+        for name in CONTEXT_FIELDS:
+            value = context[name][rank - 1]
+            entry[name] = float(value) if np.isfinite(value) else None
+        board.append(entry)
+    return board
+
+def validate_params(field, window, k, side):
+    if field is not None and field not in NUMERIC_FIELDS:
+        raise LeaderboardError(f"Unknown field '{field}'; expected one of {', '.join(NUMERIC_FIELDS)}")
+    if side not in ('top', 'bottom', 'both'):
+        raise LeaderboardError("side must be top, bottom or both")
+    if not 1 <= k <= MAX_K:
+        raise LeaderboardError(f"k must be between 1 and {MAX_K}")
+    if not 1 <= window <= MAX_WINDOW:
+        raise LeaderboardError(f"window must be between 1 and {MAX_WINDOW}")
+
+def build_leaderboard(panel, field=None, date=None, window=1, k=DEFAULT_K, side='both', min_turnover=None):
+    validate_params(field, window, k, side)
+
+    j = panel.day_index(date) if panel is not None else None
+    if j is None:
+        return {'date': None, 'window': window, 'boards': {}}
+
+    eligible = None
+    if min_turnover is not None:
+        eligible = window_values(panel, 'turnover', window, j) >= min_turnover
+
+    if field is None:
+        specs = DEFAULT_BOARDS
+    else:
+        specs = []
+        if side in ('top', 'both'):
+            specs.append(('top', field, True))
+        if side in ('bottom', 'both'):
+            specs.append(('bottom', field, False))
+
+    boards = {}
+    cache = {}
+    for name, board_field, largest in specs:
+        if board_field not in cache:
+            values = window_values(panel, board_field, window, j)
+            if eligible is not None:
+                values = np.where(eligible, values, np.nan)
+            cache[board_field] = values
+        values = cache[board_field]
+        boards[name] = {
+            'field': board_field,
+            'order': 'desc' if largest else 'asc',
+            'entries': entries(panel, j, board_field, values, select_top(values, k, largest)),
+        }
+
+    start = max(0, j - window + 1)
+    return {
+        'date': str(panel.dates[j]),
+        'window_start': str(panel.dates[start]),
+        'window': window,
+        'universe': int(np.isfinite(panel.field('closing_price')[:, j]).sum()),
+        'boards': boards,
+    }
@@ -0,0 +1,280 @@
+import contextlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from init_db import init_connection
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+#-----------------------------------
+# Dense symbols x trading-days panel
+#-----------------------------------
+
+# One float64 array per numeric field, shaped (symbol id, trading-day id) and
+# stored column-major so a single day's cross-section is a contiguous slice.
+# Categorical text columns are stored as int8 codes plus their label list.
+# Files are written as .npy and opened with mmap_mode='r', so loading a panel
+# only maps the files and slices are zero-copy views over the page cache.
+
+PANEL_DIR = os.environ.get(
+    "PANEL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "panel")
+)
+
+NUMERIC_FIELDS = [
+    'closing_price', 'change_pct', 'volume', 'turnover', 'rsi',
+    'relative_strength', 'vol_avg_5d', 'vol_avg_20d'
+]
+CATEGORY_FIELDS = ['rsi_divergence', 'volume_analysis']
+
+class PricePanel:
+    def __init__(self, symbols, dates, fields, categories, watermark=None):
+        self.symbols = np.asarray(symbols, dtype=object)
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.fields = fields
+        self.categories = categories
+        self.watermark = watermark
+        self.symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    @property
+    def shape(self):
+        return (len(self.symbols), len(self.dates))
+
+    def field(self, name):
+        return self.fields[name]
+
+    def day_index(self, date=None):
+        # Latest trading day on or before `date` (latest overall when omitted)
+        if len(self.dates) == 0:
+            return None
+        if date is None:
+            return len(self.dates) - 1
+        pos = int(np.searchsorted(self.dates, np.datetime64(pd.to_datetime(date).date(), 'D'), side='right')) - 1
+        return pos if pos >= 0 else None
+
+    def cross_section(self, name, date=None):
+        j = self.day_index(date)
+        if j is None:
+            return None
+        return self.fields[name][:, j]
+
+    def window(self, name, days, date=None):
+        j = self.day_index(date)
+        if j is None:
+            return None
+        return self.fields[name][:, max(0, j - days + 1):j + 1]
+
+    def history(self, symbol, name):
+        i = self.symbol_ids.get(symbol)
+        if i is None:
+            return None
+        return self.fields[name][i, :]
+
+    def labels(self, name, codes):
+        _, labels = self.categories[name]
+        lookup = np.array([None] + list(labels), dtype=object)
+        return lookup[codes + 1]
+
+def build_panel(df, watermark=None):
+    df = df.dropna(subset=['symbol', 'date'])
+    sym_codes, symbols = pd.factorize(df['symbol'], sort=True)
+    day_values = pd.to_datetime(df['date']).dt.normalize()
+    day_codes, dates = pd.factorize(day_values, sort=True)
+    shape = (len(symbols), len(dates))
+
+    fields = {}
+    for name in NUMERIC_FIELDS:
+        values = np.full(shape, np.nan, order='F')
+        if name in df.columns:
+            values[sym_codes, day_codes] = pd.to_numeric(df[name], errors='coerce').to_numpy(dtype='float64')
+        fields[name] = values
+
+    categories = {}
+    for name in CATEGORY_FIELDS:
+        codes = np.full(shape, -1, dtype=np.int8, order='F')
+        labels = []
+        if name in df.columns:
+            value_codes, labels = pd.factorize(df[name], sort=True)
+            codes[sym_codes, day_codes] = value_codes
+            labels = [str(label) for label in labels]
+        categories[name] = (codes, labels)
+
+    return PricePanel(
+        symbols=list(symbols),
+        dates=np.asarray(dates, dtype='datetime64[D]'),
+        fields=fields,
+        categories=categories,
+        watermark=watermark
+    )
+
+#-----------------------------------
+# Persistence
+#-----------------------------------
+
+# Each save goes to a fresh version directory and CURRENT is swapped with
+# os.replace, so readers never map a half-written panel and processes that
+# still map an older version keep working until they reload. Saves from
+# different processes are serialised on a lock file in the directory, and
+# pruning only ever removes versions older than the one CURRENT names.
+
+@contextlib.contextmanager
+def panel_lock(directory=PANEL_DIR):
+    # Host-wide lock on a panel directory, shared by every worker process
+    os.makedirs(directory, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, ".lock"), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def version_key(name):
+    # Version directories are named v<milliseconds>-<pid>
+    stamp, _, pid = name[1:].partition('-')
+    return (int(stamp), pid) if stamp.isdigit() else None
+
+def prune_versions(directory, current):
+    # Keep the current version and the one before it, for readers that have
+    # not reloaded yet; newer directories may be another writer's work
+    current_key = version_key(current)
+    older = sorted(
+        (d for d in os.listdir(directory)
+         if d.startswith('v') and version_key(d) is not None and version_key(d) < current_key),
+        key=version_key
+    )
+    for old in older[:-1]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+def save_panel(panel, directory=PANEL_DIR):
+    with panel_lock(directory):
+        return write_panel(panel, directory)
+
+def write_panel(panel, directory):
+    # Callers hold panel_lock
+    os.makedirs(directory, exist_ok=True)
+    version = f"v{int(time.time() * 1000)}-{os.getpid()}"
+    target = os.path.join(directory, version)
+    os.makedirs(target)
+
+    for name, values in panel.fields.items():
+        np.save(os.path.join(target, f"{name}.npy"), np.asfortranarray(values))
+    for name, (codes, _) in panel.categories.items():
+        np.save(os.path.join(target, f"{name}.codes.npy"), np.asfortranarray(codes))
+
+    meta = {
+        'symbols': [str(s) for s in panel.symbols],
+        'dates': [str(d) for d in panel.dates],
+        'numeric_fields': list(panel.fields),
+        'categories': {name: labels for name, (_, labels) in panel.categories.items()},
+        'watermark': panel.watermark,
+    }
+    with open(os.path.join(target, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    pointer = os.path.join(directory, "CURRENT")
+    with open(f"{pointer}.{os.getpid()}.tmp", "w") as f:
+        f.write(version)
+    os.replace(f"{pointer}.{os.getpid()}.tmp", pointer)
+    prune_versions(directory, version)
+    return target
+
+def load_panel(directory=PANEL_DIR):
+    pointer = os.path.join(directory, "CURRENT")
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer) as f:
+        target = os.path.join(directory, f.read().strip())
+    with open(os.path.join(target, "meta.json")) as f:
+        meta = json.load(f)
+
+    fields = {
+        name: np.load(os.path.join(target, f"{name}.npy"), mmap_mode='r')
+        for name in meta['numeric_fields']
+    }
+    categories = {
+        name: (np.load(os.path.join(target, f"{name}.codes.npy"), mmap_mode='r'), labels)
+        for name, labels in meta['categories'].items()
+    }
+    return PricePanel(
+        symbols=meta['symbols'],
+        dates=np.array(meta['dates'], dtype='datetime64[D]'),
+        fields=fields,
+        categories=categories,
+        watermark=meta.get('watermark')
+    )
+
+#-----------------------------------
+# Database refresh
+#-----------------------------------
+
+def ingest_watermark(conn):
+    # Highest committed ingest sequence, None before the migration. Writers are
+    # serialised (see init_db.ensure_ingest_sequence), so no row committed later
+    # can carry a lower value.
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('stock_analysis_ingest_seq') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute("SELECT MAX(ingest_seq) FROM stock_analysis_all_results;")
+        return cur.fetchone()[0]
+
+def market_watermark(conn):
+    # Moves on new trading days and on in-place updates (e.g. indicator recomputes)
+    with conn.cursor() as cur:
+        cur.execute("SELECT MAX(date) FROM stock_analysis_all_results;")
+        latest = cur.fetchone()[0]
+    if latest is None:
+        return None
+    seq = ingest_watermark(conn)
+    return str(latest) if seq is None else f"{latest}#{seq}"
+
+def fetch_panel_frame(conn):
+    columns = ['symbol', 'date'] + NUMERIC_FIELDS + CATEGORY_FIELDS
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = 'stock_analysis_all_results';
+        """)
+        available = {row[0] for row in cur.fetchall()}
+        selected = [c for c in columns if c in available]
+        select_list = ", ".join(f"{c}::float8" if c in NUMERIC_FIELDS else c for c in selected)
+        cur.execute(f"SELECT {select_list} FROM stock_analysis_all_results;")
+        rows = cur.fetchall()
+    return pd.DataFrame(rows, columns=selected)
+
+def refresh_panel(directory=PANEL_DIR, force=False):
+    # Reuse the mapped files while the database watermark is unchanged. When
+    # it moves, one process rebuilds under the panel lock; the others wait for
+    # it and map the files it wrote instead of each reading the whole table.
+    conn = init_connection()
+    try:
+        watermark = market_watermark(conn)
+        panel = None if force else load_panel(directory)
+        if panel is not None and panel.watermark == watermark:
+            return panel
+        with panel_lock(directory):
+            watermark = market_watermark(conn)
+            panel = None if force else load_panel(directory)
+            if panel is not None and panel.watermark == watermark:
+                return panel
+            df = fetch_panel_frame(conn)
+            write_panel(build_panel(df, watermark=watermark), directory)
+    finally:
+        conn.close()
+    return load_panel(directory)
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    panel = refresh_panel(force=True)
+    print(f"Built panel of {panel.shape[0]} symbols x {panel.shape[1]} days in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,231 @@
+import datetime
+import time
+
+from init_db import init_connection, INGEST_KEYS, ensure_ingest_sequence, lock_schema
+
+#-----------------------------------
+# Monthly partitioning of stock_analysis_all_results
+#-----------------------------------
+
+# The table is range-partitioned on `date`, one partition per calendar month
+# (stock_analysis_all_results_yYYYYmMM) plus a default partition for rows
+# outside every range. Date-bounded queries compare `date` directly against
+# constants or stable expressions so the planner prunes untouched months.
+# Cold months can be detached (optionally moved to the `archive` schema); a
+# detached partition is an ordinary table and can be re-attached later.
+
+TABLE = 'stock_analysis_all_results'
+DEFAULT_PARTITION = f'{TABLE}_default'
+BACKUP_TABLE = f'{TABLE}_unpartitioned'
+ARCHIVE_SCHEMA = 'archive'
+MONTHS_AHEAD = 3
+
+def month_start(day):
+    return datetime.date(day.year, day.month, 1)
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    return f"{TABLE}_y{month.year:04d}m{month.month:02d}"
+
+def is_partitioned(cur):
+    cur.execute("""
+        SELECT c.relkind = 'p' FROM pg_class c
+        WHERE c.oid = to_regclass(%s);
+    """, (TABLE,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+def list_partitions(cur):
+    # [(name, lower bound, upper bound)], bounds are None for the default partition
+    cur.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY c.relname;
+    """, (TABLE,))
+    partitions = []
+    for name, bound in cur.fetchall():
+        if bound == 'DEFAULT':
+            partitions.append((name, None, None))
+            continue
+        # FOR VALUES FROM ('2024-01-01') TO ('2024-02-01')
+        lower, upper = [part.split("'")[1] for part in bound.split(' TO ')]
+        partitions.append((name, datetime.date.fromisoformat(lower), datetime.date.fromisoformat(upper)))
+    return partitions
+
+def create_month_partition(cur, month):
+    # Built as a standalone table and attached, moving any rows for the month
+    # out of the default partition first (attaching would fail otherwise).
+    # Rows are moved as-is, so their ingest_seq does not change.
+    name = partition_name(month)
+    upper = add_months(month, 1)
+    cur.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING STORAGE);")
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (DEFAULT_PARTITION,))
+    if cur.fetchone()[0]:
+        cur.execute(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE date >= %s AND date < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved;
+        """, (month, upper))
+    cur.execute(f"""
+        ALTER TABLE {name} ADD CONSTRAINT {name}_bounds
+            CHECK (date IS NOT NULL AND date >= DATE '{month}' AND date < DATE '{upper}');
+    """)
+    cur.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{month}') TO ('{upper}');")
+    # The CHECK only existed to let ATTACH skip its validation scan
+    cur.execute(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds;")
+    return name
+
+def ensure_months(cur, months):
+    # Creates the missing partitions among `months` (first days of months).
+    # Under the schema lock, so two processes never create the same month.
+    lock_schema(cur)
+    existing = {lower for _, lower, _ in list_partitions(cur) if lower is not None}
+    return [create_month_partition(cur, month) for month in sorted(set(months) - existing)]
+
+def ensure_partitions(cur, first_day, last_day):
+    # Creates any missing monthly partitions covering [first_day, last_day]
+    months = []
+    month = month_start(first_day)
+    while month <= last_day:
+        months.append(month)
+        month = add_months(month, 1)
+    return ensure_months(cur, months)
+
+def ensure_future_partitions(conn, months_ahead=MONTHS_AHEAD, today=None):
+    with conn.cursor() as cur:
+        if not is_partitioned(cur):
+            return []
+        today = today or datetime.date.today()
+        created = ensure_partitions(cur, month_start(today), add_months(month_start(today), months_ahead))
+    conn.commit()
+    if created:
+        print(f"Created partitions: {', '.join(created)}")
+    return created
+
+def migrate_to_partitioned(conn, months_ahead=MONTHS_AHEAD):
+    # One transaction: readers see either the old heap or the partitioned table.
+    # The old heap is kept as stock_analysis_all_results_unpartitioned.
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        lock_schema(cur)
+        if is_partitioned(cur):
+            print(f"{TABLE} is already partitioned")
+            return False
+        cur.execute(f"SELECT to_regclass('{BACKUP_TABLE}') IS NOT NULL;")
+        if cur.fetchone()[0]:
+            raise Exception(f"{BACKUP_TABLE} already exists; drop or rename it before migrating")
+        cur.execute(f"LOCK TABLE {TABLE} IN EXCLUSIVE MODE;")
+        cur.execute(f"SELECT MIN(date), MAX(date) FROM {TABLE};")
+        first_day, last_day = cur.fetchone()
+
+        # Move the heap, its indexes and trigger out of the way
+        cur.execute(f"ALTER TABLE {TABLE} RENAME TO {BACKUP_TABLE};")
+        cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s;", (BACKUP_TABLE,))
+        for (index,) in cur.fetchall():
+            cur.execute(f"ALTER INDEX {index} RENAME TO {index[:48]}_unpartitioned;")
+        cur.execute(f"DROP TRIGGER IF EXISTS stock_analysis_ingest_seq_trg ON {BACKUP_TABLE};")
+        cur.execute(f"DROP TRIGGER IF EXISTS stock_analysis_ingest_lock_trg ON {BACKUP_TABLE};")
+
+        cur.execute(f"""
+            CREATE TABLE {TABLE} (LIKE {BACKUP_TABLE} INCLUDING DEFAULTS INCLUDING STORAGE)
+            PARTITION BY RANGE (date);
+        """)
+        cur.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT;")
+        today = datetime.date.today()
+        first_day = first_day or today
+        last_day = max(last_day or today, add_months(month_start(today), months_ahead))
+        created = ensure_partitions(cur, first_day, last_day)
+
+        # Copied before the ingest_seq trigger exists, so sequences are kept
+        cur.execute(f"INSERT INTO {TABLE} SELECT * FROM {BACKUP_TABLE};")
+        copied = cur.rowcount
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_stock_analysis_date ON {TABLE} (date);")
+        cur.execute(f"""
+            SELECT pg_get_serial_sequence('{BACKUP_TABLE}', 'id');
+        """)
+        sequence = cur.fetchone()[0]
+        if sequence:
+            cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id;")
+        cur.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_{TABLE}_ingest_key
+                ON {TABLE} ({', '.join(INGEST_KEYS[TABLE])});
+        """)
+    # Adds the trigger and commits the whole migration
+    ensure_ingest_sequence(conn)
+    print(
+        f"Migrated {copied} rows into {len(created)} monthly partitions "
+        f"in {time.perf_counter() - started:.2f}s; the old table is kept as {BACKUP_TABLE}"
+    )
+    return True
+
+def detach_partitions(conn, before, archive=False):
+    # Detaches every monthly partition that ends on or before `before`
+    detached = []
+    with conn.cursor() as cur:
+        if not is_partitioned(cur):
+            return detached
+        if archive:
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA};")
+        for name, lower, upper in list_partitions(cur):
+            if upper is None or upper > before:
+                continue
+            cur.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name};")
+            if archive:
+                cur.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA};")
+            detached.append(name)
+    conn.commit()
+    return detached
+
+def attach_partition(conn, name):
+    # Re-attaches a previously detached month (from public or the archive schema)
+    month = datetime.date(int(name[-7:-3]), int(name[-2:]), 1)
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (f"{ARCHIVE_SCHEMA}.{name}",))
+        if cur.fetchone()[0]:
+            cur.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{name} SET SCHEMA public;")
+        cur.execute(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}');"
+        )
+    conn.commit()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Manage monthly partitions of stock_analysis_all_results")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="convert the table to monthly range partitions")
+    ensure = sub.add_parser("ensure", help="create partitions for upcoming months")
+    ensure.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    detach = sub.add_parser("detach", help="detach months ending on or before a date")
+    detach.add_argument("before", type=datetime.date.fromisoformat, help="YYYY-MM-DD")
+    detach.add_argument("--archive", action="store_true", help=f"move detached months to the {ARCHIVE_SCHEMA} schema")
+    attach = sub.add_parser("attach", help="re-attach a detached month")
+    attach.add_argument("name")
+    sub.add_parser("list", help="list partitions")
+    args = parser.parse_args()
+
+    conn = init_connection()
+    try:
+        if args.command == "migrate":
+            migrate_to_partitioned(conn)
+        elif args.command == "ensure":
+            ensure_future_partitions(conn, args.months_ahead)
+        elif args.command == "detach":
+            names = detach_partitions(conn, args.before, archive=args.archive)
+            print(f"Detached {len(names)} partitions: {', '.join(names)}")
+        elif args.command == "attach":
+            attach_partition(conn, args.name)
+        else:
+            with conn.cursor() as cur:
+                for name, lower, upper in list_partitions(cur):
+                    print(name, lower or 'DEFAULT', upper or '')
+    finally:
+        conn.close()
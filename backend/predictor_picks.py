@@ -0,0 +1,198 @@
+import functools
+import json
+import time
+
+import pandas as pd
+
+import screener
+import typed_fetch
+from bulk_ingest import copy_records
+from init_db import init_connection, ensure_predictor_picks_tables
+from panel_store import ingest_watermark
+
+#-----------------------------------
+# Materialised /cse-predictor picks
+#-----------------------------------
+
+# Tier 1 / Tier 2 picks for a trading day only change when that day's rows
+# change, so they are computed once per day and stored in predictor_picks
+# (one JSONB record per pick, with the financial_metrics fields attached).
+# A refresh recomputes only the dates of rows whose ingest_seq moved past the
+# last refresh; the route reads stored days with a date range scan and
+# computes live only the days that changed since (usually just today).
+
+FUNDAMENTAL_FIELDS = ['eps_ttm', 'bvps', 'dps']
+TIERS = {'tier1': 1, 'tier2': 2}
+
+# Internal bookkeeping, not part of a pick record
+HIDDEN_COLUMNS = ['ingest_seq']
+
+@functools.lru_cache(maxsize=None)
+def liquidity_screen():
+    return screener.Screen('liquidity', screener.LIQUIDITY_SCREEN)
+
+@functools.lru_cache(maxsize=None)
+def tier_screens():
+    return screener.compile_screens({
+        'tier1': screener.TIER1_SCREEN,
+        'tier2': screener.TIER2_SCREEN,
+    })
+
+def fundamentals_lookup(fundamentals):
+    lookup = {}
+    if fundamentals is not None:
+        for row in typed_fetch.frame_records(fundamentals[['code'] + FUNDAMENTAL_FIELDS]):
+            lookup[row.pop('code')] = row
+    return lookup
+
+def liquid_rows(df):
+    # Liquidity floor plus the numeric gaps the picks report as 0
+    df = df[liquidity_screen().mask(df)]
+    return df.fillna({col: 0 for col in ['turnover', 'volume', 'relative_strength'] if col in df.columns})
+
+def compute_picks(df, fundamentals):
+    # {date string: {'tier1Picks': [...], 'tier2Picks': [...]}} for every date in df
+    df = liquid_rows(df).drop(columns=HIDDEN_COLUMNS, errors='ignore').sort_values(['date', 'symbol'])
+    fin_metrics = fundamentals_lookup(fundamentals)
+
+    # Evaluate both tiers in one pass over the filtered rows
+    tier_masks = screener.evaluate_screens(df, tier_screens())
+    df = df.assign(_tier1=tier_masks['tier1'], _tier2=tier_masks['tier2'])
+
+    grouped = {}
+    for d, group in df.groupby(df['date'].dt.strftime('%Y-%m-%d')):
+        picks = {}
+        for tier in TIERS:
+            records = typed_fetch.frame_records(group[group[f'_{tier}']].drop(columns=['_tier1', '_tier2']))
+            for record in records:
+                record.update(fin_metrics.get(record['symbol'], {}))
+            picks[f'{tier}Picks'] = records
+        grouped[d] = picks
+    return grouped
+
+#-----------------------------------
+# Materialisation
+#-----------------------------------
+
+def load_days(conn, dates=None):
+    # Only rows that pass the liquidity floor leave the database
+    where, params = screener.pushdown_where([liquidity_screen()])
+    query = f"SELECT * FROM stock_analysis_all_results WHERE {where}"
+    if dates is not None:
+        query += " AND date = ANY(%s::date[])"
+        params.append(list(dates))
+    return typed_fetch.fetch_frame(conn, query + ";", params)
+
+def dirty_dates(conn, through_seq):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT date FROM stock_analysis_all_results
+            WHERE ingest_seq > %s AND date IS NOT NULL;
+        """, (through_seq,))
+        return sorted(str(row[0]) for row in cur.fetchall())
+
+def picks_state(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('predictor_picks_state') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute("SELECT through_seq FROM predictor_picks_state WHERE id = 1;")
+        row = cur.fetchone()
+        return row[0] if row else None
+
+def store_picks(cur, grouped):
+    # Tier 0 marks the day itself, so days without picks still show up
+    records = []
+    for d, picks in grouped.items():
+        records.append((d, 0, 0, None, '{}'))
+        for tier, number in TIERS.items():
+            for rank, record in enumerate(picks[f'{tier}Picks']):
+                pick = {k: v for k, v in record.items() if k != 'date'}
+                records.append((d, number, rank, record['symbol'], json.dumps(pick)))
+    copy_records(cur, 'predictor_picks', ['date', 'tier', 'rank', 'symbol', 'pick'], records)
+    return len(records)
+
+def refresh_picks(conn, fundamentals=None, full=False):
+    ensure_predictor_picks_tables(conn)
+    started = time.perf_counter()
+    current = ingest_watermark(conn)
+    through = None if full else picks_state(conn)
+    if through is not None and current is not None and current <= through:
+        return 0
+    if fundamentals is None:
+        fundamentals = typed_fetch.fetch_frame(conn, "SELECT * FROM financial_metrics;")
+
+    dates = None if through is None or current is None else dirty_dates(conn, through)
+    grouped = compute_picks(load_days(conn, dates), fundamentals) if dates != [] else {}
+    with conn.cursor() as cur:
+        if dates is None:
+            cur.execute("DELETE FROM predictor_picks;")
+        elif dates:
+            cur.execute("DELETE FROM predictor_picks WHERE date = ANY(%s::date[]);", (dates,))
+        stored = store_picks(cur, grouped)
+        cur.execute("""
+            INSERT INTO predictor_picks_state (id, through_seq, refreshed_at)
+            VALUES (1, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (id) DO UPDATE SET
+                through_seq = EXCLUDED.through_seq,
+                refreshed_at = EXCLUDED.refreshed_at;
+        """, (current,))
+    conn.commit()
+    days = len(grouped) if dates is None else len(dates)
+    print(f"Materialised {stored - len(grouped)} picks for {days} day(s) in {time.perf_counter() - started:.2f}s")
+    return stored
+
+def refresh_pick_fundamentals(conn):
+    # Re-attach financial_metrics fields to every stored pick in one statement
+    fields = ', '.join(f"'{f}', f.{f}::float8" for f in FUNDAMENTAL_FIELDS)
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('predictor_picks') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return 0
+        cur.execute(f"""
+            UPDATE predictor_picks p
+            SET pick = p.pick || jsonb_build_object({fields})
+            FROM financial_metrics f
+            WHERE f.code = p.symbol;
+        """)
+        updated = cur.rowcount
+    conn.commit()
+    return updated
+
+#-----------------------------------
+# Reads
+#-----------------------------------
+
+def stored_picks(conn, date=None):
+    # None when the table has not been materialised yet
+    through = picks_state(conn)
+    if through is None:
+        return None, None
+    query = "SELECT date, tier, pick FROM predictor_picks"
+    params = []
+    if date:
+        query += " WHERE date >= %s::date"
+        params.append(pd.to_datetime(date).strftime('%Y-%m-%d'))
+    query += " ORDER BY date, tier, rank;"
+    names = {number: f'{tier}Picks' for tier, number in TIERS.items()}
+    grouped = {}
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        for d, tier, pick in cur.fetchall():
+            day = grouped.setdefault(str(d), {'tier1Picks': [], 'tier2Picks': []})
+            if tier == 0:
+                continue
+            pick['date'] = pd.Timestamp(d)
+            day[names[tier]].append(pick)
+    return grouped, through
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Materialise /cse-predictor tier picks per trading day")
+    parser.add_argument("--full", action="store_true", help="recompute every trading day")
+    args = parser.parse_args()
+    conn = init_connection()
+    try:
+        refresh_picks(conn, full=args.full)
+    finally:
+        conn.close()
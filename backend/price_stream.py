@@ -0,0 +1,146 @@
+import json
+import os
+import queue
+import threading
+import time
+
+#-----------------------------------
+# Live price fan-out (server-sent events)
+#-----------------------------------
+
+# One hub per process. A single loop polls the price source once per distinct
+# subscribed symbol and pushes only changed prices to every subscriber of
+# that symbol, so upstream load follows the number of distinct symbols
+# rather than clients x symbols x poll rate. Each subscriber owns a bounded
+# queue; a client that stops reading is dropped instead of growing memory.
+# Every open stream holds a gthread thread for as long as the client stays
+# connected. serve.py gives each worker STREAM_MAX_CLIENTS threads on top of
+# its request threads, so streams never starve ordinary requests; a worker
+# accepts at most that many streams and answers further subscriptions with
+# 503. Waiting threads only block on their queue, so the budget is sized for
+# many open tabs rather than a handful.
+
+STREAM_POLL_SECONDS = float(os.environ.get("STREAM_POLL_SECONDS", "2"))
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get("STREAM_HEARTBEAT_SECONDS", "15"))
+STREAM_MAX_SYMBOLS = int(os.environ.get("STREAM_MAX_SYMBOLS", "50"))
+STREAM_QUEUE_SIZE = 256
+STREAM_MAX_CLIENTS = int(os.environ.get("STREAM_MAX_CLIENTS", "32"))
+STREAM_RETRY_AFTER = 30
+
+class StreamsFull(Exception):
+    pass
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class Subscriber:
+    def __init__(self, symbols):
+        self.symbols = frozenset(symbols)
+        self.events = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self.closed = False
+
+    def push(self, payload):
+        try:
+            self.events.put_nowait(payload)
+        except queue.Full:
+            self.closed = True
+
+class PriceHub:
+    def __init__(self, source, interval=STREAM_POLL_SECONDS, max_clients=STREAM_MAX_CLIENTS):
+        # source: fn(symbol) -> latest price or None, must not block on upstream
+        self.source = source
+        self.interval = interval
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.prices = {}
+        self.pid = None
+        self.counters = {'ticks': 0, 'updates': 0, 'dropped': 0, 'rejected': 0}
+
+    def subscribe(self, symbols):
+        # Raises StreamsFull when this worker already serves max_clients streams
+        self.start()
+        subscriber = Subscriber(symbols)
+        with self.lock:
+            if len(self.subscribers) >= self.max_clients:
+                self.counters['rejected'] += 1
+                raise StreamsFull(f"At most {self.max_clients} price streams per worker are open")
+            self.subscribers.add(subscriber)
+            known = {s: self.prices[s] for s in subscriber.symbols if self.prices.get(s) is not None}
+        if known:
+            subscriber.push(known)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+            active = set().union(*(s.symbols for s in self.subscribers)) if self.subscribers else set()
+            # Forget prices nobody is watching, so a resubscribe starts fresh
+            for symbol in list(self.prices):
+                if symbol not in active:
+                    del self.prices[symbol]
+
+    def tick(self):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        symbols = set().union(*(s.symbols for s in subscribers)) if subscribers else set()
+        changed = {}
+        for symbol in symbols:
+            try:
+                price = self.source(symbol)
+            except Exception as e:
+                print(f"Price stream source failed for {symbol}: {e}")
+                continue
+            if price is not None and self.prices.get(symbol) != price:
+                changed[symbol] = price
+        if not changed:
+            return
+        with self.lock:
+            self.prices.update(changed)
+        for subscriber in subscribers:
+            update = {s: p for s, p in changed.items() if s in subscriber.symbols}
+            if update:
+                subscriber.push(update)
+                self.counters['updates'] += 1
+            if subscriber.closed:
+                self.counters['dropped'] += 1
+                self.unsubscribe(subscriber)
+
+    def loop(self):
+        while True:
+            try:
+                self.tick()
+                self.counters['ticks'] += 1
+            except Exception as e:
+                print(f"Price stream tick failed: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        # Threads do not survive fork, so each worker starts its own loop
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.subscribers = set()
+            self.prices = {}
+        threading.Thread(target=self.loop, name="price-stream", daemon=True).start()
+
+    def stream(self, subscriber):
+        # Generator of SSE frames for one client; the hub is left on disconnect
+        try:
+            yield "retry: 5000\n\n"
+            while not subscriber.closed:
+                try:
+                    update = subscriber.events.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event('prices', update)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        with self.lock:
+            subscribers = len(self.subscribers)
+            symbols = len(set().union(*(s.symbols for s in self.subscribers))) if self.subscribers else 0
+        return dict(self.counters, subscribers=subscribers, symbols=symbols, max_clients=self.max_clients)
@@ -0,0 +1,203 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+#-----------------------------------
+# Declarative screen specs
+#-----------------------------------
+
+# A screen is a small JSON tree:
+#   {"all": [spec, ...]}                                   AND
+#   {"any": [spec, ...]}                                   OR
+#   {"field": "rsi", "op": ">=", "value": 50}              comparison
+#   {"field": "volume_analysis", "op": "in", "value": [...]}  set membership
+# Specs are validated and compiled once, then evaluated either as a SQL WHERE
+# clause pushed down to Postgres or as a vectorized mask over a DataFrame.
+# Both follow SQL semantics for missing values: a comparison with NULL/NaN
+# never matches, '!=' included, so the pushdown and the mask agree.
+
+NUMERIC_FIELDS = {
+    'closing_price', 'change_pct', 'volume', 'turnover', 'rsi',
+    'relative_strength', 'vol_avg_5d', 'vol_avg_20d',
+    'ema_20', 'ema_50', 'ema_100', 'ema_200'
+}
+TEXT_FIELDS = {'symbol', 'rsi_divergence', 'volume_analysis'}
+COMPARISON_OPS = {'==': '=', '!=': '<>', '>': '>', '>=': '>=', '<': '<', '<=': '<='}
+
+class ScreenError(ValueError):
+    pass
+
+# Liquidity floor and tiers used by /cse-predictor
+LIQUIDITY_SCREEN = {"all": [
+    {"field": "turnover", "op": ">", "value": 999999},
+    {"field": "volume", "op": ">", "value": 9999},
+]}
+TIER1_SCREEN = {"all": [
+    {"field": "rsi_divergence", "op": "==", "value": "Bullish Divergence"},
+    {"field": "volume_analysis", "op": "in",
+     "value": ["Emerging Bullish Momentum", "Increase in weekly Volume Activity Detected"]},
+]}
+TIER2_SCREEN = {"any": [
+    {"all": [
+        {"field": "volume_analysis", "op": "in",
+         "value": ["Emerging Bullish Momentum", "High Bullish Momentum"]},
+        {"field": "relative_strength", "op": ">=", "value": 1},
+    ]},
+    {"field": "rsi_divergence", "op": "==", "value": "Bullish Divergence"},
+]}
+
+BUILTIN_SCREENS = {
+    'tier1': {"all": [LIQUIDITY_SCREEN, TIER1_SCREEN]},
+    'tier2': {"all": [LIQUIDITY_SCREEN, TIER2_SCREEN]},
+}
+
+def validate_leaf(node):
+    field = node.get('field')
+    op = node.get('op')
+    value = node.get('value')
+    if field not in NUMERIC_FIELDS and field not in TEXT_FIELDS:
+        raise ScreenError(f"Unknown screen field: {field}")
+    if op == 'in':
+        if not isinstance(value, list) or not value:
+            raise ScreenError(f"'in' on {field} needs a non-empty list")
+        values = value
+    elif op in COMPARISON_OPS:
+        values = [value]
+    else:
+        raise ScreenError(f"Unsupported operator: {op}")
+    for v in values:
+        if field in NUMERIC_FIELDS and (isinstance(v, bool) or not isinstance(v, (int, float))):
+            raise ScreenError(f"{field} compares against numbers, got {v!r}")
+        if field in TEXT_FIELDS and not isinstance(v, str):
+            raise ScreenError(f"{field} compares against strings, got {v!r}")
+    if field in TEXT_FIELDS and op not in ('==', '!=', 'in'):
+        raise ScreenError(f"Operator {op} is not supported on text field {field}")
+
+def validate_spec(node):
+    if not isinstance(node, dict):
+        raise ScreenError("Screen spec nodes must be objects")
+    if 'all' in node and 'any' in node:
+        raise ScreenError("A screen node takes either 'all' or 'any', not both")
+    if 'all' in node or 'any' in node:
+        children = node.get('all', node.get('any'))
+        if not isinstance(children, list) or not children:
+            raise ScreenError("'all'/'any' need a non-empty list")
+        for child in children:
+            validate_spec(child)
+    else:
+        validate_leaf(node)
+
+def node_key(node):
+    return json.dumps(node, sort_keys=True)
+
+def spec_fields(node):
+    if 'all' in node or 'any' in node:
+        fields = set()
+        for child in node.get('all', node.get('any')):
+            fields |= spec_fields(child)
+        return fields
+    return {node['field']}
+
+def require_columns(screens, columns):
+    # Whitelisted fields that the table does not have (e.g. ema_* before the
+    # indicator migration) are rejected before any SQL is sent
+    missing = sorted(set().union(*(screen.fields for screen in screens)) - set(columns))
+    if missing:
+        raise ScreenError(f"Screen fields not available: {', '.join(missing)}")
+
+#-----------------------------------
+# SQL compilation
+#-----------------------------------
+
+def to_sql(node):
+    if 'all' in node or 'any' in node:
+        joiner = ' AND ' if 'all' in node else ' OR '
+        parts, params = [], []
+        for child in node.get('all', node.get('any')):
+            clause, child_params = to_sql(child)
+            parts.append(clause)
+            params.extend(child_params)
+        return '(' + joiner.join(parts) + ')', params
+
+    # Field names come from the whitelist above, values are always bound
+    field = node['field']
+    if node['op'] == 'in':
+        placeholders = ', '.join(['%s'] * len(node['value']))
+        return f"{field} IN ({placeholders})", list(node['value'])
+    return f"{field} {COMPARISON_OPS[node['op']]} %s", [node['value']]
+
+#-----------------------------------
+# Vectorized evaluation
+#-----------------------------------
+
+def leaf_mask(df, node):
+    field = node['field']
+    if field not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    column = df[field]
+    if node['op'] == 'in':
+        return column.isin(node['value']).to_numpy()
+    if field in NUMERIC_FIELDS:
+        column = pd.to_numeric(column, errors='coerce')
+    present = column.notna().to_numpy()
+    value = node['value']
+    op = node['op']
+    if op == '==':
+        result = column == value
+    elif op == '!=':
+        result = column != value
+    elif op == '>':
+        result = column > value
+    elif op == '>=':
+        result = column >= value
+    elif op == '<':
+        result = column < value
+    else:
+        result = column <= value
+    # NaN != value is True in pandas but NULL <> value never matches in SQL
+    return result.fillna(False).to_numpy(dtype=bool) & present
+
+def to_mask(df, node, memo):
+    # Identical sub-expressions shared between screens are evaluated once
+    key = node_key(node)
+    if key in memo:
+        return memo[key]
+    if 'all' in node:
+        mask = np.ones(len(df), dtype=bool)
+        for child in node['all']:
+            mask &= to_mask(df, child, memo)
+    elif 'any' in node:
+        mask = np.zeros(len(df), dtype=bool)
+        for child in node['any']:
+            mask |= to_mask(df, child, memo)
+    else:
+        mask = leaf_mask(df, node)
+    memo[key] = mask
+    return mask
+
+class Screen:
+    def __init__(self, name, spec):
+        validate_spec(spec)
+        self.name = name
+        self.spec = spec
+        self.fields = spec_fields(spec)
+        self.where, self.params = to_sql(spec)
+
+    def mask(self, df, memo=None):
+        return to_mask(df, self.spec, {} if memo is None else memo)
+
+def compile_screens(specs):
+    if not isinstance(specs, dict):
+        raise ScreenError("screens must be an object mapping names to specs")
+    return [Screen(name, spec) for name, spec in specs.items()]
+
+def pushdown_where(screens):
+    # A row is needed if any screen could match it
+    clauses = [screen.where for screen in screens]
+    params = [p for screen in screens for p in screen.params]
+    return '(' + ' OR '.join(clauses) + ')', params
+
+def evaluate_screens(df, screens):
+    memo = {}
+    return {screen.name: screen.mask(df, memo) for screen in screens}
@@ -0,0 +1,67 @@
+import gc
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from admission import REQUEST_THREADS
+from price_stream import STREAM_MAX_CLIENTS
+
+#-----------------------------------
+# Production entry point
+#-----------------------------------
+
+# Runs unified_app under gunicorn with several worker processes. The app is
+# imported and warmed up once in the parent (memory-mapped market panel,
+# fundamentals, schema checks) before the workers are forked, so all workers
+# share those pages instead of loading their own copy. After an ingest one
+# worker rebuilds the panel files and the others re-map them.
+#
+#   python serve.py                      # binds 0.0.0.0:$PORT (default 5000)
+#   WEB_CONCURRENCY=4 python serve.py    # explicit worker count
+
+def default_threads():
+    # Request threads plus one thread per allowed price stream, so open
+    # streams never take threads from ordinary requests
+    return int(os.environ.get("GUNICORN_THREADS", REQUEST_THREADS + STREAM_MAX_CLIENTS))
+
+def default_workers():
+    return int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+class MaverickServer(BaseApplication):
+    def __init__(self, options=None):
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        import unified_app
+
+        print("Preloading market panel before forking workers...")
+        if not unified_app.preload():
+            print("Preload did not complete, workers will retry warm-up on first request")
+
+        # Move everything allocated so far out of the collector's reach, so
+        # collections in the workers do not touch (and copy) the shared pages
+        gc.collect()
+        gc.freeze()
+        return unified_app.app
+
+def main():
+    options = {
+        'bind': f"0.0.0.0:{os.environ.get('PORT', '5000')}",
+        'workers': default_workers(),
+        'worker_class': 'gthread',
+        'threads': default_threads(),
+        'timeout': int(os.environ.get("GUNICORN_TIMEOUT", "120")),
+        'preload_app': True,
+        'accesslog': '-',
+    }
+    MaverickServer(options).run()
+
+if __name__ == "__main__":
+    main()
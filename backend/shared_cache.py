@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+#-----------------------------------
+# Host-wide response cache
+#-----------------------------------
+
+# Serialised responses are stored as one file per key in a shared-memory
+# directory (/dev/shm where available), so every worker process on the host
+# sees the same entries. Entries are written to a temporary file and published
+# with os.replace, which is atomic: readers either see the whole entry or none.
+# A per-key flock makes concurrent misses compute the value once per host.
+# Keys include the data watermark, so stale entries are never served and
+# simply age out under the size-bounded LRU eviction. Eviction scans the
+# directory only after a budget of bytes written or seconds elapsed, and then
+# trims to a low-water mark, so puts do not pay for a scan each.
+
+def default_cache_dir():
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "maverick-cache")
+
+CACHE_DIR = os.environ.get("SHARED_CACHE_DIR", default_cache_dir())
+MAX_BYTES = int(os.environ.get("SHARED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+EVICT_EVERY_BYTES = int(os.environ.get("SHARED_CACHE_EVICT_EVERY_BYTES", str(MAX_BYTES // 16)))
+EVICT_EVERY_SECONDS = float(os.environ.get("SHARED_CACHE_EVICT_EVERY_SECONDS", "30"))
+LOW_WATER = 0.9
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'eviction_scans': 0}
+_evict_lock = threading.Lock()
+_evict_state = {'written': 0, 'checked': time.monotonic()}
+
+def make_key(route, params, watermark):
+    payload = json.dumps([route, params, watermark], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def entry_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.bin")
+
+def count(stat, amount=1):
+    with _stats_lock:
+        _stats[stat] += amount
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+def get(key):
+    path = entry_path(key)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        # Refresh the access time used for LRU eviction
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+def put(key, data):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = os.path.join(CACHE_DIR, f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, entry_path(key))
+    maybe_evict(len(data))
+
+def maybe_evict(written):
+    with _evict_lock:
+        _evict_state['written'] += written
+        now = time.monotonic()
+        if (_evict_state['written'] < EVICT_EVERY_BYTES
+                and now - _evict_state['checked'] < EVICT_EVERY_SECONDS):
+            return
+        _evict_state['written'] = 0
+        _evict_state['checked'] = now
+    evict()
+
+def evict(max_bytes=None):
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    if fcntl is None:
+        return evict_entries(max_bytes)
+    # One scan per host at a time; a process finding one running skips its own
+    with open(os.path.join(CACHE_DIR, ".evict.lock"), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+        try:
+            evict_entries(max_bytes)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def evict_entries(max_bytes):
+    count('eviction_scans')
+    entries = []
+    total = 0
+    try:
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                if not entry.name.endswith('.bin'):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+    except FileNotFoundError:
+        return
+    if total <= max_bytes:
+        return
+    # Least recently used first, down to the low-water mark
+    entries.sort()
+    target = max_bytes * LOW_WATER
+    for _, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            count('evictions')
+        except FileNotFoundError:
+            pass
+
+def get_or_compute(key, compute):
+    # Returns (data, hit). `compute` must return bytes; exceptions are not cached.
+    data = get(key)
+    if data is not None:
+        count('hits')
+        return data, True
+
+    if fcntl is None:
+        data = compute()
+        put(key, data)
+        count('misses')
+        return data, False
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    lock_path = os.path.join(CACHE_DIR, f"{key}.lock")
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # Another process may have published while we waited for the lock
+            data = get(key)
+            if data is not None:
+                count('hits')
+                return data, True
+            data = compute()
+            put(key, data)
+            count('misses')
+            return data, False
+        finally:
+            # Removed while still held, so lock files do not pile up. Anyone
+            # queued on this file re-reads the entry once they get it; the
+            # inode check keeps a newer lock file created meanwhile in place.
+            try:
+                if os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                    os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
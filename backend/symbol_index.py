@@ -0,0 +1,166 @@
+import bisect
+import heapq
+
+#-----------------------------------
+# In-memory symbol search
+#-----------------------------------
+
+# Built once per market snapshot from the panel's symbols (e.g. AAF.N0000)
+# and, where a names column exists, company names. Lookups go through:
+#   - exact match on the full symbol or its ticker (AAF)
+#   - prefix match: bisect over one sorted list of search keys (tickers,
+#     full symbols, name words)
+#   - substring match over the same keys
+#   - typo tolerance: keys sharing a bigram with the query are scored with a
+#     bounded edit distance
+# Results are ranked by match kind, then key length, then symbol.
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Match kinds, best first
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING, FUZZY = range(5)
+MATCH_NAMES = {EXACT: 'exact', PREFIX: 'prefix', WORD_PREFIX: 'name', SUBSTRING: 'substring', FUZZY: 'fuzzy'}
+
+def normalize(text):
+    return ' '.join(str(text).upper().split())
+
+def ticker_of(symbol):
+    return symbol.split('.', 1)[0]
+
+def bigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+def prefix_distance(a, b, limit):
+    # Smallest optimal-string-alignment distance between `a` and a leading part
+    # of `b` (so "ACESS" is one edit from "ACCESS ENGINEERING"), or limit + 1
+    # once every alignment exceeds the limit
+    b = b[:len(a) + limit]
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[max(0, len(a) - limit):])
+
+class SymbolIndex:
+    def __init__(self, symbols, names=None):
+        names = names or {}
+        self.symbols = sorted(set(symbols))
+        self.names = {s: names[s] for s in self.symbols if names.get(s)}
+        self.exact = {}
+        tickers = {}
+        for s in self.symbols:
+            self.exact[s.upper()] = s
+            tickers.setdefault(ticker_of(s).upper(), []).append(s)
+        # A bare ticker resolves only when it names exactly one listing
+        for ticker, listed in tickers.items():
+            if len(listed) == 1 and ticker not in self.exact:
+                self.exact[ticker] = listed[0]
+
+        # (key, kind, symbol): kind is PREFIX for tickers and symbols, WORD_PREFIX for name words
+        keys = set()
+        for s in self.symbols:
+            keys.add((s.upper(), PREFIX, s))
+            keys.add((ticker_of(s).upper(), PREFIX, s))
+            name = self.names.get(s)
+            if name:
+                keys.add((normalize(name), WORD_PREFIX, s))
+                for word in normalize(name).split():
+                    keys.add((word, WORD_PREFIX, s))
+        self.keys = sorted(keys)
+        self.key_text = [k[0] for k in self.keys]
+
+        # Typo matching runs on tickers and name words only; the ".N0000"
+        # suffixes would make every full symbol a candidate
+        self.grams = {}
+        for position, (key, _, symbol) in enumerate(self.keys):
+            if key == symbol.upper() and key != ticker_of(key):
+                continue
+            for gram in bigrams(key):
+                self.grams.setdefault(gram, []).append(position)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def resolve(self, symbol):
+        # Canonical symbol for a full symbol or unique ticker (any case), else None
+        if not symbol:
+            return None
+        return self.exact.get(normalize(symbol))
+
+    def search(self, query, limit=DEFAULT_LIMIT, fuzzy=True):
+        query = normalize(query)
+        if not query:
+            return []
+        best = {}
+
+        def offer(symbol, kind, key, distance=0):
+            rank = (kind, distance, len(key), symbol)
+            if symbol not in best or rank < best[symbol]:
+                best[symbol] = rank
+
+        if query in self.exact:
+            offer(self.exact[query], EXACT, query)
+
+        start = bisect.bisect_left(self.key_text, query)
+        end = bisect.bisect_left(self.key_text, query + '\uffff')
+        for key, kind, symbol in self.keys[start:end]:
+            offer(symbol, kind, key)
+
+        if len(best) < limit:
+            for key, kind, symbol in self.keys:
+                if query in key:
+                    offer(symbol, SUBSTRING, key)
+
+        term = ticker_of(query) if '.' in query else query
+        if fuzzy and len(best) < limit and len(term) >= 3:
+            max_distance = 1 if len(term) <= 5 else 2
+            # Keys are matched on their leading part, so the query's end marker
+            # is left out; each edit breaks at most two of the remaining bigrams
+            query_grams = bigrams(term) - {term[-1] + ' '}
+            needed = max(1, len(query_grams) - 2 * max_distance)
+            shared = {}
+            for gram in query_grams:
+                for position in self.grams.get(gram, ()):
+                    shared[position] = shared.get(position, 0) + 1
+            for position, count in shared.items():
+                if count < needed:
+                    continue
+                key, _, symbol = self.keys[position]
+                distance = prefix_distance(term, key, max_distance)
+                if distance <= max_distance:
+                    offer(symbol, FUZZY, key, distance)
+
+        ranked = heapq.nsmallest(limit, best.values())
+        return [
+            {
+                'symbol': symbol,
+                'name': self.names.get(symbol),
+                'match': MATCH_NAMES[kind],
+                'distance': distance,
+            }
+            for kind, distance, _, symbol in ranked
+        ]
+
+# financial_metrics columns that may carry company names
+NAME_COLUMNS = ['company_name', 'name']
+
+def names_from_fundamentals(fundamentals):
+    # {symbol: company name} when financial_metrics has a name column
+    if fundamentals is None:
+        return {}
+    for column in NAME_COLUMNS:
+        if column in fundamentals.columns:
+            rows = fundamentals[['code', column]].dropna()
+            return dict(zip(rows['code'], rows[column].astype(str)))
+    return {}
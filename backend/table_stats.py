@@ -0,0 +1,302 @@
+import json
+import time
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from init_db import init_connection, ensure_table_stats_tables
+from panel_store import ingest_watermark
+
+#-----------------------------------
+# Precomputed table statistics
+#-----------------------------------
+
+# Row counts, date coverage and per-column null/zero counts for
+# stock_analysis_all_results are kept per symbol in symbol_stats. A refresh
+# reads only the rows whose ingest_seq moved past the last refresh (an index
+# range scan) and adds them to the running counts, so neither it nor the
+# readers scan the big table. When no stats exist yet, readers fall back to
+# the planner's catalog estimates.
+
+STATS_TABLE = 'stock_analysis_all_results'
+STAT_COLUMNS = ['closing_price', 'change_pct', 'volume', 'turnover', 'rsi']
+
+# Data-quality thresholds
+MIN_COVERAGE = 0.9
+MAX_NULL_RATE = 0.05
+
+def stat_columns(cur):
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = %s;
+    """, (STATS_TABLE,))
+    available = {row[0] for row in cur.fetchall()}
+    return [c for c in STAT_COLUMNS if c in available]
+
+def count_expressions(columns):
+    nulls = ', '.join(f"'{c}', COUNT(*) FILTER (WHERE {c} IS NULL)" for c in columns)
+    zeros = ', '.join(f"'{c}', COUNT(*) FILTER (WHERE {c} = 0)" for c in columns)
+    return f"COUNT(*), MIN(date), MAX(date), jsonb_build_object({nulls}), jsonb_build_object({zeros})"
+
+def recount(cur, columns, symbols=None):
+    # Full per-symbol recount; symbols=None recounts the whole table
+    where = "WHERE symbol IS NOT NULL" if symbols is None else "WHERE symbol = ANY(%s)"
+    cur.execute(f"""
+        INSERT INTO symbol_stats (symbol, row_count, first_date, last_date, null_counts, zero_counts, updated_at)
+        SELECT symbol, {count_expressions(columns)}, CURRENT_TIMESTAMP
+        FROM {STATS_TABLE}
+        {where}
+        GROUP BY symbol
+        ON CONFLICT (symbol) DO UPDATE SET
+            row_count = EXCLUDED.row_count,
+            first_date = EXCLUDED.first_date,
+            last_date = EXCLUDED.last_date,
+            null_counts = EXCLUDED.null_counts,
+            zero_counts = EXCLUDED.zero_counts,
+            updated_at = EXCLUDED.updated_at;
+    """, () if symbols is None else (symbols,))
+    return cur.rowcount
+
+def add_counts(stored, added):
+    return {c: int(stored.get(c, 0)) + int(n) for c, n in added.items()}
+
+def apply_changes(cur, columns, through):
+    # Counts only the rows ingested since `through`. Rows dated after a
+    # symbol's stored last_date are appends and are added to its running
+    # counts; a change to a date already counted may have replaced a row, so
+    # that symbol alone is recounted.
+    cur.execute(f"""
+        SELECT symbol, {count_expressions(columns)}
+        FROM {STATS_TABLE}
+        WHERE ingest_seq > %s AND symbol IS NOT NULL
+        GROUP BY symbol;
+    """, (through,))
+    changed = cur.fetchall()
+    if not changed:
+        return 0
+    cur.execute("""
+        SELECT symbol, row_count, first_date, last_date, null_counts, zero_counts
+        FROM symbol_stats WHERE symbol = ANY(%s);
+    """, ([row[0] for row in changed],))
+    stored = {row[0]: row for row in cur.fetchall()}
+
+    appended, rewritten = [], []
+    for symbol, rows, first_date, last_date, nulls, zeros in changed:
+        before = stored.get(symbol)
+        if before is None:
+            appended.append((symbol, rows, first_date, last_date, json.dumps(nulls), json.dumps(zeros)))
+        elif before[3] is not None and first_date > before[3]:
+            appended.append((
+                symbol, before[1] + rows, min(before[2], first_date), last_date,
+                json.dumps(add_counts(before[4], nulls)), json.dumps(add_counts(before[5], zeros))
+            ))
+        else:
+            rewritten.append(symbol)
+    if appended:
+        execute_values(cur, """
+            INSERT INTO symbol_stats (symbol, row_count, first_date, last_date, null_counts, zero_counts)
+            VALUES %s
+            ON CONFLICT (symbol) DO UPDATE SET
+                row_count = EXCLUDED.row_count,
+                first_date = EXCLUDED.first_date,
+                last_date = EXCLUDED.last_date,
+                null_counts = EXCLUDED.null_counts,
+                zero_counts = EXCLUDED.zero_counts,
+                updated_at = CURRENT_TIMESTAMP;
+        """, appended)
+    if rewritten:
+        recount(cur, columns, rewritten)
+    return len(appended) + len(rewritten)
+
+def refresh_symbol_stats(conn, full=False):
+    ensure_table_stats_tables(conn)
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        current = ingest_watermark(conn)
+        cur.execute("SELECT through_seq FROM table_stats_state WHERE table_name = %s;", (STATS_TABLE,))
+        row = cur.fetchone()
+        through = row[0] if row else None
+
+        columns = stat_columns(cur)
+        if full or through is None or current is None:
+            cur.execute("DELETE FROM symbol_stats;")
+            refreshed = recount(cur, columns)
+        elif current <= through:
+            return 0
+        else:
+            refreshed = apply_changes(cur, columns, through)
+        cur.execute("""
+            INSERT INTO table_stats_state (table_name, through_seq, refreshed_at)
+            VALUES (%s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (table_name) DO UPDATE SET
+                through_seq = EXCLUDED.through_seq,
+                refreshed_at = EXCLUDED.refreshed_at;
+        """, (STATS_TABLE, current))
+    conn.commit()
+    print(f"Refreshed stats for {refreshed} symbols in {time.perf_counter() - started:.2f}s")
+    return refreshed
+
+#-----------------------------------
+# Readers
+#-----------------------------------
+
+def stats_available(cur):
+    cur.execute("SELECT to_regclass('symbol_stats') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        return False
+    cur.execute("SELECT EXISTS (SELECT 1 FROM symbol_stats);")
+    return cur.fetchone()[0]
+
+def load_symbol_stats(cur):
+    cur.execute("""
+        SELECT symbol, row_count, first_date, last_date, null_counts, zero_counts
+        FROM symbol_stats
+        ORDER BY symbol;
+    """)
+    return cur.fetchall()
+
+def catalog_estimates(cur, table=STATS_TABLE):
+    # Planner statistics (as of the last ANALYZE): no table access at all.
+    # A partitioned parent keeps neither row estimates nor column stats of
+    # its own, so both come from its leaf partitions, weighted by their rows.
+    cur.execute("""
+        SELECT c.relname, GREATEST(c.reltuples, 0)
+        FROM pg_class c
+        WHERE c.oid IN (SELECT relid FROM pg_partition_tree(to_regclass(%s)) WHERE isleaf)
+           OR (c.oid = to_regclass(%s) AND c.relkind = 'r');
+    """, (table, table))
+    weights = dict(cur.fetchall())
+    rows = int(sum(weights.values()))
+    cur.execute("""
+        SELECT tablename, attname, null_frac, most_common_vals::text, most_common_freqs
+        FROM pg_stats
+        WHERE schemaname = 'public' AND tablename = ANY(%s) AND NOT inherited;
+    """, (list(weights),))
+    sums = {}
+    for relname, name, null_frac, common_vals, common_freqs in cur.fetchall():
+        zero_frac = 0.0
+        if common_vals and common_freqs:
+            values = common_vals.strip('{}').split(',')
+            for value, freq in zip(values, common_freqs):
+                try:
+                    if float(value.strip('"')) == 0:
+                        zero_frac += freq
+                except ValueError:
+                    break
+        # Partitions never analyzed yet (reltuples 0) still count once
+        weight = float(weights[relname]) or (0.0 if rows else 1.0)
+        total = sums.setdefault(name, [0.0, 0.0, 0.0])
+        total[0] += float(null_frac) * weight
+        total[1] += zero_frac * weight
+        total[2] += weight
+    columns = {
+        name: {'null_frac': n / w, 'zero_frac': z / w}
+        for name, (n, z, w) in sums.items() if w
+    }
+    return {'row_estimate': rows, 'columns': columns}
+
+def summarize(stats, columns=STAT_COLUMNS):
+    total = sum(r[1] for r in stats)
+    nulls = {c: sum(int(r[4].get(c, 0)) for r in stats) for c in columns}
+    zeros = {c: sum(int(r[5].get(c, 0)) for r in stats) for c in columns}
+    return {
+        'record_count': total,
+        'symbol_count': len(stats),
+        'first_date': str(min(r[2] for r in stats)) if stats else None,
+        'last_date': str(max(r[3] for r in stats)) if stats else None,
+        'null_counts': nulls,
+        'zero_counts': zeros,
+    }
+
+def freshness(cur):
+    cur.execute("SELECT through_seq, refreshed_at FROM table_stats_state WHERE table_name = %s;", (STATS_TABLE,))
+    row = cur.fetchone()
+    through, refreshed_at = row if row else (None, None)
+    current = ingest_watermark(cur.connection)
+    return {
+        'through_seq': through,
+        'current_seq': current,
+        'refreshed_at': str(refreshed_at) if refreshed_at else None,
+        'stale': current is not None and (through is None or current > through),
+    }
+
+def table_overview(conn):
+    # Record count plus null-or-zero counts, from symbol_stats or the catalog
+    with conn.cursor() as cur:
+        if stats_available(cur):
+            summary = summarize(load_symbol_stats(cur))
+            null_or_zero = {
+                c: summary['null_counts'][c] + summary['zero_counts'][c]
+                for c in summary['null_counts']
+            }
+            return {
+                'source': 'symbol_stats',
+                'record_count': summary['record_count'],
+                'null_or_zero': null_or_zero,
+                'freshness': freshness(cur),
+            }
+        estimates = catalog_estimates(cur)
+        rows = estimates['row_estimate']
+        null_or_zero = {
+            c: int(round((s['null_frac'] + s['zero_frac']) * rows))
+            for c, s in estimates['columns'].items() if c in STAT_COLUMNS
+        }
+        return {
+            'source': 'catalog_estimate',
+            'record_count': rows,
+            'null_or_zero': null_or_zero,
+        }
+
+def data_quality_report(conn, trading_dates=None):
+    # trading_dates: sorted datetime64[D] market calendar, used for coverage
+    with conn.cursor() as cur:
+        if not stats_available(cur):
+            return None
+        stats = load_symbol_stats(cur)
+        status = freshness(cur)
+    summary = summarize(stats)
+    market_last = max(r[3] for r in stats) if stats else None
+
+    lagging, gaps, null_heavy = [], [], []
+    for symbol, row_count, first_date, last_date, null_counts, _ in stats:
+        if market_last is not None and last_date is not None and last_date < market_last:
+            lagging.append({'symbol': symbol, 'last_date': str(last_date)})
+        if trading_dates is not None and first_date is not None and len(trading_dates):
+            lo = np.searchsorted(trading_dates, np.datetime64(first_date, 'D'), side='left')
+            hi = np.searchsorted(trading_dates, np.datetime64(last_date, 'D'), side='right')
+            expected = int(hi - lo)
+            if expected and row_count / expected < MIN_COVERAGE:
+                gaps.append({
+                    'symbol': symbol, 'rows': row_count, 'expected': expected,
+                    'coverage': round(row_count / expected, 3)
+                })
+        worst = max(STAT_COLUMNS, key=lambda c: int(null_counts.get(c, 0)))
+        if row_count and int(null_counts.get(worst, 0)) / row_count > MAX_NULL_RATE:
+            null_heavy.append({
+                'symbol': symbol, 'column': worst,
+                'null_rate': round(int(null_counts[worst]) / row_count, 3)
+            })
+
+    total = summary['record_count']
+    return {
+        'summary': summary,
+        'column_null_rates': {
+            c: round(n / total, 4) if total else None for c, n in summary['null_counts'].items()
+        },
+        'lagging_symbols': sorted(lagging, key=lambda r: r['last_date']),
+        'coverage_gaps': sorted(gaps, key=lambda r: r['coverage']),
+        'null_heavy_symbols': sorted(null_heavy, key=lambda r: -r['null_rate']),
+        'freshness': status,
+    }
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Refresh per-symbol statistics for stock_analysis_all_results")
+    parser.add_argument("--full", action="store_true", help="recount every symbol")
+    args = parser.parse_args()
+    conn = init_connection()
+    try:
+        refresh_symbol_stats(conn, full=args.full)
+        print(json.dumps(table_overview(conn), indent=2, default=str))
+    finally:
+        conn.close()
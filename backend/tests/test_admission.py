@@ -0,0 +1,52 @@
+import threading
+import time
+
+import admission
+
+def run_concurrently(controller, cost, count, hold=0.2):
+    # Admits `count` requests of one class at once; returns (served, rejected)
+    barrier = threading.Barrier(count)
+    served, rejected = [], []
+
+    def request():
+        barrier.wait()
+        try:
+            controller.admit(cost)
+        except admission.AdmissionRejected:
+            rejected.append(1)
+            return
+        time.sleep(hold)
+        controller.release(cost, hold)
+        served.append(1)
+
+    threads = [threading.Thread(target=request) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return len(served), len(rejected)
+
+def test_page_batch_of_medium_requests_is_admitted():
+    # frontend-next's OHLCV batch route sends five medium requests at once
+    controller = admission.AdmissionController(admission.default_classes())
+    assert run_concurrently(controller, 'medium', 5) == (5, 0)
+
+def test_medium_queue_absorbs_burst_beyond_limit():
+    controller = admission.AdmissionController(admission.default_classes())
+    medium = controller.classes['medium']
+    burst = medium.limit + medium.queue
+    assert run_concurrently(controller, 'medium', burst) == (burst, 0)
+    assert medium.snapshot()['queued'] == medium.queue
+
+def test_burst_beyond_queue_is_rejected():
+    controller = admission.AdmissionController(admission.default_classes())
+    heavy = controller.classes['heavy']
+    served, rejected = run_concurrently(controller, 'heavy', heavy.limit + heavy.queue + 2)
+    assert served == heavy.limit + heavy.queue
+    assert rejected == 2
+
+def test_light_requests_keep_a_thread_when_heavy_and_medium_are_full():
+    threads = admission.REQUEST_THREADS
+    classes = admission.default_classes(threads, admission.LIGHT_RESERVE)
+    held = sum(limit + queue for name, (limit, queue, _) in classes.items() if name != 'light')
+    assert held <= threads - admission.LIGHT_RESERVE
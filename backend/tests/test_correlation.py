@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+import correlation
+from leaderboard import select_top
+
+def test_pairs_below_one_is_rejected():
+    with pytest.raises(correlation.CorrelationError):
+        correlation.validate_params(correlation.DEFAULT_WINDOW, 0)
+    correlation.validate_params(correlation.DEFAULT_WINDOW, 1)
+
+def test_pairs_above_maximum_is_rejected():
+    with pytest.raises(correlation.CorrelationError):
+        correlation.validate_params(correlation.DEFAULT_WINDOW, correlation.MAX_PAIRS + 1)
+
+def test_select_top_of_zero_is_empty():
+    values = np.array([0.5, np.nan, 0.9, -0.2])
+    assert select_top(values, 0).tolist() == []
+    assert select_top(values, 1).tolist() == [2]
+    assert select_top(values, 1, largest=False).tolist() == [3]
+
+def test_top_pairs_with_single_pair():
+    corr = np.array([[1.0, 0.8, 0.1], [0.8, 1.0, -0.4], [0.1, -0.4, 1.0]])
+    counts = np.full((3, 3), 30)
+    best = correlation.top_pairs(['A', 'B', 'C'], corr, counts, 1)
+    worst = correlation.top_pairs(['A', 'B', 'C'], corr, counts, 1, largest=False)
+    assert best == [{'symbols': ['A', 'B'], 'correlation': 0.8, 'overlap': 30}]
+    assert worst[0]['symbols'] == ['B', 'C']
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import screener
+
+def frame():
+    return pd.DataFrame({
+        'symbol': ['A', 'B', 'C', 'D'],
+        'rsi': [40.0, np.nan, 60.0, 50.0],
+        'rsi_divergence': ['Bullish Divergence', None, 'Bearish Divergence', None],
+    })
+
+def matches(spec):
+    screen = screener.Screen('s', spec)
+    return frame()['symbol'][screen.mask(frame())].tolist()
+
+def test_not_equal_skips_missing_values_like_sql():
+    assert matches({"field": "rsi", "op": "!=", "value": 50}) == ['A', 'C']
+    assert matches({"field": "rsi_divergence", "op": "!=", "value": "Bullish Divergence"}) == ['C']
+
+def test_missing_values_never_match_inside_any():
+    spec = {"any": [
+        {"field": "rsi", "op": "<", "value": 45},
+        {"field": "rsi_divergence", "op": "!=", "value": "Bearish Divergence"},
+    ]}
+    assert matches(spec) == ['A']
+
+def test_node_with_all_and_any_is_rejected():
+    spec = {"all": [{"field": "rsi", "op": ">", "value": 1}],
+            "any": [{"field": "rsi", "op": "<", "value": 2}]}
+    with pytest.raises(screener.ScreenError):
+        screener.Screen('s', spec)
+
+def test_screens_must_be_an_object():
+    with pytest.raises(screener.ScreenError):
+        screener.compile_screens([{"field": "rsi", "op": ">", "value": 1}])
+
+def test_fields_missing_from_the_table_are_rejected():
+    screens = screener.compile_screens({
+        'trend': {"all": [{"field": "ema_20", "op": ">", "value": 1}, {"field": "rsi", "op": ">", "value": 1}]}
+    })
+    with pytest.raises(screener.ScreenError, match='ema_20'):
+        screener.require_columns(screens, ['symbol', 'date', 'rsi'])
+    screener.require_columns(screens, ['symbol', 'date', 'rsi', 'ema_20'])
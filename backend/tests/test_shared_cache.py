@@ -0,0 +1,52 @@
+import os
+import threading
+
+import pytest
+
+import shared_cache
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, 'CACHE_DIR', str(tmp_path))
+    return tmp_path
+
+def test_lock_files_are_removed_with_their_computation(cache_dir):
+    for i in range(20):
+        shared_cache.get_or_compute(f"key-{i}", lambda: b"value")
+    with pytest.raises(RuntimeError):
+        shared_cache.get_or_compute("failing", lambda: (_ for _ in ()).throw(RuntimeError("boom")))
+    assert not [name for name in os.listdir(cache_dir) if name.endswith('.lock') and name != '.evict.lock']
+
+def test_concurrent_misses_compute_once(cache_dir):
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        threading.Event().wait(0.1)
+        return b"value"
+
+    def request():
+        barrier.wait()
+        assert shared_cache.get_or_compute("shared", compute)[0] == b"value"
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+
+def test_eviction_runs_on_a_budget_and_trims_to_low_water(cache_dir, monkeypatch):
+    monkeypatch.setattr(shared_cache, 'MAX_BYTES', 1000)
+    monkeypatch.setattr(shared_cache, 'EVICT_EVERY_BYTES', 500)
+    monkeypatch.setattr(shared_cache, 'EVICT_EVERY_SECONDS', 3600)
+    monkeypatch.setattr(shared_cache, '_evict_state', {'written': 0, 'checked': float('inf')})
+    scans = shared_cache.stats()['eviction_scans']
+    for i in range(15):
+        shared_cache.put(f"entry-{i}", b"x" * 100)
+    # 1500 bytes written: three scans, not fifteen
+    assert shared_cache.stats()['eviction_scans'] - scans == 3
+    shared_cache.evict()
+    total = sum(os.path.getsize(cache_dir / name) for name in os.listdir(cache_dir) if name.endswith('.bin'))
+    assert total <= 900
@@ -0,0 +1,25 @@
+import shared_cache
+import tv_prefetch
+
+def test_background_leaves_reserve_for_user_misses(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, 'CACHE_DIR', str(tmp_path))
+    limiter = tv_prefetch.RateLimiter(rate=0.001, burst=3)
+    # Background drains the bucket down to the reserve...
+    assert limiter.try_acquire(reserve=2) == 0
+    assert limiter.try_acquire(reserve=2) > 0
+    # ...and user fetches still find tokens
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() > 0
+
+def test_cadence_stretches_to_fit_the_rate_budget(monkeypatch):
+    scheduler = tv_prefetch.PrefetchScheduler(fetchers={}, universe=list)
+    monkeypatch.setattr(tv_prefetch, 'REFRESH_SECONDS', {'price': 60.0, 'bars': 900.0})
+    monkeypatch.setattr(tv_prefetch, 'RATE_PER_SECOND', 2.0)
+    monkeypatch.setattr(tv_prefetch, 'BACKGROUND_RATE_SHARE', 0.75)
+    # A small universe keeps the configured cadence
+    assert scheduler.plan_intervals(20) == {'price': 60.0, 'bars': 900.0}
+    intervals = scheduler.plan_intervals(300)
+    calls_per_second = sum(300 / seconds for seconds in intervals.values())
+    assert abs(calls_per_second - 1.5) < 1e-9
+    assert abs(intervals['bars'] / intervals['price'] - 15) < 1e-9
@@ -0,0 +1,467 @@
+import heapq
+import itertools
+import json
+import os
+import re
+import threading
+import time
+
+import shared_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+#-----------------------------------
+# TradingView prefetch scheduler
+#-----------------------------------
+
+# Keeps latest prices and daily bars for the active universe warm so request
+# handlers read from cache instead of waiting on TradingView:
+#   * one process per host (elected with a flock) refreshes the whole universe
+#     on a fixed cadence at background priority;
+#   * every process serves cache misses at user priority, which jumps ahead of
+#     any queued background work;
+#   * all upstream calls on the host share one token-bucket rate limit, and
+#     background fetches leave a reserve of tokens for user misses;
+#   * the cadence stretches when the universe needs more calls than the
+#     background share of the rate allows, and cache freshness follows it;
+#   * results are published to shared_cache, so every worker sees them.
+# The active universe is the symbol list from the panel plus symbols users
+# have asked for recently (tracked as touch files visible to all workers).
+
+PRICE_REFRESH_SECONDS = float(os.environ.get("TV_PRICE_REFRESH_SECONDS", "60"))
+BARS_REFRESH_SECONDS = float(os.environ.get("TV_BARS_REFRESH_SECONDS", "900"))
+RATE_PER_SECOND = float(os.environ.get("TV_RATE_PER_SECOND", "2"))
+RATE_BURST = float(os.environ.get("TV_RATE_BURST", "5"))
+RECENT_TTL_SECONDS = float(os.environ.get("TV_RECENT_TTL_SECONDS", "3600"))
+REQUEST_WAIT_SECONDS = float(os.environ.get("TV_REQUEST_WAIT_SECONDS", "5"))
+FETCH_WORKERS = int(os.environ.get("TV_PREFETCH_WORKERS", "2"))
+LATENCY_BUDGET_SECONDS = float(os.environ.get("TV_LATENCY_BUDGET_SECONDS", "1.5"))
+CALL_DEADLINE_SECONDS = float(os.environ.get("TV_CALL_DEADLINE_SECONDS", "4"))
+BREAKER_THRESHOLD = int(os.environ.get("TV_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get("TV_BREAKER_COOLDOWN_SECONDS", "60"))
+# Tokens background fetches never take, and the share of the rate the cadence plans for
+USER_RESERVE_TOKENS = float(os.environ.get("TV_USER_RESERVE_TOKENS", "2"))
+BACKGROUND_RATE_SHARE = float(os.environ.get("TV_BACKGROUND_RATE_SHARE", "0.75"))
+
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 10
+
+REFRESH_SECONDS = {
+    'price': PRICE_REFRESH_SECONDS,
+    'bars': BARS_REFRESH_SECONDS,
+}
+
+def state_dir():
+    path = os.path.join(shared_cache.CACHE_DIR, "tv-prefetch")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def safe_symbol(symbol):
+    return re.sub(r'[^A-Za-z0-9._-]', '_', symbol)
+
+class RateLimiter:
+    # Token bucket shared by every process on the host (state file + flock)
+    def __init__(self, rate=RATE_PER_SECOND, burst=RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.local_lock = threading.Lock()
+        self.local_state = [burst, time.time()]
+
+    def try_acquire(self, reserve=0):
+        # Returns 0 when a token was taken, otherwise seconds until the next one.
+        # `reserve` tokens are left in the bucket for other callers.
+        if fcntl is None:
+            with self.local_lock:
+                return self._take(self.local_state, reserve)
+        path = os.path.join(state_dir(), "rate-limit")
+        with self.local_lock, open(path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read().split()
+                state = [float(raw[0]), float(raw[1])] if len(raw) == 2 else [self.burst, time.time()]
+                wait = self._take(state, reserve)
+                f.seek(0)
+                f.truncate()
+                f.write(f"{state[0]} {state[1]}")
+                f.flush()
+                return wait
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _take(self, state, reserve):
+        now = time.time()
+        state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+        state[1] = now
+        if state[0] >= 1 + reserve:
+            state[0] -= 1
+            return 0
+        return (1 + reserve - state[0]) / self.rate
+
+    def acquire(self, reserve=0):
+        while True:
+            wait = self.try_acquire(reserve)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+class CircuitBreaker:
+    # closed -> open after `threshold` consecutive failures; after `cooldown`
+    # one trial call is let through (half-open) and its outcome decides
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self.rejected = 0
+
+    def allow(self):
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.time() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+                return True
+            self.rejected += 1
+            return False
+
+    def is_open(self):
+        # Request-path check: True while upstream calls are being skipped
+        with self.lock:
+            if self.state == 'open':
+                return time.time() - self.opened_at < self.cooldown
+            return self.state == 'half_open'
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                self.state = 'open'
+                self.opened_at = time.time()
+
+    def snapshot(self):
+        with self.lock:
+            retry_in = None
+            if self.state == 'open':
+                retry_in = max(0.0, round(self.opened_at + self.cooldown - time.time(), 1))
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'retry_in_seconds': retry_in,
+            }
+
+class PrefetchScheduler:
+    def __init__(self, fetchers, universe):
+        # fetchers: {'price': fn(symbol) -> value, 'bars': fn(symbol) -> value}
+        # universe: fn() -> iterable of symbols to keep warm
+        self.fetchers = fetchers
+        self.universe = universe
+        self.limiter = RateLimiter()
+        self.breaker = CircuitBreaker()
+        self.queue = []
+        self.pending = {}
+        self.counter = itertools.count()
+        self.cond = threading.Condition()
+        self.waiters = {}
+        self.pid = None
+        self.leader_file = None
+        self.is_leader = False
+        self.listeners = []
+        self.intervals = dict(REFRESH_SECONDS)
+        self.intervals_read_at = 0.0
+        self.counter_lock = threading.Lock()
+        self.counters = {
+            'fetched': 0, 'failed': 0, 'skipped': 0, 'user_requests': 0,
+            'cache_hits': 0, 'hedged': 0, 'fallbacks': 0, 'stale': 0
+        }
+
+    def count(self, name):
+        with self.counter_lock:
+            self.counters[name] += 1
+
+    #-------------------------------
+    # Cache access
+    #-------------------------------
+
+    def cache_key(self, kind, symbol):
+        return shared_cache.make_key(f"tv-{kind}", {'symbol': symbol}, None)
+
+    def read(self, kind, symbol):
+        data = shared_cache.get(self.cache_key(kind, symbol))
+        if data is None:
+            return None, None
+        entry = json.loads(data)
+        return entry['value'], time.time() - entry['fetched_at']
+
+    def publish(self, kind, symbol, value):
+        entry = {'value': value, 'fetched_at': time.time()}
+        shared_cache.put(self.cache_key(kind, symbol), json.dumps(entry).encode('utf-8'))
+        for listener in self.listeners:
+            try:
+                listener(kind, symbol, value)
+            except Exception as e:
+                print(f"Prefetch listener {listener.__name__} failed: {e}")
+
+    def add_listener(self, listener):
+        # listener(kind, symbol, value), called in the fetching thread after each publish
+        self.listeners.append(listener)
+
+    def lookup(self, kind, symbol, wait=REQUEST_WAIT_SECONDS):
+        # Request path: fresh cache hit, otherwise a user-priority fetch
+        self.touch_recent(symbol)
+        value, age = self.read(kind, symbol)
+        if value is not None and age <= self.max_age(kind):
+            self.count('cache_hits')
+            return value
+        self.count('user_requests')
+        event = self.submit(kind, symbol, PRIORITY_USER)
+        event.wait(wait)
+        fresh, _ = self.read(kind, symbol)
+        # A stale value still beats no value when upstream is slow
+        return fresh if fresh is not None else value
+
+    def lookup_hedged(self, kind, symbol, fallback, budget=LATENCY_BUDGET_SECONDS,
+                      deadline=CALL_DEADLINE_SECONDS):
+        # Returns (value, source) with source 'upstream', 'stale' or
+        # 'fallback'. Upstream gets `budget` seconds on its own. After that a
+        # stale cached value is served if there is one, otherwise `fallback`
+        # runs in parallel and whichever answers first wins. Latency is
+        # bounded by `deadline` (plus the fallback itself), never by upstream.
+        self.touch_recent(symbol)
+        value, age = self.read(kind, symbol)
+        if value is not None and age <= self.max_age(kind):
+            self.count('cache_hits')
+            return value, 'upstream'
+        if self.breaker.is_open():
+            if value is not None:
+                self.count('stale')
+                return value, 'stale'
+            self.count('fallbacks')
+            return fallback(), 'fallback'
+
+        self.count('user_requests')
+        event = self.submit(kind, symbol, PRIORITY_USER)
+        if not event.wait(budget) and value is not None:
+            # Upstream is slow; its fetch still lands in the cache
+            self.count('stale')
+            return value, 'stale'
+        if not event.is_set():
+            self.count('hedged')
+            result = {}
+            done = threading.Event()
+
+            def run_fallback():
+                try:
+                    result['value'] = fallback()
+                except Exception as e:
+                    result['error'] = e
+                finally:
+                    done.set()
+
+            threading.Thread(target=run_fallback, daemon=True).start()
+            stop_at = time.time() + max(0.0, deadline - budget)
+            while not event.is_set() and not done.is_set() and time.time() < stop_at:
+                done.wait(0.05)
+            if not event.is_set():
+                # Upstream lost the race; its fetch still lands in the cache
+                done.wait()
+                if 'error' in result:
+                    raise result['error']
+                self.count('fallbacks')
+                return result['value'], 'fallback'
+
+        fresh, _ = self.read(kind, symbol)
+        if fresh is not None:
+            return fresh, 'upstream'
+        if value is not None:
+            self.count('stale')
+            return value, 'stale'
+        self.count('fallbacks')
+        return fallback(), 'fallback'
+
+    #-------------------------------
+    # Queue
+    #-------------------------------
+
+    def submit(self, kind, symbol, priority):
+        task = (kind, symbol)
+        with self.cond:
+            event = self.waiters.setdefault(task, threading.Event())
+            current = self.pending.get(task)
+            if current is None or priority < current:
+                self.pending[task] = priority
+                heapq.heappush(self.queue, (priority, next(self.counter), kind, symbol))
+                self.cond.notify()
+            return event
+
+    def next_task(self):
+        with self.cond:
+            while True:
+                while not self.queue:
+                    self.cond.wait()
+                priority, _, kind, symbol = heapq.heappop(self.queue)
+                # Skip entries superseded by a higher-priority resubmission
+                if self.pending.get((kind, symbol)) == priority:
+                    del self.pending[(kind, symbol)]
+                    return kind, symbol, priority
+
+    def worker_loop(self):
+        while True:
+            kind, symbol, priority = self.next_task()
+            try:
+                if not self.breaker.allow():
+                    self.count('skipped')
+                    continue
+                self.limiter.acquire(0 if priority == PRIORITY_USER else USER_RESERVE_TOKENS)
+                started = time.time()
+                try:
+                    value = self.fetchers[kind](symbol)
+                except Exception as e:
+                    value = None
+                    print(f"Prefetch of {kind} for {symbol} failed: {e}")
+                # tvDatafeed logs and returns None on connection errors, so an
+                # empty or late answer counts against the breaker too
+                if value is None or time.time() - started > CALL_DEADLINE_SECONDS:
+                    self.count('failed')
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if value is not None:
+                    self.publish(kind, symbol, value)
+                    self.count('fetched')
+            finally:
+                with self.cond:
+                    event = self.waiters.pop((kind, symbol), None)
+                if event is not None:
+                    event.set()
+
+    #-------------------------------
+    # Background cadence (one process per host)
+    #-------------------------------
+
+    def touch_recent(self, symbol):
+        path = os.path.join(state_dir(), "recent", safe_symbol(symbol))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(symbol)
+        except OSError:
+            pass
+
+    def recent_symbols(self):
+        directory = os.path.join(state_dir(), "recent")
+        cutoff = time.time() - RECENT_TTL_SECONDS
+        symbols = set()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.stat().st_mtime >= cutoff:
+                            with open(entry.path) as f:
+                                symbols.add(f.read().strip())
+                        else:
+                            os.remove(entry.path)
+                    except OSError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return symbols
+
+    def active_universe(self):
+        symbols = set(self.recent_symbols())
+        try:
+            symbols.update(self.universe())
+        except Exception as e:
+            print(f"Prefetch universe unavailable: {e}")
+        return sorted(s for s in symbols if s)
+
+    def try_become_leader(self):
+        if fcntl is None:
+            return True
+        if self.leader_file is None:
+            self.leader_file = open(os.path.join(state_dir(), "leader.lock"), 'a')
+        try:
+            fcntl.flock(self.leader_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.is_leader = True
+        except OSError:
+            self.is_leader = False
+        return self.is_leader
+
+    def plan_intervals(self, symbols):
+        # One pass per kind costs one call per symbol. Stretch both intervals
+        # by the same factor when that exceeds the background share of the rate.
+        demand = sum(symbols / seconds for seconds in REFRESH_SECONDS.values())
+        stretch = max(1.0, demand / (RATE_PER_SECOND * BACKGROUND_RATE_SHARE))
+        return {kind: seconds * stretch for kind, seconds in REFRESH_SECONDS.items()}
+
+    def publish_intervals(self, intervals):
+        path = os.path.join(state_dir(), "intervals")
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, 'w') as f:
+            json.dump(intervals, f)
+        os.replace(tmp, path)
+        self.intervals = intervals
+        self.intervals_read_at = time.time()
+
+    def max_age(self, kind):
+        # Entries count as fresh for two of the leader's refresh intervals
+        if time.time() - self.intervals_read_at > 5:
+            self.intervals_read_at = time.time()
+            try:
+                with open(os.path.join(state_dir(), "intervals")) as f:
+                    self.intervals = json.load(f)
+            except (OSError, ValueError):
+                pass
+        return self.intervals.get(kind, REFRESH_SECONDS[kind]) * 2
+
+    def cadence_loop(self):
+        last_run = {'price': 0.0, 'bars': 0.0}
+        while True:
+            if self.try_become_leader():
+                now = time.time()
+                universe = self.active_universe()
+                intervals = self.plan_intervals(len(universe))
+                if intervals != self.intervals:
+                    self.publish_intervals(intervals)
+                for kind in intervals:
+                    if now - last_run[kind] >= intervals[kind]:
+                        for symbol in universe:
+                            self.submit(kind, symbol, PRIORITY_BACKGROUND)
+                        last_run[kind] = now
+            time.sleep(min(5.0, PRICE_REFRESH_SECONDS))
+
+    def start(self):
+        # Threads do not survive fork, so each process starts its own
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.leader_file = None
+        self.is_leader = False
+        for i in range(FETCH_WORKERS):
+            threading.Thread(target=self.worker_loop, name=f"tv-prefetch-{i}", daemon=True).start()
+        threading.Thread(target=self.cadence_loop, name="tv-prefetch-cadence", daemon=True).start()
+
+    def stats(self):
+        with self.cond:
+            queued = len(self.pending)
+        with self.counter_lock:
+            counters = dict(self.counters)
+        return dict(counters, queued=queued, leader=self.is_leader,
+                    refresh_seconds={kind: round(seconds, 1) for kind, seconds in self.intervals.items()},
+                    breaker=self.breaker.snapshot())
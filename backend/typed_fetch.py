@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from psycopg2 import extensions
+
+#-----------------------------------
+# Typed query results
+#-----------------------------------
+
+# psycopg2 returns NUMERIC as Decimal and DATE as datetime.date, so a plain
+# fetchall() builds object columns that every route then converts again.
+# Cursors from typed_cursor() cast NUMERIC to float and keep DATE as ISO text
+# while rows are read; fetch_frame() then builds each column in one pass:
+# float64 for numbers, datetime64 for dates, categoricals for the repeated
+# labels, object only for free text. The casters are registered per cursor,
+# so other code using the same connection is unaffected.
+
+CATEGORY_COLUMNS = {'symbol', 'rsi_divergence', 'volume_analysis'}
+
+FLOAT_OIDS = set(extensions.DECIMAL.values) | set(extensions.FLOAT.values)
+INTEGER_OIDS = set(extensions.INTEGER.values) | set(extensions.LONGINTEGER.values)
+DATE_OIDS = set(extensions.DATE.values)
+TIMESTAMP_OIDS = set(extensions.PYDATETIME.values) | set(extensions.PYDATETIMETZ.values)
+
+NUMERIC_AS_FLOAT = extensions.new_type(
+    extensions.DECIMAL.values, 'NUMERIC_AS_FLOAT',
+    lambda value, cur: float(value) if value is not None else None
+)
+DATE_AS_TEXT = extensions.new_type(
+    extensions.DATE.values, 'DATE_AS_TEXT',
+    lambda value, cur: value
+)
+
+def typed_cursor(conn):
+    cur = conn.cursor()
+    extensions.register_type(NUMERIC_AS_FLOAT, cur)
+    extensions.register_type(DATE_AS_TEXT, cur)
+    return cur
+
+def typed_column(name, oid, values, categories):
+    if oid in FLOAT_OIDS:
+        return np.array(values, dtype=np.float64)
+    if oid in INTEGER_OIDS:
+        return np.array(values, dtype=np.float64 if None in values else np.int64)
+    if oid in DATE_OIDS:
+        return np.array(values, dtype='datetime64[D]').astype('datetime64[ns]')
+    if oid in TIMESTAMP_OIDS:
+        return pd.to_datetime(pd.Series(values, dtype=object)).to_numpy()
+    if name in categories:
+        return pd.Categorical(values)
+    return np.array(values, dtype=object)
+
+def frame_from_rows(description, rows, categories=CATEGORY_COLUMNS):
+    names = [d[0] for d in description]
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    data = {
+        name: typed_column(name, d[1], values, categories)
+        for name, d, values in zip(names, description, columns)
+    }
+    return pd.DataFrame(data, columns=names)
+
+def fetch_frame(conn, query, params=None, categories=CATEGORY_COLUMNS):
+    with typed_cursor(conn) as cur:
+        cur.execute(query, params)
+        return frame_from_rows(cur.description, cur.fetchall(), categories)
+
+def frame_records(df):
+    # JSON-ready records: NaN, NaT and infinities become None
+    valid = df.notna()
+    for col in df.columns:
+        if df[col].dtype.kind == 'f':
+            valid[col] &= np.isfinite(df[col].to_numpy())
+    return df.astype(object).where(valid, None).to_dict(orient='records')
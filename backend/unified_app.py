@@ -1,16 +1,39 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, g
 from flask_cors import CORS
-import pandas as pd
 import psycopg2
 import os
 import urllib.parse as urlparse
 from dotenv import load_dotenv
 import json
-import numpy as np
 import math
-from tvDatafeed import TvDatafeed, Interval
 import traceback
-import requests
+import threading
+import time
+import functools
+from lazy_import import LazyModule
+import shared_cache
+import tv_prefetch
+import price_stream
+import admission
+from init_db import ensure_ingest_sequence, ensure_alert_tables, seed_financial_metrics, lock_schema
+from partitions import ensure_future_partitions
+
+# Heavy modules are imported on first use (see warm_up below)
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
+tvdatafeed = LazyModule('tvDatafeed')
+screener = LazyModule('screener')
+panel_store = LazyModule('panel_store')
+table_stats = LazyModule('table_stats')
+typed_fetch = LazyModule('typed_fetch')
+predictor_picks = LazyModule('predictor_picks')
+leaderboard = LazyModule('leaderboard')
+day_fragments = LazyModule('day_fragments')
+symbol_index = LazyModule('symbol_index')
+correlation = LazyModule('correlation')
+dividends = LazyModule('dividends')
+watchlist = LazyModule('watchlist')
+alerts = LazyModule('alerts')
 
 # Load environment variables
 load_dotenv()
@@ -62,6 +85,8 @@ def init_database():
         
         # Create tables if they don't exist
         with conn.cursor() as cur:
+            # Workers starting together would otherwise race on the DDL below
+            lock_schema(cur)
             # Check if financial_metrics table exists
             cur.execute("""
                 SELECT EXISTS (
@@ -89,23 +114,7 @@ def init_database():
                 """)
                 
                 # Insert some sample data for testing
-                cur.execute("""
-                    INSERT INTO financial_metrics (code, eps_ttm, bvps, dps, cum_np, roe, roa_ttm)
-                    VALUES
-                        ('AAF.N0000', 2.50, 15.75, 0.75, 1250000, 15.8, 8.2),
-                        ('BALA.N0000', 1.85, 12.30, 0.50, 925000, 12.4, 6.5),
-                        ('CIC.X0000', 3.20, 18.60, 1.00, 1580000, 17.2, 9.1),
-                        ('ELPL.N0000', 1.65, 10.80, 0.40, 820000, 11.5, 5.8),
-                        ('GRAN.N0000', 4.10, 22.50, 1.20, 2050000, 18.3, 9.8),
-                        ('HBS.N0000', 2.30, 14.20, 0.65, 1150000, 14.2, 7.5),
-                        ('LIOC.N0000', 5.40, 28.70, 1.50, 2700000, 19.5, 10.2),
-                        ('LVEF.N0000', 1.95, 12.80, 0.55, 975000, 13.1, 6.9),
-                        ('PARQ.N0000', 2.80, 16.40, 0.80, 1400000, 16.5, 8.8),
-                        ('SDF.N0000', 2.15, 13.60, 0.60, 1075000, 13.8, 7.2),
-                        ('SHOT.N0000', 3.50, 19.80, 1.10, 1750000, 17.8, 9.4),
-                        ('UML.N0000', 2.05, 13.20, 0.58, 1025000, 13.5, 7.0),
-                        ('AMF.N0000', 2.70, 16.10, 0.78, 1350000, 16.2, 8.6);
-                """)
+                seed_financial_metrics(conn)
                 
                 conn.commit()
                 print("Financial metrics table created and sample data inserted successfully.")
@@ -121,6 +130,10 @@ def init_database():
             columns = [row[0] for row in cur.fetchall()]
             print(f"Existing columns: {columns}")
             
+        ensure_ingest_sequence(conn)
+        ensure_future_partitions(conn)
+        ensure_alert_tables(conn)
+        dividends.ensure_aggregates(conn)
         conn.close()
         print("Database initialization completed.")
         return True
@@ -130,164 +143,442 @@ def init_database():
         traceback.print_exc()
         return False
 
-def load_data():
-    conn = init_connection()
+def load_fundamentals(conn):
     with conn.cursor() as cur:
-        cur.execute("SELECT * FROM stock_analysis_all_results;")
-        colnames = [desc[0] for desc in cur.description]
-        rows = cur.fetchall()
-    conn.close()
-    df = pd.DataFrame(rows, columns=colnames)
-    if 'date' in df.columns:
-        df['date'] = pd.to_datetime(df['date'])
-    return df
+        cur.execute("SELECT to_regclass('financial_metrics') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return None
+    return typed_fetch.fetch_frame(conn, "SELECT * FROM financial_metrics;")
 
 #-----------------------------------
-# TradingView Data Functions - Implemented directly here
+# In-memory snapshots
 #-----------------------------------
 
-def get_tv_latest_price(symbol):
+# The memory-mapped symbols x dates panel and the fundamentals table are held
+# per process and reloaded only when the database watermark moves (checked at
+# most every SNAPSHOT_CHECK_SECONDS). Market data is served from the panel
+# files, which every worker maps from the same page cache: after an ingest
+# one process rebuilds them (see panel_store.refresh_panel) and the others
+# only re-map, so neither memory nor database reads grow with the workers.
+# Checks and rebuilds run on a background thread and the results are swapped
+# in whole; requests keep reading the previous snapshots meanwhile and only
+# wait when nothing has been loaded yet.
+
+SNAPSHOT_CHECK_SECONDS = int(os.environ.get("SNAPSHOT_CHECK_SECONDS", "60"))
+_snapshot_lock = threading.Lock()
+_snapshots = {
+    'watermark': None,
+    'checked': 0.0,
+    'panel': None,
+    'fundamentals': None,
+    'fundamentals_version': None,
+    'symbol_index': None
+}
+_snapshot_refresh = {'thread': None, 'error': None}
+
+def fundamentals_version(fundamentals):
+    if fundamentals is None:
+        return None
+    last_updated = fundamentals['last_updated'].max() if 'last_updated' in fundamentals.columns else None
+    return f"{len(fundamentals)}:{last_updated}"
+
+def refresh_snapshots(force=False):
+    with _snapshot_lock:
+        current = dict(_snapshots)
+    conn = init_connection()
     try:
-        tv = TvDatafeed()
-        index_data = tv.get_hist(
-            symbol=symbol,
-            exchange='CSELK',
-            interval=Interval.in_daily,
-            n_bars=10
+        watermark = panel_store.market_watermark(conn)
+        fundamentals = load_fundamentals(conn)
+    finally:
+        conn.close()
+    updated = {'fundamentals': fundamentals, 'fundamentals_version': fundamentals_version(fundamentals)}
+    reloaded = force or current['panel'] is None or watermark != current['watermark']
+    if reloaded:
+        panel = panel_store.refresh_panel()
+        # The panel's own watermark: the database may have moved again while it was built
+        updated['panel'] = panel
+        updated['watermark'] = panel.watermark
+        print(f"Mapped market panel at watermark {panel.watermark}: {panel.shape[0]} symbols x {panel.shape[1]} days")
+    if current['symbol_index'] is None or reloaded or updated['fundamentals_version'] != current['fundamentals_version']:
+        panel = updated.get('panel', current['panel'])
+        updated['symbol_index'] = symbol_index.SymbolIndex(
+            panel.symbols.tolist() if panel is not None else [],
+            symbol_index.names_from_fundamentals(fundamentals)
         )
-        
-        if index_data is not None and 'close' in index_data and len(index_data) > 0:
-            return {"latestPrice": float(index_data['close'].iloc[-1])}
-        
-        # Fallback to database closing price if TradingView API fails
-        try:
-            # Get the latest price from the database
-            conn = init_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT closing_price FROM stock_analysis_all_results WHERE symbol = %s ORDER BY date DESC LIMIT 1",
-                (symbol,)
-            )
-            result = cursor.fetchone()
-            if result and result[0]:
-                return {"latestPrice": float(result[0]), "fallback": "database"}
-            
-            # If no database price is found, return a more informative fallback
-            return {"latestPrice": None, "fallback": "no_data", "message": "No price data available"}
-        except Exception as db_error:
-            print(f"Database fallback error for {symbol}: {str(db_error)}")
-            # Return a clear indication that this is not real data
-            return {"latestPrice": None, "fallback": "error", "message": "Price data unavailable"}
+    updated['checked'] = time.time()
+    with _snapshot_lock:
+        _snapshots.update(updated)
+
+def run_snapshot_refresh():
+    try:
+        refresh_snapshots()
+        _snapshot_refresh['error'] = None
     except Exception as e:
-        print(f"Error fetching latest price: {str(e)}")
-        # Try database fallback
+        _snapshot_refresh['error'] = str(e)
+        print(f"Snapshot refresh failed: {e}")
+        traceback.print_exc()
+        with _snapshot_lock:
+            if _snapshots['panel'] is not None:
+                # Keep serving the loaded snapshots; retry after the next interval
+                _snapshots['checked'] = time.time()
+
+def start_snapshot_refresh():
+    # At most one refresh per process at a time; returns the running thread
+    with _snapshot_lock:
+        thread = _snapshot_refresh['thread']
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=run_snapshot_refresh, name='snapshot-refresh', daemon=True)
+            _snapshot_refresh['thread'] = thread
+            thread.start()
+        return thread
+
+def current_snapshots():
+    with _snapshot_lock:
+        snapshots = dict(_snapshots)
+    if snapshots['panel'] is None:
+        start_snapshot_refresh().join()
+        with _snapshot_lock:
+            snapshots = dict(_snapshots)
+        if snapshots['panel'] is None:
+            raise Exception(f"Market snapshots unavailable: {_snapshot_refresh['error']}")
+    elif time.time() - snapshots['checked'] > SNAPSHOT_CHECK_SECONDS:
+        start_snapshot_refresh()
+    return snapshots
+
+def get_panel():
+    return current_snapshots()['panel']
+
+def get_fundamentals():
+    return current_snapshots()['fundamentals']
+
+def get_symbol_index():
+    return current_snapshots()['symbol_index']
+
+def loaded_symbol_index():
+    # The index as last loaded; never refreshes, so it cannot fail when the DB is down
+    return _snapshots['symbol_index']
+
+def check_symbol(symbol):
+    # (canonical symbol, None) for listed symbols, else (None, 404 response with
+    # the closest matches); runs before any TradingView or DB call. Everything
+    # passes while no index is loaded yet, so routes keep their own fallbacks.
+    index = loaded_symbol_index()
+    if index is None or len(index) == 0:
+        return symbol, None
+    try:
+        listed = index.resolve(symbol)
+        if listed is not None:
+            return listed, None
+        suggestions = [match['symbol'] for match in index.search(symbol, limit=5)]
+    except Exception as e:
+        print(f"Symbol check for {symbol} failed: {e}")
+        return symbol, None
+    return None, (jsonify({'error': f"Unknown symbol '{symbol}'", 'suggestions': suggestions}), 404)
+
+def cached_json_response(route, params, compute):
+    # Serialised once per host and data version, shared by all worker processes
+    snapshots = current_snapshots()
+    key = shared_cache.make_key(route, params, [snapshots['watermark'], snapshots['fundamentals_version']])
+    body, hit = shared_cache.get_or_compute(key, lambda: app.json.dumps(compute()).encode('utf-8'))
+    response = app.response_class(body, mimetype='application/json')
+    response.headers['X-Cache'] = 'hit' if hit else 'miss'
+    return response
+
+#-----------------------------------
+# Background warm-up and readiness
+#-----------------------------------
+
+_warm_up_lock = threading.Lock()
+_warm_up_state = {
+    'started': False,
+    'modules': False,
+    'schema': False,
+    'panel': False,
+    'error': None,
+    'started_at': None,
+    'ready_at': None
+}
+
+def warm_up():
+    started = time.time()
+    _warm_up_state['started_at'] = started
+    _warm_up_state['error'] = None
+    try:
+        for module in (pd, np, screener, panel_store, typed_fetch, predictor_picks, table_stats, leaderboard, day_fragments, symbol_index, alerts, correlation, dividends, watchlist):
+            module.load()
         try:
-            conn = init_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT closing_price FROM stock_analysis_all_results WHERE symbol = %s ORDER BY date DESC LIMIT 1",
-                (symbol,)
-            )
-            result = cursor.fetchone()
-            if result and result[0]:
-                return {"latestPrice": float(result[0]), "fallback": "database"}
-            
-            # If no database price is found
-            return {"latestPrice": None, "fallback": "no_data", "message": "No price data available", "error": str(e)}
-        except Exception as db_error:
-            print(f"Database fallback error for {symbol}: {str(db_error)}")
-            return {"latestPrice": None, "fallback": "error", "message": "Price data unavailable", "error": str(e)}
+            tvdatafeed.load()
+        except Exception as e:
+            print(f"tvDatafeed unavailable, TradingView routes will use fallbacks: {e}")
+        _warm_up_state['modules'] = True
 
-def get_tv_ohlcv(symbol):
+        _warm_up_state['schema'] = init_database()
+        if not _warm_up_state['schema']:
+            raise Exception("Database initialization failed")
+
+        current_snapshots()
+        _warm_up_state['panel'] = True
+        _warm_up_state['ready_at'] = time.time()
+        print(f"Warm-up completed in {time.time() - started:.2f}s")
+    except Exception as e:
+        _warm_up_state['error'] = str(e)
+        print(f"Warm-up failed: {e}")
+        traceback.print_exc()
+        # Let the next request retry
+        with _warm_up_lock:
+            _warm_up_state['started'] = False
+
+def start_warm_up():
+    with _warm_up_lock:
+        if _warm_up_state['started']:
+            return
+        _warm_up_state['started'] = True
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+def preload():
+    # Synchronous warm-up for pre-fork servers (see serve.py)
+    with _warm_up_lock:
+        _warm_up_state['started'] = True
+    warm_up()
+    return is_ready()
+
+def is_ready():
+    return _warm_up_state['schema'] and _warm_up_state['panel']
+
+@app.before_request
+def ensure_warm_up():
+    start_warm_up()
+
+#-----------------------------------
+# Admission control (see admission.py)
+#-----------------------------------
+
+admission_control = admission.AdmissionController()
+
+@app.before_request
+def admit_request():
+    cost = admission_control.classify(request.endpoint, request.args)
+    if cost is None or request.method == 'OPTIONS':
+        return None
+    try:
+        g.admission_wait = admission_control.admit(cost)
+    except admission.AdmissionRejected as e:
+        response = jsonify({'error': str(e), 'cost_class': e.cost_class, 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    g.admission_class = cost
+    g.admission_started = time.monotonic()
+    return None
+
+@app.teardown_request
+def release_admission(exc):
+    cost = g.pop('admission_class', None)
+    if cost is not None:
+        admission_control.release(cost, time.monotonic() - g.pop('admission_started'))
+
+@app.route('/ready')
+def ready():
+    status = dict(_warm_up_state)
+    status['ready'] = is_ready()
+    return jsonify(status), (200 if status['ready'] else 503)
+
+@app.route('/metrics')
+def metrics():
+    return jsonify({
+        'pid': os.getpid(),
+        'tradingview': tv_scheduler.stats(),
+        'shared_cache': shared_cache.stats(),
+        'price_stream': price_hub.stats(),
+        'admission': admission_control.stats(),
+        'alerts': _live_alerts['engine'].stats() if _live_alerts['engine'] is not None else None,
+    })
+
+#-----------------------------------
+# TradingView Data Functions - Implemented directly here
+#-----------------------------------
+
+# One TradingView session per prefetch worker thread, reopened after a failure
+_tv_sessions = threading.local()
+
+def fetch_tv_history(symbol, n_bars):
+    tv = getattr(_tv_sessions, 'client', None)
+    if tv is None:
+        tv = _tv_sessions.client = tvdatafeed.TvDatafeed()
     try:
-        tv = TvDatafeed()
-        index_data = tv.get_hist(
+        data = tv.get_hist(
             symbol=symbol,
             exchange='CSELK',
-            interval=Interval.in_daily,
-            n_bars=200
+            interval=tvdatafeed.Interval.in_daily,
+            n_bars=n_bars
         )
-        if index_data is not None and not index_data.empty:
-            # Prepare OHLCV data for charting
-            ohlcv = []
-            for idx, row in index_data.iterrows():
-                ohlcv.append({
-                    'date': idx.strftime('%Y-%m-%d'),
-                    'open': float(row['open']),
-                    'high': float(row['high']),
-                    'low': float(row['low']),
-                    'close': float(row['close']),
-                    'volume': float(row['volume'])
-                })
-            return {"ohlcv": ohlcv}
-        
-        # Fallback data generation
-        print(f"Generating fallback data for {symbol}")
-        # Generate some sample data
-        from datetime import datetime, timedelta
-        import random
-        
+    except Exception:
+        _tv_sessions.client = None
+        raise
+    if data is None:
+        _tv_sessions.client = None
+    return data
+
+def fetch_tv_price(symbol):
+    index_data = fetch_tv_history(symbol, 10)
+    if index_data is not None and 'close' in index_data and len(index_data) > 0:
+        return float(index_data['close'].iloc[-1])
+    return None
+
+def fetch_tv_bars(symbol):
+    index_data = fetch_tv_history(symbol, 200)
+    if index_data is not None and not index_data.empty:
+        # Prepare OHLCV data for charting
         ohlcv = []
-        base_price = 100.0
-        end_date = datetime.now()
-        
-        for i in range(200):
-            date = end_date - timedelta(days=i)
-            daily_volatility = random.uniform(-2, 2)
-            price = base_price + (base_price * daily_volatility / 100)
-            
+        for idx, row in index_data.iterrows():
             ohlcv.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'open': price - random.uniform(0, 1),
-                'high': price + random.uniform(0, 2),
-                'low': price - random.uniform(0, 2),
-                'close': price,
-                'volume': random.randint(10000, 1000000)
+                'date': idx.strftime('%Y-%m-%d'),
+                'open': float(row['open']),
+                'high': float(row['high']),
+                'low': float(row['low']),
+                'close': float(row['close']),
+                'volume': float(row['volume'])
             })
-            
-            # Update base price for next day
-            base_price = price
+        return ohlcv
+    return None
+
+def prefetch_universe():
+    return get_panel().symbols.tolist()
+
+# Background refresh of TradingView prices and bars; request handlers read its cache
+tv_scheduler = tv_prefetch.PrefetchScheduler(
+    fetchers={'price': fetch_tv_price, 'bars': fetch_tv_bars},
+    universe=prefetch_universe
+)
+
+@app.before_request
+def ensure_prefetch():
+    tv_scheduler.start()
+
+#-----------------------------------
+# Price alerts (see alerts.py)
+#-----------------------------------
+
+_live_alerts_lock = threading.Lock()
+_live_alerts = {'engine': None}
+
+def last_close(symbol):
+    history = get_panel().history(symbol, 'closing_price')
+    if history is None:
+        return None
+    traded = history[~np.isnan(history)]
+    return float(traded[-1]) if len(traded) else None
+
+def live_alerts():
+    with _live_alerts_lock:
+        if _live_alerts['engine'] is None:
+            _live_alerts['engine'] = alerts.LivePriceAlerts(last_close)
+        return _live_alerts['engine']
+
+def record_live_price(kind, symbol, value):
+    # Fresh TradingView prices are checked against price subscriptions in batches
+    if kind != 'price':
+        return
+    engine = live_alerts()
+    engine.start()
+    engine.record(kind, symbol, value)
+
+tv_scheduler.add_listener(record_live_price)
+
+def get_db_latest_price(symbol, error=None):
+    # Fallback to database closing price if TradingView API fails
+    try:
+        # Get the latest price from the database
+        conn = init_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT closing_price FROM stock_analysis_all_results WHERE symbol = %s ORDER BY date DESC LIMIT 1",
+            (symbol,)
+        )
+        result = cursor.fetchone()
+        conn.close()
+        if result and result[0]:
+            return {"latestPrice": float(result[0]), "fallback": "database"}
         
-        # Return in reverse order (oldest to newest)
-        ohlcv.reverse()
-        return {"ohlcv": ohlcv, "fallback": True}
+        # If no database price is found, return a more informative fallback
+        response = {"latestPrice": None, "fallback": "no_data", "message": "No price data available"}
+    except Exception as db_error:
+        print(f"Database fallback error for {symbol}: {str(db_error)}")
+        # Return a clear indication that this is not real data
+        response = {"latestPrice": None, "fallback": "error", "message": "Price data unavailable"}
+    if error is not None:
+        response["error"] = error
+    return response
+
+def get_tv_latest_price(symbol):
+    try:
+        # The database answers in parallel once the latency budget is spent
+        price, source = tv_scheduler.lookup_hedged('price', symbol, lambda: get_db_latest_price(symbol))
+        if source == 'fallback':
+            return price
+        if price is not None:
+            return {"latestPrice": price, "stale": True} if source == 'stale' else {"latestPrice": price}
+        return get_db_latest_price(symbol)
+    except Exception as e:
+        print(f"Error fetching latest price: {str(e)}")
+        return get_db_latest_price(symbol, error=str(e))
+
+# Bars the database can stand in for: it records closes and volumes only
+DB_OHLCV_BARS = 200
+
+def get_db_ohlcv(symbol, error=None):
+    # Fallback to the database's daily closes if TradingView cannot answer;
+    # open, high and low are not recorded there and repeat the close
+    try:
+        conn = init_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT date, closing_price::float8, volume::float8
+                    FROM stock_analysis_all_results
+                    WHERE symbol = %s AND closing_price > 0
+                    ORDER BY date DESC
+                    LIMIT %s;
+                """, (symbol, DB_OHLCV_BARS))
+                rows = cur.fetchall()
+        finally:
+            conn.close()
+        if rows:
+            ohlcv = [
+                {'date': d.strftime('%Y-%m-%d'), 'open': close, 'high': close, 'low': close,
+                 'close': close, 'volume': volume or 0.0}
+                for d, close, volume in reversed(rows)
+            ]
+            response = {"ohlcv": ohlcv, "fallback": "database",
+                        "message": "Daily closes from the database; open, high and low are not recorded"}
+        else:
+            response = {"ohlcv": [], "fallback": "no_data", "message": "No price history available"}
+    except Exception as db_error:
+        print(f"Database OHLCV fallback error for {symbol}: {str(db_error)}")
+        response = {"ohlcv": [], "fallback": "error", "message": "Price history unavailable"}
+    if error is not None:
+        response["error"] = error
+    return response
+
+def get_tv_ohlcv(symbol):
+    try:
+        # The database answers in parallel once the latency budget is spent;
+        # a stale TradingView entry is preferred over both
+        ohlcv, source = tv_scheduler.lookup_hedged('bars', symbol, lambda: get_db_ohlcv(symbol))
+        if source == 'fallback':
+            return ohlcv
+        if ohlcv:
+            return {"ohlcv": ohlcv, "stale": True} if source == 'stale' else {"ohlcv": ohlcv}
+        return get_db_ohlcv(symbol)
     except Exception as e:
         print(f"Error fetching OHLCV data: {str(e)}")
         traceback.print_exc()
-        
-        # Generate fallback data
-        # Same fallback generation as above
-        print(f"Generating fallback data for {symbol}")
-        from datetime import datetime, timedelta
-        import random
-        
-        ohlcv = []
-        base_price = 100.0
-        end_date = datetime.now()
-        
-        for i in range(200):
-            date = end_date - timedelta(days=i)
-            daily_volatility = random.uniform(-2, 2)
-            price = base_price + (base_price * daily_volatility / 100)
-            
-            ohlcv.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'open': price - random.uniform(0, 1),
-                'high': price + random.uniform(0, 2),
-                'low': price - random.uniform(0, 2),
-                'close': price,
-                'volume': random.randint(10000, 1000000)
-            })
-            
-            # Update base price for next day
-            base_price = price
-        
-        # Return in reverse order (oldest to newest)
-        ohlcv.reverse()
-        return {"ohlcv": ohlcv, "fallback": True, "error": str(e)}
+        return get_db_ohlcv(symbol, error=str(e))
 
 @app.route('/api/ohlcv/<symbol>', methods=['GET'])
 def ohlcv_route(symbol):
+    symbol, rejected = check_symbol(symbol)
+    if rejected:
+        return rejected
     result = get_tv_ohlcv(symbol)
     if isinstance(result, tuple) and len(result) > 1:
         return jsonify(result[0]), result[1]
@@ -295,11 +586,49 @@ def ohlcv_route(symbol):
 
 @app.route('/api/latest-price/<symbol>', methods=['GET'])
 def latest_price_route(symbol):
+    symbol, rejected = check_symbol(symbol)
+    if rejected:
+        return rejected
     result = get_tv_latest_price(symbol)
     if isinstance(result, tuple) and len(result) > 1:
         return jsonify(result[0]), result[1]
     return jsonify(result)
 
+def cached_tv_price(symbol):
+    # Never blocks: serve what the prefetcher has and ask it to refresh stale entries
+    price, age = tv_scheduler.read('price', symbol)
+    if price is None or age > tv_scheduler.max_age('price'):
+        tv_scheduler.touch_recent(symbol)
+        tv_scheduler.submit('price', symbol, tv_prefetch.PRIORITY_USER)
+    return price
+
+price_hub = price_stream.PriceHub(cached_tv_price)
+
+@app.route('/api/stream/prices', methods=['GET'])
+def stream_prices():
+    symbols = [s.strip() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    if not symbols:
+        return jsonify({'error': 'symbols query parameter is required'}), 400
+    if len(symbols) > price_stream.STREAM_MAX_SYMBOLS:
+        return jsonify({'error': f'At most {price_stream.STREAM_MAX_SYMBOLS} symbols per stream'}), 400
+    checked = [check_symbol(s)[0] for s in symbols]
+    unknown = [s for s, listed in zip(symbols, checked) if listed is None]
+    if unknown:
+        return jsonify({'error': 'Unknown symbols', 'symbols': unknown}), 404
+    symbols = checked
+    try:
+        subscriber = price_hub.subscribe(symbols)
+    except price_stream.StreamsFull as e:
+        response = jsonify({'error': str(e), 'retry_after': price_stream.STREAM_RETRY_AFTER})
+        response.headers['Retry-After'] = str(price_stream.STREAM_RETRY_AFTER)
+        return response, 503
+    response = Response(price_hub.stream(subscriber), mimetype='text/event-stream')
+    # A client that goes away before the first frame never runs the stream's cleanup
+    response.call_on_close(lambda: price_hub.unsubscribe(subscriber))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 #-----------------------------------
 # Flask Routes
 #-----------------------------------
@@ -313,243 +642,574 @@ def initialize_database():
     else:
         return jsonify({'status': 'error', 'message': 'Failed to initialize database'}), 500
 
+@app.route('/symbols/search')
+def search_symbols():
+    # Autocomplete: ranked prefix, substring and typo-tolerant matches
+    try:
+        query = request.args.get('q', '')
+        try:
+            limit = int(request.args.get('limit', symbol_index.DEFAULT_LIMIT))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        limit = max(1, min(limit, symbol_index.MAX_LIMIT))
+        fuzzy = request.args.get('fuzzy', 'true').lower() != 'false'
+        try:
+            index = get_symbol_index()
+        except Exception as e:
+            print(f"Symbol index refresh failed, searching the loaded index: {e}")
+            index = loaded_symbol_index()
+        results = index.search(query, limit=limit, fuzzy=fuzzy) if index is not None else []
+        return jsonify({'query': query, 'results': results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def subscription_record(row):
+    sub_id, phone, symbol, kind, threshold, active, created_at = row
+    return {
+        'id': sub_id, 'phone_number': phone, 'symbol': symbol, 'kind': kind,
+        'threshold': float(threshold), 'active': active,
+        'created_at': created_at.isoformat() if created_at else None,
+    }
+
+def require_sender_token(route):
+    # Subscription and outbox routes are for the notification service only
+    # (see alerts.ALERT_SENDER_TOKEN); it acts on behalf of registered numbers
+    @functools.wraps(route)
+    def guarded(*args, **kwargs):
+        if not alerts.ALERT_SENDER_TOKEN:
+            return jsonify({'error': 'Alert sender token is not configured'}), 503
+        if not alerts.sender_authorized(request.headers.get('Authorization')):
+            return jsonify({'error': 'A valid sender token is required'}), 401
+        return route(*args, **kwargs)
+    return guarded
+
+@app.route('/alerts/subscriptions', methods=['POST'])
+@require_sender_token
+def create_alert_subscription():
+    # {"phone_number": "771234567", "symbol": "AAF.N0000", "kind": "price_above", "threshold": 12.5}
+    try:
+        body = request.get_json(silent=True) or {}
+        phone = str(body.get('phone_number') or '').strip()
+        if not phone.isdigit():
+            return jsonify({'error': 'phone_number is required and must be digits only'}), 400
+        symbol, rejected = check_symbol(body.get('symbol') or '')
+        if rejected:
+            return rejected
+        try:
+            threshold = alerts.validate_subscription(body.get('kind'), body.get('threshold'))
+        except alerts.AlertError as e:
+            return jsonify({'error': str(e)}), 400
+        conn = init_connection()
+        try:
+            with conn.cursor() as cur:
+                if not alerts.phone_registered(cur, phone):
+                    return jsonify({'error': 'phone_number is not registered for notifications'}), 403
+                cur.execute("""
+                    INSERT INTO alert_subscriptions (phone_number, symbol, kind, threshold)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING id, phone_number, symbol, kind, threshold, active, created_at;
+                """, (phone, symbol, body['kind'], threshold))
+                row = cur.fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+        return jsonify(subscription_record(row)), 201
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/alerts/subscriptions', methods=['GET'])
+@require_sender_token
+def list_alert_subscriptions():
+    try:
+        phone = request.args.get('phone_number')
+        if not phone:
+            return jsonify({'error': 'phone_number query parameter is required'}), 400
+        conn = init_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, phone_number, symbol, kind, threshold, active, created_at
+                    FROM alert_subscriptions
+                    WHERE phone_number = %s AND active
+                    ORDER BY id;
+                """, (phone,))
+                rows = cur.fetchall()
+        finally:
+            conn.close()
+        return jsonify({'subscriptions': [subscription_record(row) for row in rows]})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/alerts/subscriptions/<int:subscription_id>', methods=['DELETE'])
+@require_sender_token
+def delete_alert_subscription(subscription_id):
+    try:
+        phone = request.args.get('phone_number')
+        if not phone:
+            return jsonify({'error': 'phone_number query parameter is required'}), 400
+        conn = init_connection()
+        try:
+            with conn.cursor() as cur:
+                # Deactivated rather than deleted so outbox rows keep their subscription
+                cur.execute("""
+                    UPDATE alert_subscriptions
+                    SET active = FALSE, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s AND phone_number = %s AND active;
+                """, (subscription_id, phone))
+                removed = cur.rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        if not removed:
+            return jsonify({'error': f'No active subscription {subscription_id}'}), 404
+        return jsonify({'status': 'success', 'id': subscription_id})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/alerts/outbox')
+@require_sender_token
+def alert_outbox():
+    # Triggered alerts for the notification sender, oldest first
+    try:
+        phone = request.args.get('phone_number')
+        undelivered = request.args.get('undelivered', 'true').lower() != 'false'
+        try:
+            limit = max(1, min(int(request.args.get('limit', 100)), 1000))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        where, params = [], []
+        if phone:
+            where.append("phone_number = %s")
+            params.append(phone)
+        if undelivered:
+            where.append("delivered_at IS NULL")
+        conn = init_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT id, subscription_id, phone_number, symbol, kind, threshold::float8,
+                           previous_value::float8, observed_value::float8, event_date, source,
+                           message, created_at, delivered_at
+                    FROM alert_outbox
+                    {'WHERE ' + ' AND '.join(where) if where else ''}
+                    ORDER BY id
+                    LIMIT %s;
+                """, params + [limit])
+                columns = [desc[0] for desc in cur.description]
+                rows = cur.fetchall()
+        finally:
+            conn.close()
+        alerts_out = []
+        for row in rows:
+            record = dict(zip(columns, row))
+            for key in ('event_date', 'created_at', 'delivered_at'):
+                if record[key] is not None:
+                    record[key] = record[key].isoformat()
+            alerts_out.append(record)
+        return jsonify({'alerts': alerts_out})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/alerts/outbox/ack', methods=['POST'])
+@require_sender_token
+def acknowledge_alerts():
+    # {"ids": [1, 2, 3]} marks those alerts as delivered
+    try:
+        ids = (request.get_json(silent=True) or {}).get('ids')
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            return jsonify({'error': 'ids must be a list of integers'}), 400
+        conn = init_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE alert_outbox SET delivered_at = CURRENT_TIMESTAMP
+                    WHERE id = ANY(%s) AND delivered_at IS NULL;
+                """, (ids,))
+                acknowledged = cur.rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return jsonify({'acknowledged': acknowledged})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Original app.py routes
 @app.route('/symbols')
 def get_symbols():
     try:
-        df = load_data()
-        symbols = sorted(df['symbol'].unique().tolist())
+        panel = get_panel()
+        symbols = sorted(panel.symbols.tolist())
         return jsonify({'symbols': symbols})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def price_chart(panel, symbol, date):
+    # Closes on the symbol's liquid days, from the shared panel
+    i = panel.symbol_ids.get(symbol) if panel is not None else None
+    if i is None:
+        return []
+    df = pd.DataFrame({'date': pd.to_datetime(panel.dates)})
+    for name in ('closing_price', 'turnover', 'volume'):
+        df[name] = panel.field(name)[i, :]
+    if date:
+        df = df[df['date'] >= pd.to_datetime(date)]
+    return typed_fetch.frame_records(predictor_picks.liquid_rows(df)[['date', 'closing_price']])
+
+def build_cse_predictor(date, symbol):
+    # Past days come from the materialised picks table; only days whose rows
+    # changed since it was refreshed (normally just today) are computed here,
+    # from just those days' liquid rows
+    conn = init_connection()
+    try:
+        grouped, through = predictor_picks.stored_picks(conn, date)
+        live_dates = None if grouped is None else predictor_picks.dirty_dates(conn, through)
+        live = predictor_picks.load_days(conn, live_dates) if grouped is None or live_dates else None
+    finally:
+        conn.close()
+    if live is not None and date:
+        live = live[live['date'] >= pd.to_datetime(date)]
+
+    if grouped is None:
+        grouped = predictor_picks.compute_picks(live, get_fundamentals())
+    elif live_dates:
+        for d in live_dates:
+            grouped.pop(d, None)
+        grouped.update(predictor_picks.compute_picks(live, get_fundamentals()))
+        grouped = dict(sorted(grouped.items()))
+
+    # Chart data (for the selected symbol)
+    chart_data = price_chart(get_panel(), symbol, date) if symbol else []
+
+    return {
+        'groupedPicks': grouped,
+        'chartData': chart_data
+    }
+
 @app.route('/cse-predictor')
 def cse_predictor():
     try:
         date = request.args.get('date')
         symbol = request.args.get('symbol')
-        df = load_data()
-        if date:
-            df = df[df['date'] >= pd.to_datetime(date)]
+        return cached_json_response(
+            '/cse-predictor', {'date': date, 'symbol': symbol},
+            lambda: build_cse_predictor(date, symbol)
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # Ensure numeric types
-        for col in ['turnover', 'volume', 'relative_strength']:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+@app.route('/leaderboard')
+def get_leaderboard():
+    # Top / bottom K symbols by a numeric column for one day or a trailing window
+    try:
+        field = request.args.get('field')
+        date = request.args.get('date')
+        side = request.args.get('side', 'both')
+        try:
+            k = int(request.args.get('k', leaderboard.DEFAULT_K))
+            window = int(request.args.get('window', 1))
+            min_turnover = request.args.get('min_turnover')
+            min_turnover = float(min_turnover) if min_turnover is not None else None
+        except ValueError:
+            return jsonify({'error': 'k and window must be integers, min_turnover a number'}), 400
+        leaderboard.validate_params(field, window, k, side)
+        panel = get_panel()
+        return cached_json_response(
+            '/leaderboard',
+            {'field': field, 'date': date, 'side': side, 'k': k, 'window': window, 'min_turnover': min_turnover},
+            lambda: leaderboard.build_leaderboard(panel, field, date, window, k, side, min_turnover)
+        )
+    except leaderboard.LeaderboardError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
 
-        # Filter for volume and turnover
-        df = df[(df['turnover'] > 999999) & (df['volume'] > 9999)]
+@app.route('/correlation')
+def get_correlation():
+    # Rolling return correlations, top pairs and betas for a symbol set or the whole market
+    try:
+        requested = [s.strip() for s in request.args.get('symbols', '').split(',') if s.strip()]
+        symbols = None
+        if requested:
+            checked = [check_symbol(s)[0] for s in requested]
+            unknown = [s for s, listed in zip(requested, checked) if listed is None]
+            if unknown:
+                return jsonify({'error': 'Unknown symbols', 'symbols': unknown}), 404
+            symbols = sorted(set(checked))
+        benchmark = request.args.get('benchmark')
+        if benchmark:
+            benchmark, rejected = check_symbol(benchmark)
+            if rejected:
+                return rejected
+        date = request.args.get('date')
+        matrix = request.args.get('matrix', 'false').lower() == 'true'
+        try:
+            window = int(request.args.get('window', correlation.DEFAULT_WINDOW))
+            pairs = int(request.args.get('pairs', correlation.DEFAULT_PAIRS))
+        except ValueError:
+            return jsonify({'error': 'window and pairs must be integers'}), 400
+        correlation.validate_params(window, pairs)
+        panel = get_panel()
+        return cached_json_response(
+            '/correlation',
+            {'symbols': symbols, 'benchmark': benchmark, 'date': date, 'window': window, 'pairs': pairs, 'matrix': matrix},
+            lambda: correlation.build_correlation(panel, symbols, date, window, pairs, benchmark, matrix)
+        )
+    except correlation.CorrelationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
 
-        # Get financial metrics
+@app.route('/watchlist-snapshot')
+def watchlist_snapshot():
+    # Latest row, current price, valuation ratios and a sparkline per symbol, in one request
+    try:
+        requested = [s.strip() for s in request.args.get('symbols', '').split(',') if s.strip()]
+        if not requested:
+            return jsonify({'error': 'symbols query parameter is required'}), 400
+        if len(requested) > watchlist.MAX_SYMBOLS:
+            return jsonify({'error': f'At most {watchlist.MAX_SYMBOLS} symbols per snapshot'}), 400
+        checked = [check_symbol(s)[0] for s in requested]
+        unknown = [s for s, listed in zip(requested, checked) if listed is None]
+        if unknown:
+            return jsonify({'error': 'Unknown symbols', 'symbols': unknown}), 404
+        # Keep the caller's order, once per symbol
+        symbols = list(dict.fromkeys(checked))
+        snapshots = current_snapshots()
         conn = init_connection()
-        with conn.cursor() as cur:
-            # Get financial data
-            cur.execute("SELECT code, eps_ttm, bvps, dps FROM financial_metrics;")
-            fin_data = cur.fetchall()
-        conn.close()
-        
-        # Create financial metrics dictionary
-        fin_metrics = {}
-        for row in fin_data:
-            code, eps_ttm, bvps, dps = row
-            fin_metrics[code] = {
-                'eps_ttm': eps_ttm,
-                'bvps': bvps,
-                'dps': dps
-            }
-        
-        # Group by date
-        grouped = {}
-        for d, group in df.groupby(df['date'].dt.strftime('%Y-%m-%d')):
-            # Tier 1
-            t1 = group[
-                (group['rsi_divergence'] == "Bullish Divergence") &
-                (group['volume_analysis'].isin(["Emerging Bullish Momentum", "Increase in weekly Volume Activity Detected"])) 
+        try:
+            snapshot = watchlist.build_snapshot(
+                conn, snapshots['panel'], snapshots['fundamentals'], symbols, cached_tv_price
+            )
+        finally:
+            conn.close()
+        return jsonify(snapshot)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
 
-            ]
-            # Tier 2
-            t2 = group[
-                (
-                    (group['volume_analysis'].isin(["Emerging Bullish Momentum", "High Bullish Momentum"])) &
-                    (group['relative_strength'] >= 1)
-                ) |
-                (group['rsi_divergence'] == "Bullish Divergence")
-            ]
-            
-            # Add financial metrics to each stock
-            t1_list = t1.to_dict(orient='records')
-            t2_list = t2.to_dict(orient='records')
-            
-            # Add financial metrics to each stock in t1 and t2
-            for stock_list in [t1_list, t2_list]:
-                for stock in stock_list:
-                    symbol_code = stock['symbol']
-                    if symbol_code in fin_metrics:
-                        stock.update(fin_metrics[symbol_code])
-            
-            grouped[d] = {
-                'tier1Picks': t1_list,
-                'tier2Picks': t2_list
-            }
+@app.route('/dividends/companies')
+def dividend_companies():
+    try:
+        conn = init_connection()
+        try:
+            companies = dividends.fetch_companies(conn)
+        finally:
+            conn.close()
+        return jsonify({'companies': companies})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # Chart data (for the selected symbol)
-        chart_data = []
-        if symbol:
-            chart_df = df[df['symbol'] == symbol].sort_values('date')
-            chart_data = chart_df[['date', 'closing_price']].to_dict(orient='records')
+@app.route('/dividends/summary')
+def dividend_summary():
+    # Precomputed per-company aggregates, optionally for a comma-separated list of codes
+    try:
+        codes = [c.strip() for c in request.args.get('company_codes', '').split(',') if c.strip()]
+        sort = request.args.get('sort')
+        if sort is not None and sort not in dividends.SORT_COLUMNS:
+            return jsonify({'error': f"sort must be one of {', '.join(sorted(dividends.SORT_COLUMNS))}"}), 400
+        try:
+            limit = request.args.get('limit')
+            limit = max(1, min(int(limit), dividends.MAX_LIMIT)) if limit is not None else None
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        conn = init_connection()
+        try:
+            dividends.refresh_if_outdated(conn)
+            summaries = dividends.fetch_summaries(conn, codes or None, sort, limit)
+        finally:
+            conn.close()
+        return jsonify({'companies': summaries})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/dividends/<company_code>')
+def dividend_company(company_code):
+    # One company's aggregates plus its dividend history, newest first
+    try:
+        conn = init_connection()
+        try:
+            dividends.refresh_if_outdated(conn)
+            summaries = dividends.fetch_summaries(conn, [company_code])
+            history = dividends.fetch_history(conn, company_code) if summaries else []
+        finally:
+            conn.close()
+        if not summaries:
+            return jsonify({'error': f"No dividends recorded for '{company_code}'"}), 404
+        return jsonify({'summary': summaries[0], 'history': history})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/screens', methods=['GET', 'POST'])
+def run_screens():
+    try:
+        # Screens come from the JSON body ({"screens": {name: spec}}) or by builtin name
+        body = request.get_json(silent=True) or {}
+        if not isinstance(body, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        specs = body.get('screens')
+        if not specs:
+            names = request.args.get('names', ','.join(screener.BUILTIN_SCREENS)).split(',')
+            unknown = [n for n in names if n not in screener.BUILTIN_SCREENS]
+            if unknown:
+                return jsonify({'error': f"Unknown screens: {', '.join(unknown)}"}), 400
+            specs = {n: screener.BUILTIN_SCREENS[n] for n in names}
+        try:
+            screens = screener.compile_screens(specs)
+        except screener.ScreenError as e:
+            return jsonify({'error': str(e)}), 400
+
+        date = body.get('date') or request.args.get('date')
+        where, params = screener.pushdown_where(screens)
+
+        if date:
+            date_clause = "date = %s::date"
+            date_params = [pd.to_datetime(date).strftime('%Y-%m-%d')]
+        else:
+            date_clause = "date = (SELECT MAX(date) FROM stock_analysis_all_results)"
+            date_params = []
+        conn = init_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT column_name FROM information_schema.columns
+                    WHERE table_name = 'stock_analysis_all_results';
+                """)
+                columns = [row[0] for row in cur.fetchall()]
+            try:
+                screener.require_columns(screens, columns)
+            except screener.ScreenError as e:
+                return jsonify({'error': str(e)}), 400
+            # Only rows that can match at least one screen leave the database
+            df = typed_fetch.fetch_frame(
+                conn,
+                f"SELECT * FROM stock_analysis_all_results WHERE {date_clause} AND {where} ORDER BY symbol;",
+                date_params + params
+            )
+        finally:
+            conn.close()
+
+        df = df.drop(columns=['ingest_seq'], errors='ignore')
+        masks = screener.evaluate_screens(df, screens)
+        if 'date' in df.columns:
+            df['date'] = df['date'].dt.strftime('%Y-%m-%d')
+
+        results = {}
+        for screen in screens:
+            matches = typed_fetch.frame_records(df[masks[screen.name]])
+            results[screen.name] = {'count': len(matches), 'matches': matches}
 
         return jsonify({
-            'groupedPicks': grouped,
-            'chartData': chart_data
+            'date': df['date'].iloc[0] if len(df) else date,
+            'screens': results
         })
     except Exception as e:
+        traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/fundamental-metrics')
-def fundamental_metrics():
+def build_fundamental_metrics(fundamentals):
+    # Work on a copy, the snapshot is shared between requests
+    metrics_df = fundamentals.copy()
+    print(f"Loaded {len(metrics_df)} rows from financial_metrics table")
+    print(f"Columns: {metrics_df.columns.tolist()}")
+    
+    conn = init_connection()
+    # Now, get latest closing prices
     try:
-        conn = init_connection()
-        # First, check if financial_metrics table exists
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT EXISTS (
-                   SELECT FROM information_schema.tables 
-                   WHERE table_name = 'financial_metrics'
-                );
-            """)
-            table_exists = cur.fetchone()[0]
-            
-            if not table_exists:
-                return jsonify({
-                    'metrics': [], 
-                    'error': 'Table financial_metrics does not exist in the database'
-                }), 404
-                
-            # If table exists, fetch the metrics
-            cur.execute("SELECT * FROM financial_metrics;")
-            colnames = [desc[0] for desc in cur.description]
-            rows = cur.fetchall()
-        
-        metrics_df = pd.DataFrame(rows, columns=colnames)
-        print(f"Loaded {len(metrics_df)} rows from financial_metrics table")
-        print(f"Columns: {metrics_df.columns.tolist()}")
-        
-        # Now, get latest closing prices
-        with conn.cursor() as cur:
-            # Query to get the latest closing_price for each symbol
-            query = """
-                SELECT symbol, closing_price
-                FROM stock_analysis_all_results
-                WHERE (symbol, date) IN (
-                    SELECT symbol, MAX(date)
-                    FROM stock_analysis_all_results
-                    GROUP BY symbol
-                );
-            """
-            cur.execute(query)
-            closing_price_data = cur.fetchall()
-        
+        # Query to get the latest closing_price for each symbol
+        query = """
+            SELECT DISTINCT ON (symbol) symbol, closing_price
+            FROM stock_analysis_all_results
+            ORDER BY symbol, date DESC;
+        """
+        closing_price_df = typed_fetch.fetch_frame(conn, query, categories=())
+    finally:
         conn.close()
+    print(f"Loaded {len(closing_price_df)} closing prices")
+    
+    # Map the database column names to the names expected by the frontend
+    # Based on the columns we found in the actual database
+    db_to_frontend_mapping = {
+        "code": "code",
+        "eps_ttm": "EPS(TTM)",
+        "bvps": "Book Value Per Share",
+        "dps": "Dividend Per Share",
+        "cum_np": "Cumulative Net Profit",
+        "roe": "Return on Equity",
+        "roa_ttm": "Return on Assets",
+        "pe_ttm": "PER",  # Assuming this is the PER column in the database
+        "pbv": "PBV",     # PBV column already exists
+        "dy": "DY(%)"     # Dividend Yield column
+    }
+    
+    # Rename columns based on which ones actually exist
+    rename_cols = {k: v for k, v in db_to_frontend_mapping.items() if k in metrics_df.columns}
+    metrics_df = metrics_df.rename(columns=rename_cols)
+    
+    # Check if code column exists under a different name
+    if 'code' not in metrics_df.columns:
+        if 'symbol' in metrics_df.columns:
+            metrics_df = metrics_df.rename(columns={'symbol': 'code'})
+    
+    # Merge financial metrics with closing prices
+    if 'code' in metrics_df.columns:
+        # Merge with closing prices
+        metrics_df = pd.merge(
+            metrics_df, closing_price_df,
+            left_on="code", right_on="symbol", how="left"
+        )
+        print(f"After merge: {len(metrics_df)} rows")
         
-        # Process closing price data
-        closing_price_df = pd.DataFrame(closing_price_data, columns=["symbol", "closing_price"])
-        closing_price_df["closing_price"] = pd.to_numeric(closing_price_df["closing_price"], errors='coerce')
-        print(f"Loaded {len(closing_price_df)} closing prices")
+        # Drop the redundant 'symbol' column after merging if it exists
+        if 'symbol' in metrics_df.columns:
+            metrics_df.drop(columns=["symbol"], inplace=True)
         
-        # Map the database column names to the names expected by the frontend
-        # Based on the columns we found in the actual database
-        db_to_frontend_mapping = {
-            "code": "code",
-            "eps_ttm": "EPS(TTM)",
-            "bvps": "Book Value Per Share",
-            "dps": "Dividend Per Share",
-            "cum_np": "Cumulative Net Profit",
-            "roe": "Return on Equity",
-            "roa_ttm": "Return on Assets",
-            "pe_ttm": "PER",  # Assuming this is the PER column in the database
-            "pbv": "PBV",     # PBV column already exists
-            "dy": "DY(%)"     # Dividend Yield column
-        }
+        # Add the latest close price column
+        metrics_df['Latest Close Price'] = metrics_df['closing_price']
         
-        # Rename columns based on which ones actually exist
-        rename_cols = {k: v for k, v in db_to_frontend_mapping.items() if k in metrics_df.columns}
-        metrics_df = metrics_df.rename(columns=rename_cols)
+        # Calculate ratios if they don't already exist
+        # Calculate PER if it doesn't exist
+        if 'PER' not in metrics_df.columns and 'eps_ttm' in metrics_df.columns:
+            metrics_df['PER'] = metrics_df['closing_price'] / metrics_df['EPS(TTM)']
+            metrics_df['PER'] = metrics_df['PER'].round(2)
         
-        # Check if code column exists under a different name
-        if 'code' not in metrics_df.columns:
-            if 'symbol' in metrics_df.columns:
-                metrics_df = metrics_df.rename(columns={'symbol': 'code'})
+        # Calculate PBV if it doesn't exist
+        if 'PBV' not in metrics_df.columns and 'Book Value Per Share' in metrics_df.columns:
+            metrics_df['PBV'] = metrics_df['closing_price'] / metrics_df['Book Value Per Share']
+            metrics_df['PBV'] = metrics_df['PBV'].round(2)
         
-        # Convert all numeric columns to float to handle NaN properly
-        numeric_cols = metrics_df.select_dtypes(include=['number']).columns
-        for col in numeric_cols:
-            metrics_df[col] = pd.to_numeric(metrics_df[col], errors='coerce')
-                
-        # Merge financial metrics with closing prices
-        if 'code' in metrics_df.columns:
-            # Merge with closing prices
-            metrics_df = pd.merge(
-                metrics_df, closing_price_df,
-                left_on="code", right_on="symbol", how="left"
-            )
-            print(f"After merge: {len(metrics_df)} rows")
-            
-            # Drop the redundant 'symbol' column after merging if it exists
-            if 'symbol' in metrics_df.columns:
-                metrics_df.drop(columns=["symbol"], inplace=True)
-            
-            # Add the latest close price column
-            metrics_df['Latest Close Price'] = metrics_df['closing_price']
+        # Calculate DY(%) if it doesn't exist
+        if 'DY(%)' not in metrics_df.columns and 'Dividend Per Share' in metrics_df.columns:
+            metrics_df['DY(%)'] = metrics_df['Dividend Per Share'] / metrics_df['closing_price'] * 100
+            metrics_df['DY(%)'] = metrics_df['DY(%)'].round(2)
             
-            # Calculate ratios if they don't already exist
-            # Calculate PER if it doesn't exist
-            if 'PER' not in metrics_df.columns and 'eps_ttm' in metrics_df.columns:
-                metrics_df['PER'] = pd.to_numeric(metrics_df['closing_price'], errors='coerce') / pd.to_numeric(metrics_df['EPS(TTM)'], errors='coerce')
-                metrics_df['PER'] = metrics_df['PER'].round(2)
-            
-            # Calculate PBV if it doesn't exist
-            if 'PBV' not in metrics_df.columns and 'Book Value Per Share' in metrics_df.columns:
-                metrics_df['PBV'] = pd.to_numeric(metrics_df['closing_price'], errors='coerce') / pd.to_numeric(metrics_df['Book Value Per Share'], errors='coerce')
-                metrics_df['PBV'] = metrics_df['PBV'].round(2)
-            
-            # Calculate DY(%) if it doesn't exist
-            if 'DY(%)' not in metrics_df.columns and 'Dividend Per Share' in metrics_df.columns:
-                metrics_df['DY(%)'] = pd.to_numeric(metrics_df['Dividend Per Share'], errors='coerce') / pd.to_numeric(metrics_df['closing_price'], errors='coerce') * 100
-                metrics_df['DY(%)'] = metrics_df['DY(%)'].round(2)
-                
-            # Drop the intermediary closing_price column if we now have Latest Close Price
-            if 'closing_price' in metrics_df.columns and 'Latest Close Price' in metrics_df.columns:
-                metrics_df.drop(columns=["closing_price"], inplace=True)
+        # Drop the intermediary closing_price column if we now have Latest Close Price
+        if 'closing_price' in metrics_df.columns and 'Latest Close Price' in metrics_df.columns:
+            metrics_df.drop(columns=["closing_price"], inplace=True)
+    
+    # NaN and infinity values become None for proper JSON serialization
+    metrics_data = typed_fetch.frame_records(metrics_df)
+    
+    print(f"Returning {len(metrics_data)} formatted records")
         
-        # Replace NaN, infinity values with None for proper JSON serialization
-        metrics_df.replace([float('inf'), float('-inf')], None, inplace=True)
-        
-        # Convert to records (list of dicts) for JSON serialization
-        # Use pandas.DataFrame.where() to replace NaN with None
-        metrics_df = metrics_df.apply(lambda col: col.map(lambda x: float(x) if isinstance(x, (np.floating, float)) else x))
+    return {'metrics': metrics_data}
 
-        metrics_data = metrics_df.where(pd.notna(metrics_df), None).to_dict(orient='records')
-        
-        print(f"Returning {len(metrics_data)} formatted records")
-        
-        # Test JSON serialization to catch errors before returning
-        try:
-            json.dumps({'metrics': metrics_data}, cls=CustomJSONEncoder)
-        except Exception as e:
-            print(f"JSON serialization error: {e}")
-            # If there's an error, manually clean the data
-            clean_metrics = []
-            for item in metrics_data:
-                clean_item = {}
-                for k, v in item.items():
-                    if isinstance(v, float) and (np.isnan(v) or np.isinf(v) or math.isnan(v)):
-                        clean_item[k] = None
-                    else:
-                        clean_item[k] = v
-                clean_metrics.append(clean_item)
-            metrics_data = clean_metrics
-            
-        return jsonify({'metrics': metrics_data})
+@app.route('/fundamental-metrics')
+def fundamental_metrics():
+    try:
+        fundamentals = get_fundamentals()
+        if fundamentals is None:
+            return jsonify({
+                'metrics': [], 
+                'error': 'Table financial_metrics does not exist in the database'
+            }), 404
+
+        return cached_json_response(
+            '/fundamental-metrics', {},
+            lambda: build_fundamental_metrics(fundamentals)
+        )
     except Exception as e:
         print(f"Error in fundamental_metrics: {str(e)}")
         traceback.print_exc()
@@ -594,25 +1254,18 @@ def debug_db():
                     sample_data.append({colnames[i]: row[i] for i in range(len(colnames))})
                 results['sample_data'] = sample_data
                 
-                # Count records
-                cur.execute("SELECT COUNT(*) FROM stock_analysis_all_results")
-                count = cur.fetchone()[0]
-                results['record_count'] = count
-                
-                # Check for null/zero values in important columns
-                cur.execute("""
-                    SELECT 
-                        SUM(CASE WHEN closing_price IS NULL OR closing_price = 0 THEN 1 ELSE 0 END) as null_closing,
-                        SUM(CASE WHEN turnover IS NULL OR turnover = 0 THEN 1 ELSE 0 END) as null_turnover,
-                        COUNT(*) as total
-                    FROM stock_analysis_all_results
-                """)
-                null_counts = cur.fetchone()
+                # Counts come from precomputed per-symbol stats (or catalog
+                # estimates), never from a scan of the table
+                overview = table_stats.table_overview(conn)
+                results['record_count'] = overview['record_count']
                 results['null_counts'] = {
-                    'closing_price': null_counts[0],
-                    'turnover': null_counts[1],
-                    'total_records': null_counts[2]
+                    'closing_price': overview['null_or_zero'].get('closing_price'),
+                    'turnover': overview['null_or_zero'].get('turnover'),
+                    'total_records': overview['record_count']
                 }
+                results['stats_source'] = overview['source']
+                if 'freshness' in overview:
+                    results['stats_freshness'] = overview['freshness']
         
         conn.close()
         return jsonify(results)
@@ -620,154 +1273,120 @@ def debug_db():
         traceback.print_exc()
         return jsonify({'error': str(e)})
 
+@app.route('/data-quality')
+def data_quality():
+    try:
+        panel = get_panel()
+        conn = init_connection()
+        try:
+            report = table_stats.data_quality_report(conn, panel.dates if panel is not None else None)
+        finally:
+            conn.close()
+        if report is None:
+            return jsonify({'error': 'Table statistics have not been computed yet; run table_stats.py'}), 404
+        return jsonify(report)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+def add_cors_headers(response):
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    return response
+
+def compact_json(obj):
+    # Same encoding as jsonify() outside debug mode
+    return app.json.dumps(obj, separators=(',', ':'))
+
+def technical_analysis_delta(conn, since, watermark, first_day, exact_date):
+    # Only rows of the requested window: a rebuild that restamps the whole
+    # table must not turn a delta into the full history
+    where, params = day_fragments.window_clause(first_day, exact_date)
+    # NUMERIC and DATE columns arrive typed (see typed_fetch)
+    with typed_fetch.typed_cursor(conn) as cur:
+        cur.execute(f"""
+            SELECT * 
+            FROM stock_analysis_all_results
+            WHERE ingest_seq > %s AND {where}
+            ORDER BY date DESC, symbol ASC;
+        """, (since,) + params)
+        df = typed_fetch.frame_from_rows(cur.description, cur.fetchall())
+    result = day_fragments.format_rows(df)
+    print(f"[DEBUG] Returning {len(result)} rows changed since {since}")
+    return jsonify({'data': result, 'watermark': watermark, 'delta': True})
+
+def parse_first_day(date_filter):
+    # (first day, usable); invalid dates fall back to the last 30 days
+    if not date_filter:
+        return None, True
+    try:
+        return pd.to_datetime(date_filter).strftime('%Y-%m-%d'), True
+    except Exception as date_error:
+        print(f"[ERROR] Error parsing date parameter: {str(date_error)}")
+        return None, False
+
+def technical_analysis_range(conn, first_day, exact_date, watermark):
+    # Settled days are served from pre-encoded fragments (see day_fragments)
+    gzip_ok = 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+    versions = day_fragments.day_versions(conn, first_day, exact_date, sequenced=watermark is not None)
+    fragments, cached = day_fragments.day_fragments(conn, versions, compact_json, compressed=gzip_ok)
+
+    head = b'{"data":['
+    tail = b'],' + compact_json({'delta': False, 'watermark': watermark})[1:].encode('utf-8') + b'\n'
+    if gzip_ok:
+        body = day_fragments.assemble_gzip(fragments, head, tail)
+    else:
+        body = day_fragments.assemble(fragments, head, tail)
+    print(f"[DEBUG] Served {len(versions)} days, {cached} from the fragment cache")
+
+    response = app.response_class(body, mimetype='application/json')
+    response.headers['X-Fragment-Cache'] = f"{cached}/{len(versions)}"
+    response.headers['Vary'] = 'Accept-Encoding'
+    if gzip_ok:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
 @app.route('/technical-analysis')
 def technical_analysis():
     try:
         # Log the request details for debugging
         print(f"[DEBUG] Received technical analysis request. Query params: {dict(request.args)}")
         
+        # Delta mode: only rows inserted or changed after the client's watermark
+        since = request.args.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return jsonify({'error': 'since must be an integer watermark', 'data': []}), 400
+
+        date_filter = request.args.get('date')
+        exact_date = request.args.get('exact_date', 'false').lower() == 'true'
+        print(f"[DEBUG] Received date filter: {date_filter}, exact_date: {exact_date}, since: {since}")
+
         conn = init_connection()
-        with conn.cursor() as cur:
-            # Query to get technical analysis data with date filter if provided
-            date_filter = request.args.get('date')
-            exact_date = request.args.get('exact_date', 'false').lower() == 'true'
-            
-            print(f"[DEBUG] Received date filter: {date_filter}, exact_date: {exact_date}")
-            
-            if date_filter:
-                try:
-                    # Parse the date to ensure it's in the correct format
-                    # This will also raise an error if the date is invalid
-                    parsed_date = pd.to_datetime(date_filter).strftime('%Y-%m-%d')
-                    print(f"[DEBUG] Parsed date filter: {parsed_date}")
-                    
-                    if exact_date:
-                        # Use DATE(date) = DATE(%s) for exact date match
-                        query = """
-                            SELECT * 
-                            FROM stock_analysis_all_results
-                            WHERE DATE(date) = DATE(%s)
-                            ORDER BY date DESC, symbol ASC;
-                        """
-                        print(f"[DEBUG] Using EXACT date filter query")
-                    else:
-                        # Use DATE(date) >= DATE(%s) for date range
-                        query = """
-                            SELECT * 
-                            FROM stock_analysis_all_results
-                            WHERE DATE(date) >= DATE(%s)
-                            ORDER BY date DESC, symbol ASC;
-                        """
-                        print(f"[DEBUG] Using date RANGE filter query")
-                    
-                    cur.execute(query, (parsed_date,))
-                    
-                    # Log number of rows fetched with the filter
-                    print(f"[DEBUG] Executed query with date filter: {parsed_date}")
-                except Exception as date_error:
-                    print(f"[ERROR] Error parsing date parameter: {str(date_error)}")
-                    # If date parsing fails, use default query
-                    query = """
-                        SELECT * 
-                        FROM stock_analysis_all_results
-                        WHERE date >= (CURRENT_DATE - INTERVAL '30 days')
-                        ORDER BY date DESC, symbol ASC;
-                    """
-                    cur.execute(query)
+        try:
+            # Read the watermark before the rows: a row committed in between is
+            # sent again on the next delta, never skipped
+            watermark = panel_store.ingest_watermark(conn)
+            first_day, usable = parse_first_day(date_filter)
+            exact_date = exact_date and usable
+            if since is not None and watermark is not None:
+                response = technical_analysis_delta(conn, since, watermark, first_day, exact_date)
             else:
-                # Default query to get the last 30 days of data
-                query = """
-                    SELECT * 
-                    FROM stock_analysis_all_results
-                    WHERE date >= (CURRENT_DATE - INTERVAL '30 days')
-                    ORDER BY date DESC, symbol ASC;
-                """
-                cur.execute(query)
-                
-            colnames = [desc[0] for desc in cur.description]
-            rows = cur.fetchall()
-            
-            # Log the number of rows fetched
-            print(f"[DEBUG] Fetched {len(rows)} rows from database")
-        
-        conn.close()
-        
-        # Convert to DataFrame for easier manipulation
-        df = pd.DataFrame(rows, columns=colnames)
-        print(f"[DEBUG] Loaded {len(df)} rows from stock_analysis_all_results table")
-        
-        # Check data types before conversion
-        if 'closing_price' in df.columns:
-            print(f"[DEBUG] closing_price dtype before conversion: {df['closing_price'].dtype}")
-            print(f"[DEBUG] closing_price first 3 values: {df['closing_price'].head(3).tolist()}")
-        
-        if 'turnover' in df.columns:
-            print(f"[DEBUG] turnover dtype before conversion: {df['turnover'].dtype}")
-            print(f"[DEBUG] turnover first 3 values: {df['turnover'].head(3).tolist()}")
-        
-        # Explicitly convert numeric columns to ensure proper types
-        numeric_cols = ['closing_price', 'change_pct', 'volume', 'turnover', 'rsi', 'relative_strength']
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        
-        # Check data types after conversion
-        if 'closing_price' in df.columns:
-            print(f"[DEBUG] closing_price dtype after conversion: {df['closing_price'].dtype}")
-            print(f"[DEBUG] closing_price first 3 values after conversion: {df['closing_price'].head(3).tolist()}")
-        
-        if 'turnover' in df.columns:
-            print(f"[DEBUG] turnover dtype after conversion: {df['turnover'].dtype}")
-            print(f"[DEBUG] turnover first 3 values after conversion: {df['turnover'].head(3).tolist()}")
-        
-        # Properly convert the date column to datetime first, then format it
-        if 'date' in df.columns:
-            try:
-                # Convert to datetime, handling any errors
-                df['date'] = pd.to_datetime(df['date'], errors='coerce')
-                
-                # Filter out rows with invalid dates
-                df = df.dropna(subset=['date'])
-                
-                # Now format dates as strings
-                df['date'] = df['date'].dt.strftime('%Y-%m-%d')
-            except Exception as date_error:
-                print(f"[ERROR] Error formatting dates: {str(date_error)}")
-                # If we can't process dates, convert them to strings directly
-                df['date'] = df['date'].astype(str)
-        
-        # Handle NaN values
-        # Replace any NaN values with None for proper JSON serialization
-        df = df.replace({np.nan: None, float('inf'): None, float('-inf'): None})
-        
-        # Convert DataFrame to list of dictionaries
-        result = df.to_dict(orient='records')
-        
-        # Log a sample of the resulting data
-        if result:
-            print(f"[DEBUG] Sample record - first row: {result[0]}")
-        
-        response = jsonify({
-            'data': result
-        })
-        
-        # Ensure CORS headers are set
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-        
-        return response
+                # Without the ingest sequence, answer deltas with the full window
+                response = technical_analysis_range(conn, first_day, exact_date, watermark)
+        finally:
+            conn.close()
+
+        return add_cors_headers(response)
     except Exception as e:
         print(f"[ERROR] Error in technical_analysis endpoint: {str(e)}")
         traceback.print_exc()  # Print full stack trace for better debugging
         
-        error_response = jsonify({'error': str(e), 'data': []})
-        
         # Ensure CORS headers are set even for error responses
-        error_response.headers.add('Access-Control-Allow-Origin', '*')
-        error_response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        error_response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-        
+        error_response = add_cors_headers(jsonify({'error': str(e), 'data': []}))
         return error_response, 500
 
 #-----------------------------------
@@ -775,9 +1394,9 @@ def technical_analysis():
 #-----------------------------------
 
 if __name__ == '__main__':
-    # Initialize the database on startup
+    # Schema checks and cache warm-up run in the background so the server binds immediately
     print("Starting unified application...")
-    print("Initializing database...")
-    init_database()
+    print("Warming up in the background...")
+    start_warm_up()
     print("Starting server...")
     app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
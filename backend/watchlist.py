@@ -0,0 +1,86 @@
+import numpy as np
+
+import typed_fetch
+from day_fragments import format_rows
+
+#-----------------------------------
+# One-request watchlist snapshot
+#-----------------------------------
+
+# Everything a watchlist row shows, for every symbol at once:
+#   - the latest stock_analysis_all_results row: one DISTINCT ON query for
+#     the whole list
+#   - the current price: the prefetcher's TradingView cache, else that row's close
+#   - PER, PBV and DY on the current price, from the financial_metrics snapshot
+#   - a sparkline of recent closes taken from the in-memory panel
+
+MAX_SYMBOLS = 100
+SPARKLINE_DAYS = 30
+
+# financial_metrics columns reported per symbol
+FUNDAMENTAL_FIELDS = ['eps_ttm', 'bvps', 'dps']
+
+def latest_rows(conn, symbols):
+    # {symbol: latest row as an API record}
+    df = typed_fetch.fetch_frame(conn, """
+        SELECT DISTINCT ON (symbol) *
+        FROM stock_analysis_all_results
+        WHERE symbol = ANY(%s)
+        ORDER BY symbol, date DESC;
+    """, (list(symbols),))
+    return {record['symbol']: record for record in format_rows(df)}
+
+def fundamentals_for(fundamentals, symbols):
+    if fundamentals is None or 'code' not in fundamentals.columns:
+        return {}
+    rows = fundamentals[fundamentals['code'].isin(symbols)]
+    fields = [f for f in FUNDAMENTAL_FIELDS if f in rows.columns]
+    return {record.pop('code'): record for record in typed_fetch.frame_records(rows[['code'] + fields])}
+
+def ratio(numerator, denominator, scale=1):
+    if numerator is None or not denominator:
+        return None
+    return round(numerator / denominator * scale, 2)
+
+def valuation(metrics, price):
+    # Same ratios as /fundamental-metrics, on the current price
+    return {
+        **{field: metrics.get(field) for field in FUNDAMENTAL_FIELDS},
+        'PER': ratio(price, metrics.get('eps_ttm')),
+        'PBV': ratio(price, metrics.get('bvps')),
+        'DY(%)': ratio(metrics.get('dps'), price, 100),
+    }
+
+def sparkline(panel, symbol, days=SPARKLINE_DAYS):
+    # Closes of the traded days among the last `days` panel days, oldest first
+    history = panel.history(symbol, 'closing_price') if panel is not None else None
+    if history is None:
+        return []
+    recent = np.asarray(history[-days:])
+    return [round(float(v), 4) for v in recent[~np.isnan(recent)]]
+
+def build_snapshot(conn, panel, fundamentals, symbols, live_price):
+    # live_price(symbol) -> cached TradingView price or None; never blocks
+    latest = latest_rows(conn, symbols)
+    metrics = fundamentals_for(fundamentals, symbols)
+    rows = []
+    for symbol in symbols:
+        row = latest.get(symbol)
+        price, source = live_price(symbol), 'live'
+        if not price:
+            # Zero-filled closes mean no trade, not a price of zero
+            price, source = (row or {}).get('closing_price') or None, 'close'
+        rows.append({
+            'symbol': symbol,
+            'price': price,
+            'price_source': source if price is not None else None,
+            'latest': row,
+            'fundamentals': valuation(metrics[symbol], price) if symbol in metrics else None,
+            'sparkline': sparkline(panel, symbol),
+        })
+    j = panel.day_index() if panel is not None else None
+    return {
+        'as_of': str(panel.dates[j]) if j is not None else None,
+        'sparkline_days': SPARKLINE_DAYS,
+        'snapshot': rows,
+    }
@@ -1,60 +1,55 @@
 import { NextResponse } from 'next/server';
-import { Client } from 'pg';
 
+export const dynamic = 'force-dynamic';
+
+// Served from the backend's precomputed dividend tables instead of querying
+// dividend_history here; the response shape is unchanged for the page
 export async function GET(request: Request) {
-  let client;
   try {
     const { searchParams } = new URL(request.url);
     const companyCode = searchParams.get('company_code');
     const getUniqueCompanies = searchParams.get('unique_companies') === 'true';
 
-    // Get database connection string from environment variable
-    const connectionString = process.env.NEON_DB_URL;
-    if (!connectionString) {
-      throw new Error('Database connection string is not configured');
-    }
-
-    // Create database client
-    client = new Client({ 
-      connectionString,
-      ssl: connectionString.includes('sslmode=require') ? { rejectUnauthorized: false } : undefined
-    });
-
-    // Connect to database
-    await client.connect();
-    console.log('Connected to database');
+    const backendUrl = process.env.API_URL || 'https://cse-maverick-be-platform.onrender.com';
 
-    let result;
     if (getUniqueCompanies) {
-      // Query to get unique company codes
-      const query = 'SELECT DISTINCT company_code FROM dividend_history ORDER BY company_code';
-      result = await client.query(query);
-      console.log(`Retrieved ${result.rows.length} unique company codes`);
-    } else {
-      // Query for dividend history data using correct columns
-      let query = 'SELECT company_code, announcement_date AS date, rate_of_dividend FROM dividend_history';
-      const params: string[] = [];
-      
-      if (companyCode) {
-        query += ' WHERE company_code = $1';
-        params.push(companyCode);
+      const response = await fetch(`${backendUrl}/dividends/companies`);
+      if (!response.ok) {
+        throw new Error(`Backend returned ${response.status} for dividend companies`);
       }
-      
-      query += ' ORDER BY announcement_date DESC';
-      result = await client.query(query, params);
-      console.log(`Retrieved ${result.rows.length} dividend history records`);
+      const { companies } = await response.json();
+      return NextResponse.json({
+        data: (companies as string[]).map(company_code => ({ company_code }))
+      });
     }
 
-    return NextResponse.json({ data: result.rows });
+    if (!companyCode) {
+      return NextResponse.json(
+        { error: 'company_code or unique_companies=true is required' },
+        { status: 400 }
+      );
+    }
+
+    const response = await fetch(`${backendUrl}/dividends/${encodeURIComponent(companyCode)}`);
+    if (response.status === 404) {
+      return NextResponse.json({ data: [] });
+    }
+    if (!response.ok) {
+      throw new Error(`Backend returned ${response.status} for ${companyCode} dividends`);
+    }
+    const { history } = await response.json();
+    return NextResponse.json({
+      data: (history as { date: string; rate_of_dividend: number }[]).map(row => ({
+        company_code: companyCode,
+        date: row.date,
+        rate_of_dividend: row.rate_of_dividend
+      }))
+    });
   } catch (error) {
     console.error('Error in dividend history API route:', error);
     return NextResponse.json(
       { error: error instanceof Error ? error.message : 'Failed to fetch dividend history data' },
       { status: 500 }
     );
-  } finally {
-    if (client) {
-      await client.end().catch(err => console.error('Error closing database connection:', err));
-    }
   }
-} 
\ No newline at end of file
+}